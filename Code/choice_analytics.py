@@ -0,0 +1,198 @@
+"""
+Choice Analytics Module - Choice-popularity heatmaps and drop-off funnels
+"""
+
+import argparse
+import json
+import os
+from array import array
+from operator import itemgetter
+
+import numpy as np
+
+from Code.story_manager import StoryManager
+
+OTHER_CHOICE = "(other)"
+# Story of sessions recorded without one
+UNKNOWN_STORY = "(unknown)"
+CHOICE_PAIR = itemgetter("scene", "choice")
+
+
+class ChoiceAnalytics:
+    def __init__(self, story_manager=None, chunk_size=1_000_000):
+        self.story_manager = story_manager or StoryManager()
+        self.chunk_size = chunk_size
+
+        # Integer ids for every known (story, scene) and for each choice of a
+        # scene; the last column collects choice texts no longer in the story.
+        # Stories may reuse scene ids, so scenes are keyed by their story too
+        self.scene_ids = {}
+        self.scene_names = []
+        self.choice_labels = {}
+        for story_type in self.story_manager.get_available_stories():
+            for scene_id, scene in self.story_manager.get_story_scenes(story_type).items():
+                self._scene_index((story_type, scene_id))
+                self.choice_labels[story_type, scene_id] = [c["text"] for c in scene.get("choices", [])]
+        self.width = max((len(labels) for labels in self.choice_labels.values()), default=0) + 1
+
+        self.sessions = 0
+        self.completed = 0
+        self.choice_counts = np.zeros(0, dtype=np.int64)
+        self.reached_counts = np.zeros(0, dtype=np.int64)
+        self.quit_counts = np.zeros(0, dtype=np.int64)
+        # Story -> (scene, choice text) pairs of the current chunk, encoded in bulk
+        self._pair_buffers = {}
+        self._buffered_pairs = 0
+        self._reached_buffer = array('q')
+        self._quit_buffer = array('q')
+
+    def _scene_index(self, key):
+        """Return the integer id of a (story, scene) key, assigning one if it is new"""
+        index = self.scene_ids.get(key)
+        if index is None:
+            index = self.scene_ids[key] = len(self.scene_names)
+            self.scene_names.append(key)
+        return index
+
+    def _choice_code(self, key, choice_text):
+        """Return the flat matrix cell (scene row, choice column) of a choice"""
+        labels = self.choice_labels.get(key, [])
+        column = labels.index(choice_text) if choice_text in labels else self.width - 1
+        return self._scene_index(key) * self.width + column
+
+    def _encode_choices(self):
+        """Return the matrix cells of the buffered choices, looking up each distinct pair once"""
+        encoded = []
+        for story_type, pairs in self._pair_buffers.items():
+            codes = dict.fromkeys(pairs)
+            for scene_id, choice_text in codes:
+                # Entries without a scene are dropped
+                codes[scene_id, choice_text] = self._choice_code((story_type, scene_id), choice_text) if scene_id else -1
+            encoded.append(np.fromiter(map(codes.__getitem__, pairs), dtype=np.int64, count=len(pairs)))
+        self._pair_buffers.clear()
+        self._buffered_pairs = 0
+        cells = np.concatenate(encoded) if encoded else np.zeros(0, dtype=np.int64)
+        return cells[cells >= 0]
+
+    def add_session(self, session):
+        """Encode one recorded session (a save or a finished game history)"""
+        self.sessions += 1
+        story_type = session.get("story_type") or UNKNOWN_STORY
+
+        choices = session.get("choices_made", [])
+        pairs = self._pair_buffers.setdefault(story_type, [])
+        start = len(pairs)
+        try:
+            pairs.extend(map(CHOICE_PAIR, choices))
+        except (KeyError, TypeError):
+            # Older or damaged histories: skip what is not a choice entry
+            del pairs[start:]
+            pairs.extend((e.get("scene"), e.get("choice")) for e in choices if isinstance(e, dict))
+        self._buffered_pairs += len(pairs) - start
+
+        scene_index = self._scene_index
+        self._reached_buffer.extend(scene_index((story_type, s)) for s in set(session.get("visited_scenes", [])))
+
+        if session.get("completed"):
+            self.completed += 1
+        elif session.get("current_scene"):
+            self._quit_buffer.append(scene_index((story_type, session["current_scene"])))
+
+        if self._buffered_pairs >= self.chunk_size:
+            self._flush()
+
+    def _bincount_into(self, totals, ids, size):
+        """Add a bincount of an id array into a running totals array"""
+        counts = np.bincount(ids, minlength=size) if len(ids) else np.zeros(size, dtype=np.int64)
+        if len(totals) < size:
+            totals = np.concatenate([totals, np.zeros(size - len(totals), dtype=np.int64)])
+        totals += counts
+        return totals
+
+    def _flush(self):
+        """Fold the buffered ids of the current chunk into the count arrays"""
+        # Encoding may meet new scenes, so it goes before the matrix size is taken
+        choice_codes = self._encode_choices()
+        scenes = len(self.scene_names)
+        self.choice_counts = self._bincount_into(self.choice_counts, choice_codes, scenes * self.width)
+        self.reached_counts = self._bincount_into(self.reached_counts, np.array(self._reached_buffer), scenes)
+        self.quit_counts = self._bincount_into(self.quit_counts, np.array(self._quit_buffer), scenes)
+        del self._reached_buffer[:], self._quit_buffer[:]
+
+    def add_file(self, path):
+        """Add every session from a history log (.jsonl) or a save file (.json)"""
+        with open(path, 'r') as f:
+            if path.endswith(".jsonl"):
+                for line in f:
+                    try:
+                        self.add_session(json.loads(line))
+                    except ValueError:
+                        continue
+            else:
+                self.add_session(json.load(f))
+
+    def add_path(self, path):
+        """Add a history log, a save file or every save in a directory"""
+        if os.path.isdir(path):
+            for entry in os.scandir(path):
+                if entry.name.endswith(".json"):
+                    try:
+                        self.add_file(entry.path)
+                    except Exception:
+                        continue
+        elif os.path.exists(path):
+            self.add_file(path)
+
+    def matrices(self):
+        """Return (choice matrix, reached counts, quit counts) indexed by scene id (see scene_names)"""
+        self._flush()
+        return self.choice_counts.reshape(len(self.scene_names), self.width), self.reached_counts, self.quit_counts
+
+    def report(self):
+        """Return per-scene choice frequencies and drop-off rates, grouped by story"""
+        choice_matrix, reached, quits = self.matrices()
+        drop_off = quits / np.maximum(reached, 1)
+
+        stories = {}
+        for index in np.flatnonzero(reached + quits + choice_matrix.sum(axis=1)):
+            story_type, scene_id = key = self.scene_names[index]
+            labels = self.choice_labels.get(key, [])
+            labels = labels + [OTHER_CHOICE] * (self.width - len(labels))
+            row = choice_matrix[index]
+            stories.setdefault(story_type, {})[scene_id] = {
+                "reached": int(reached[index]),
+                "quit": int(quits[index]),
+                "drop_off": float(drop_off[index]),
+                "session_share_quit": float(quits[index] / self.sessions) if self.sessions else 0.0,
+                "choices": {labels[c]: int(row[c]) for c in np.flatnonzero(row)},
+            }
+
+        return {"sessions": self.sessions, "completed": self.completed, "stories": stories}
+
+
+def main():
+    """Command line entry point for the choice analytics job"""
+    parser = argparse.ArgumentParser(description="Build choice heatmaps and drop-off funnels from recorded histories")
+    parser.add_argument("paths", nargs="*", default=["stats/histories.jsonl"],
+                        help="history logs, save files or save directories")
+    parser.add_argument("--output", default="stats/choice_report.json")
+    parser.add_argument("--matrix", help="also write the raw matrices to this .npz file")
+    args = parser.parse_args()
+
+    analytics = ChoiceAnalytics()
+    for path in args.paths:
+        analytics.add_path(path)
+
+    with open(args.output, 'w') as f:
+        json.dump(analytics.report(), f, indent=2)
+
+    if args.matrix:
+        choice_matrix, reached, quits = analytics.matrices()
+        np.savez_compressed(args.matrix, choices=choice_matrix, reached=reached, quits=quits,
+                            scenes=np.array(analytics.scene_names, dtype=str).reshape(-1, 2))
+
+    print(f"Analyzed {analytics.sessions} sessions, report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
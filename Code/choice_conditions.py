@@ -0,0 +1,210 @@
+"""
+Choice Conditions Module - Compiles choice requirements into bitmask predicates
+
+A choice can be gated by "requires_item" or by a "requires" condition:
+
+    {"item": "golden key"}                  the item is in the inventory
+    {"visited": "castle_library"}           the scene has been visited
+    {"deaths": {"min": 1, "max": 3}}        the death count is in range
+    {"all": [...]}, {"any": [...]}, {"not": {...}}
+
+Conditions are compiled once per story into clauses of integer masks, so
+checking the choices of a scene only takes a few integer operations. A
+StateMask keeps the mask of a game's items and visited scenes up to date
+as they are added, instead of rebuilding it every turn.
+"""
+
+import sys
+
+NO_LIMIT = sys.maxsize
+
+
+class ConditionError(ValueError):
+    """Raised when a choice condition is not valid"""
+
+
+class CompiledConditions:
+    def __init__(self, scenes):
+        self.bits = {}
+        self.scene_rules = {}
+        self.descriptions = {}
+        self._compiled = set()
+
+        # Lazily read scenes (story packs) are compiled as they are reached
+        if not getattr(scenes, "lazy", False):
+            for scene_id, scene in scenes.items():
+                self._compile_scene(scene_id, scene)
+
+    def _compile_scene(self, scene_id, scene):
+        """Compile the conditions of every choice of one scene"""
+        self._compiled.add(scene_id)
+        rules = []
+        for index, choice in enumerate(scene.get("choices", [])):
+            condition = self.choice_condition(choice)
+            if condition is None:
+                continue
+            rules.append((1 << index, self._compile(condition, False)))
+            self.descriptions[(scene_id, index)] = self.describe(condition)
+        if rules:
+            self.scene_rules[scene_id] = rules
+
+    def choice_condition(self, choice):
+        """Return the condition of a choice, treating requires_item as an item condition"""
+        conditions = []
+        if "requires_item" in choice:
+            conditions.append({"item": choice["requires_item"]})
+        if "requires" in choice:
+            conditions.append(choice["requires"])
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {"all": conditions}
+
+    def _bit(self, kind, name):
+        """Return the state bit of an item or visited scene"""
+        key = (kind, name)
+        if key not in self.bits:
+            self.bits[key] = 1 << len(self.bits)
+        return self.bits[key]
+
+    def _compile(self, condition, negate):
+        """Compile a condition into a list of (required, forbidden, min deaths, max deaths) clauses"""
+        if not isinstance(condition, dict) or len(condition) != 1:
+            raise ConditionError(f"Invalid condition: {condition!r}")
+        kind, value = next(iter(condition.items()))
+
+        if kind in ("item", "visited"):
+            if not isinstance(value, str):
+                raise ConditionError(f"Invalid {kind} condition: {condition!r}")
+            bit = self._bit(kind, value)
+            return [(0, bit, 0, NO_LIMIT)] if negate else [(bit, 0, 0, NO_LIMIT)]
+
+        if kind == "deaths":
+            if not isinstance(value, dict) or set(value) - {"min", "max"}:
+                raise ConditionError(f"Invalid deaths condition: {condition!r}")
+            low, high = value.get("min", 0), value.get("max", NO_LIMIT)
+            if not all(isinstance(limit, int) and not isinstance(limit, bool) for limit in (low, high)):
+                raise ConditionError(f"Invalid deaths condition: {condition!r}")
+            if not negate:
+                return [(0, 0, low, high)]
+            clauses = []
+            if low > 0:
+                clauses.append((0, 0, 0, low - 1))
+            if high < NO_LIMIT:
+                clauses.append((0, 0, high + 1, NO_LIMIT))
+            return clauses
+
+        if kind == "not":
+            return self._compile(value, not negate)
+
+        if kind in ("all", "any"):
+            if not isinstance(value, list):
+                raise ConditionError(f"Invalid {kind} condition: {condition!r}")
+            parts = [self._compile(part, negate) for part in value]
+            # De Morgan: a negated "all" is an "any" of negations and vice versa
+            if (kind == "any") != negate:
+                return [clause for part in parts for clause in part]
+            clauses = [(0, 0, 0, NO_LIMIT)]
+            for part in parts:
+                clauses = [
+                    (r1 | r2, f1 | f2, max(l1, l2), min(h1, h2))
+                    for r1, f1, l1, h1 in clauses
+                    for r2, f2, l2, h2 in part
+                ]
+                # Drop clauses that can never hold
+                clauses = [c for c in clauses if not c[0] & c[1] and c[2] <= c[3]]
+            return clauses
+
+        raise ConditionError(f"Unknown condition type: {kind!r}")
+
+    def describe(self, condition):
+        """Return a short readable description of a condition"""
+        kind, value = next(iter(condition.items()))
+        if kind == "item":
+            return value
+        if kind == "visited":
+            return f"visited {value}"
+        if kind == "deaths":
+            parts = []
+            if "min" in value:
+                parts.append(f"deaths >= {value['min']}")
+            if "max" in value:
+                parts.append(f"deaths <= {value['max']}")
+            return " and ".join(parts)
+        if kind == "not":
+            return f"not {self.describe(value)}"
+        joiner = " and " if kind == "all" else " or "
+        text = joiner.join(self.describe(part) for part in value)
+        return f"({text})" if len(value) > 1 else text
+
+    def state_mask(self, game_state):
+        """Return the bitmask of the items held and scenes visited"""
+        bits = self.bits
+        mask = 0
+        for item in game_state["inventory"]:
+            mask |= bits.get(("item", item), 0)
+        for scene_id in game_state["visited_scenes"]:
+            mask |= bits.get(("visited", scene_id), 0)
+        return mask
+
+    def available_choices(self, scene_id, scene, game_state, state_mask=None):
+        """Return a bitmask with bit i set when choice i of the scene can be taken"""
+        available = (1 << len(scene.get("choices", []))) - 1
+        if scene_id not in self._compiled:
+            self._compile_scene(scene_id, scene)
+        rules = self.scene_rules.get(scene_id)
+        if not rules:
+            return available
+
+        state = state_mask.value(self) if state_mask else self.state_mask(game_state)
+        deaths = game_state["deaths"]
+        for choice_bit, clauses in rules:
+            for required, forbidden, low, high in clauses:
+                if state & required == required and not state & forbidden and low <= deaths <= high:
+                    break
+            else:
+                available &= ~choice_bit
+        return available
+
+    def requirement(self, scene_id, index):
+        """Return the description of what a choice requires, or None"""
+        return self.descriptions.get((scene_id, index))
+
+
+class StateMask:
+    """The state bitmask of one game, extended with the items and scenes added since the last turn"""
+
+    def __init__(self, game_state):
+        self.game_state = game_state
+        self.reset()
+
+    def reset(self):
+        """Rebuild the mask on next use, e.g. after a rewind dropped items or scenes"""
+        self.conditions = None
+        self.lists = (None, None)
+        self.lengths = (0, 0)
+        self.bit_count = 0
+        self.mask = 0
+
+    def value(self, conditions):
+        """Return the mask of the items held and scenes visited under a story's conditions"""
+        inventory, visited = self.game_state["inventory"], self.game_state["visited_scenes"]
+        held, seen = self.lengths
+        # Another story version, newly compiled bits or replaced or shortened
+        # lists can change bits already counted, so those start over
+        if (conditions is not self.conditions or len(conditions.bits) != self.bit_count
+                or self.lists[0] is not inventory or self.lists[1] is not visited
+                or len(inventory) < held or len(visited) < seen):
+            self.conditions = conditions
+            self.lists = (inventory, visited)
+            self.bit_count = len(conditions.bits)
+            self.mask = held = seen = 0
+
+        bits = conditions.bits
+        mask = self.mask
+        for item in inventory[held:]:
+            mask |= bits.get(("item", item), 0)
+        for scene_id in visited[seen:]:
+            mask |= bits.get(("visited", scene_id), 0)
+        self.mask = mask
+        self.lengths = (len(inventory), len(visited))
+        return mask
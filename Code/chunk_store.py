@@ -0,0 +1,175 @@
+"""
+Chunk Store Module - Content-addressed storage of save histories
+
+A save's visited_scenes and choices_made lists are cut into chunks of
+CHUNK_ENTRIES entries, each stored once under the sha1 of its content.
+Saves of the same story share their history prefixes, so those chunks are
+written once and referenced by every save. The save file itself keeps the
+scalar fields, the chunk hashes and the per-save choice timestamps.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+
+from Code.file_lock import FileLock
+
+CHUNK_ENTRIES = 32
+HISTORY_FIELDS = ("visited_scenes", "choices_made")
+# Chunks younger than this are never collected, so a save being written by
+# another process keeps the chunks it has just stored or reused
+GC_GRACE_SECONDS = 300
+
+
+class ChunkStore:
+    def __init__(self, saves_dir="saves"):
+        self.saves_dir = saves_dir
+        self.chunks_dir = os.path.join(saves_dir, ".chunks")
+
+    def lock(self):
+        """Return the lock held while working out and deleting unreferenced chunks"""
+        return FileLock(os.path.join(self.chunks_dir, ".gc.lock"))
+
+    def path_for(self, digest):
+        """Return the file path of a chunk"""
+        return os.path.join(self.chunks_dir, digest[:2], f"{digest}.chunk")
+
+    def put(self, entries):
+        """Store a list of entries, returning its hash"""
+        data = json.dumps(entries, separators=(",", ":")).encode("utf-8")
+        digest = hashlib.sha1(data).hexdigest()
+        path = self.path_for(digest)
+
+        if os.path.exists(path):
+            # Refresh the mtime so a concurrent collection keeps the chunk
+            try:
+                os.utime(path)
+                return digest
+            except FileNotFoundError:
+                pass
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_file = f"{path}.{os.getpid()}.tmp"
+        with open(temp_file, 'wb') as f:
+            f.write(data)
+        os.replace(temp_file, path)
+        return digest
+
+    def get(self, digest):
+        """Return the entries stored under a hash"""
+        with open(self.path_for(digest), 'rb') as f:
+            return json.loads(f.read())
+
+    def split_history(self, save_data):
+        """Return a save with its history lists replaced by chunk references"""
+        manifest = {key: value for key, value in save_data.items() if key not in HISTORY_FIELDS}
+        choices = save_data.get("choices_made", [])
+        histories = {
+            "visited_scenes": list(save_data.get("visited_scenes", [])),
+            # Timestamps differ in every save, so only the path is shared
+            "choices_made": [[choice.get("scene"), choice.get("choice")] for choice in choices],
+        }
+        manifest["history"] = {
+            field: {
+                "length": len(entries),
+                "chunks": [self.put(entries[i:i + CHUNK_ENTRIES]) for i in range(0, len(entries), CHUNK_ENTRIES)]
+            }
+            for field, entries in histories.items()
+        }
+        manifest["choice_times"] = [choice.get("timestamp") for choice in choices]
+        return manifest
+
+    def join_history(self, manifest):
+        """Return the full save described by a manifest"""
+        if "history" not in manifest:
+            # Saves written before the chunk store hold their history inline
+            return manifest
+
+        save_data = {key: value for key, value in manifest.items() if key not in ("history", "choice_times")}
+        histories = {}
+        for field, ref in manifest["history"].items():
+            entries = []
+            for digest in ref["chunks"]:
+                entries.extend(self.get(digest))
+            histories[field] = entries[:ref["length"]]
+
+        save_data["visited_scenes"] = histories.get("visited_scenes", [])
+        times = manifest.get("choice_times", [])
+        save_data["choices_made"] = []
+        for i, (scene, choice) in enumerate(histories.get("choices_made", [])):
+            entry = {"scene": scene, "choice": choice}
+            if i < len(times) and times[i] is not None:
+                entry["timestamp"] = times[i]
+            save_data["choices_made"].append(entry)
+        return save_data
+
+    def iter_chunks(self):
+        """Yield (hash, path, size, mtime) for every stored chunk"""
+        if not os.path.exists(self.chunks_dir):
+            return
+        for shard in os.scandir(self.chunks_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".chunk"):
+                    stat = entry.stat()
+                    yield entry.name[:-6], entry.path, stat.st_size, stat.st_mtime
+
+    def collect_garbage(self, live, grace_seconds=GC_GRACE_SECONDS):
+        """Delete chunks not in the live set, returning (chunks removed, bytes freed)"""
+        cutoff = time.time() - grace_seconds
+        removed = freed = 0
+        for digest, path, size, mtime in list(self.iter_chunks()):
+            if digest in live or mtime > cutoff:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            freed += size
+        return removed, freed
+
+    def usage(self):
+        """Return the number of chunks and the bytes they use"""
+        chunks = size = 0
+        for _, _, chunk_size, _ in self.iter_chunks():
+            chunks += 1
+            size += chunk_size
+        return {"chunks": chunks, "bytes": size}
+
+
+def manifest_chunks(manifest):
+    """Return every chunk hash a save manifest refers to"""
+    return [digest for ref in manifest.get("history", {}).values() for digest in ref["chunks"]]
+
+
+def main():
+    """Command line entry point to collect garbage, report usage or convert old saves"""
+    parser = argparse.ArgumentParser(description="Manage the save chunk store")
+    parser.add_argument("command", choices=["gc", "usage", "migrate"])
+    parser.add_argument("--grace", type=float, default=GC_GRACE_SECONDS,
+                        help="seconds a new chunk is kept even if unreferenced")
+    args = parser.parse_args()
+
+    from Code.save_manager import SaveManager
+    save_manager = SaveManager()
+
+    if args.command == "migrate":
+        converted = save_manager.migrate_saves()
+        print(f"Converted {converted} saves to the chunk store")
+    elif args.command == "gc":
+        removed, freed = save_manager.collect_garbage(args.grace)
+        print(f"Removed {removed} unreferenced chunks ({freed} bytes)")
+    else:
+        usage = save_manager.chunks.usage()
+        manifests = [f for f in os.listdir("saves") if f.endswith(".json")] if os.path.exists("saves") else []
+        manifest_bytes = sum(os.path.getsize(os.path.join("saves", f)) for f in manifests)
+        print(f"{len(manifests)} saves: {manifest_bytes} bytes of save files, "
+              f"{usage['chunks']} shared chunks using {usage['bytes']} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+"""
+Lets the tests import the Code package when pytest is run from inside Code/
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
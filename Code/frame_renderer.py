@@ -0,0 +1,162 @@
+"""
+Frame Renderer Module - Buffered differential screen updates
+"""
+
+import argparse
+import io
+import shutil
+import sys
+from contextlib import contextmanager
+from rich.console import Console
+
+CLEAR_SCREEN = "\x1b[H\x1b[2J"
+CLEAR_LINE_END = "\x1b[K"
+CLEAR_BELOW = "\x1b[J"
+
+
+class CountingStream:
+    """Wraps a stream and counts the writes and bytes sent through it"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.writes = 0
+        self.bytes = 0
+
+    def write(self, text):
+        self.writes += 1
+        self.bytes += len(text.encode("utf-8"))
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def isatty(self):
+        return self.stream.isatty()
+
+
+class FrameRenderer:
+    def __init__(self, stream=None, width=None, height=None, color_system="auto", reserve_lines=10):
+        self.stream = CountingStream(stream or sys.stdout)
+        size = shutil.get_terminal_size()
+        self.width = width or size.columns
+        self.height = height or size.lines
+        # Sizes not given follow the terminal when it is resized
+        self.follow_size = (width is None, height is None)
+        self.color_system = color_system
+        # Room left below a frame for prompts and messages; taller frames
+        # could scroll the terminal, so they are always fully redrawn
+        self.reserve_lines = reserve_lines
+        self.previous = None
+        self.frames = 0
+
+    def invalidate(self):
+        """Forget the last frame, so the next one redraws the whole screen
+
+        Call it whenever something else printed to the screen, since that
+        may have scrolled the last frame out of place.
+        """
+        self.previous = None
+
+    def _check_size(self):
+        """Pick up a resized terminal; the old frame is no longer where it was drawn"""
+        if not any(self.follow_size):
+            return
+        size = shutil.get_terminal_size()
+        width = size.columns if self.follow_size[0] else self.width
+        height = size.lines if self.follow_size[1] else self.height
+        if (width, height) != (self.width, self.height):
+            self.width, self.height = width, height
+            self.invalidate()
+
+    @contextmanager
+    def frame(self):
+        """Yield a console to draw one frame into, then send it in a single write"""
+        self._check_size()
+        buffer = io.StringIO()
+        frame_console = Console(file=buffer, width=self.width, force_terminal=True,
+                                color_system=self.color_system)
+        yield frame_console
+        self.present(buffer.getvalue())
+
+    def present(self, text):
+        """Write only the lines that changed since the previous frame"""
+        self._check_size()
+        lines = text.rstrip("\n").split("\n")
+        fits = len(lines) + self.reserve_lines <= self.height
+
+        if self.previous is None or not fits:
+            output = CLEAR_SCREEN + "\n".join(lines)
+        else:
+            parts = []
+            for row, line in enumerate(lines):
+                if row >= len(self.previous) or self.previous[row] != line:
+                    parts.append(f"\x1b[{row + 1};1H{line}{CLEAR_LINE_END}")
+            output = "".join(parts)
+
+        # Leave the cursor under the frame and clear whatever was printed there
+        output += f"\x1b[{len(lines) + 1};1H{CLEAR_BELOW}"
+
+        self.stream.write(output)
+        self.stream.flush()
+        self.previous = lines if fits else None
+        self.frames += 1
+
+    def stats(self):
+        """Return bytes and writes sent per frame so far"""
+        frames = max(self.frames, 1)
+        return {
+            "frames": self.frames,
+            "bytes": self.stream.bytes,
+            "writes": self.stream.writes,
+            "bytes_per_frame": self.stream.bytes / frames,
+            "writes_per_frame": self.stream.writes / frames
+        }
+
+
+def measure_rendering(story_type="castle", turns=100, width=100, height=50):
+    """Compare clear-and-reprint with differential frames over a walk through a story"""
+    from Code.story_manager import StoryManager
+    from Code.ui_manager import UIManager
+
+    scenes = StoryManager().get_story_scenes(story_type)
+    scene_ids = [scene_id for scene_id, scene in scenes.items() if not scene.get("ending")]
+    game_state = {"inventory": [], "deaths": 0, "visited_scenes": []}
+
+    # A player often redraws the same scene (inventory, stats, invalid input)
+    walk = [scene_ids[(turn // 2) % len(scene_ids)] for turn in range(turns)]
+
+    plain_stream = CountingStream(io.StringIO())
+    plain_console = Console(file=plain_stream, width=width, force_terminal=True, color_system="truecolor")
+    plain_ui = UIManager(plain_console)
+    for scene_id in walk:
+        plain_console.clear()
+        plain_ui.show_scene(scenes[scene_id], game_state)
+
+    renderer = FrameRenderer(io.StringIO(), width=width, height=height, color_system="truecolor")
+    for scene_id in walk:
+        with renderer.frame() as frame_console:
+            UIManager(frame_console).show_scene(scenes[scene_id], game_state)
+
+    return {
+        "clear_and_reprint": {
+            "bytes_per_frame": plain_stream.bytes / turns,
+            "writes_per_frame": plain_stream.writes / turns
+        },
+        "differential": renderer.stats()
+    }
+
+
+def main():
+    """Command line entry point for the rendering benchmark"""
+    parser = argparse.ArgumentParser(description="Measure bytes and writes per turn for each renderer")
+    parser.add_argument("--story", default="castle")
+    parser.add_argument("--turns", type=int, default=100)
+    args = parser.parse_args()
+
+    results = measure_rendering(args.story, args.turns)
+    for name, result in results.items():
+        print(f"{name}: {result['bytes_per_frame']:.0f} bytes and {result['writes_per_frame']:.1f} writes per turn")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,30 +4,66 @@ Game Logic Module - Handles game flow and story progression
 
 import json
 import os
+import time
 from datetime import datetime
-from rich.console import Console
-from rich.prompt import Prompt, Confirm
 
 from Code.story_manager import StoryManager
-from Code.ui_manager import UIManager
+from Code.ui_backends import create_ui_manager
 from Code.save_manager import SaveManager
 from Code.stats_manager import StatsManager
+from Code.string_pool import POOL
+from Code.state_history import StateHistory
+from Code.choice_conditions import StateMask
+from Code.save_migration import migrate_state, story_plan
+from Code.think_time import ThinkTimes
 
-console = Console()
+def apply_choice(game_state, current_scene, choice_data):
+    """Take a choice, returning the (message, style) pairs to show the player"""
+    messages = []
+    
+    # Record choice
+    game_state["choices_made"].append({
+        "scene": current_scene,
+        "choice": choice_data["text"],
+        "timestamp": datetime.now().isoformat()
+    })
+    
+    # Handle item collection
+    if "item" in choice_data:
+        if choice_data["item"] not in game_state["inventory"]:
+            game_state["inventory"].append(choice_data["item"])
+            game_state["items_collected"] += 1
+            messages.append((f"You found: {choice_data['item']}", "success"))
+    
+    # Check if choice leads to death
+    if choice_data.get("death"):
+        game_state["deaths"] += 1
+        messages.append((choice_data.get('death_message', 'You died!'), "error"))
+    
+    # Move to next scene
+    game_state["current_scene"] = choice_data["next_scene"]
+    return messages
 
 class GameLogic:
-    def __init__(self):
+    def __init__(self, memory_profiler=None, frame_renderer=None, ui_manager=None):
         self.story_manager = StoryManager()
-        self.ui_manager = UIManager()
-        self.save_manager = SaveManager()
-        self.stats_manager = StatsManager()
+        self.ui_manager = ui_manager or create_ui_manager()
+        self.save_manager = SaveManager(self.ui_manager)
+        self.stats_manager = StatsManager(ui_manager=self.ui_manager)
+        self.history = None
+        self.state_mask = None
+        self.memory_profiler = memory_profiler
+        self.frame_renderer = frame_renderer
 
     def play_game(self):
         """Start a new game"""
-        console.clear()
+        self.ui_manager.clear()
+        
+        # New games start on the latest version of edited stories
+        self.story_manager.reload_stories()
         
         # Get player name
-        player_name = Prompt.ask("Enter your name")
+        player_name = self.ui_manager.ask("Enter your name")
         
         # Choose story
         story_choice = self.choose_story()
@@ -38,14 +74,15 @@ class GameLogic:
         game_state = {
             "player_name": player_name,
             "story_type": story_choice,
-            "current_scene": f"{story_choice}_start",
+            "current_scene": POOL.intern(f"{story_choice}_start"),
             "inventory": [],
             "visited_scenes": [],
             "choices_made": [],
             "deaths": 0,
             "saves_used": 0,
             "start_time": datetime.now().isoformat(),
-            "items_collected": 0
+            "items_collected": 0,
+            "story_version": self.story_manager.get_story_version(story_choice)
         }
         
         # Start the story
@@ -55,19 +92,9 @@ class GameLogic:
         """Let player choose which story to play"""
         stories = self.story_manager.get_available_stories()
         
-        console.print("[bold cyan]Choose Your Adventure:[/bold cyan]")
-        console.print()
-        
-        for i, (story_id, story_info) in enumerate(stories.items(), 1):
-            console.print(f"[{i}] {story_info['title']}")
-            console.print(f"    {story_info['description']}")
-            console.print(f"    Difficulty: {story_info['difficulty']}")
-            console.print()
+        self.ui_manager.show_story_list(stories)
         
-        console.print(f"[{len(stories) + 1}] Back to Main Menu")
-        console.print()
-        
-        choice = Prompt.ask("Choose a story", choices=[str(i) for i in range(1, len(stories) + 2)])
+        choice = self.ui_manager.ask("Choose a story", choices=[str(i) for i in range(1, len(stories) + 2)])
         
         if choice == str(len(stories) + 1):
             return None
@@ -78,13 +105,26 @@ class GameLogic:
     def play_story(self, game_state):
         """Main story playing loop"""
         scenes = self.story_manager.get_story_scenes(game_state["story_type"])
+        conditions = self.story_manager.get_choice_conditions(game_state["story_type"])
+        templates = self.story_manager.get_scene_templates(game_state["story_type"])
+        self.history = StateHistory(game_state)
+        self.state_mask = StateMask(game_state)
+        think_times = ThinkTimes()
+        if self.memory_profiler:
+            self.memory_profiler.start(game_state)
+        if self.frame_renderer:
+            # The screen was drawn by the menus, not by the renderer
+            self.frame_renderer.invalidate()
         
         while True:
+            self.history.record()
+            if self.memory_profiler:
+                self.memory_profiler.on_turn(game_state)
             current_scene = game_state["current_scene"]
             
             # Check if scene exists
             if current_scene not in scenes:
-                console.print(f"Error: Scene '{current_scene}' not found!", style="red")
+                self.ui_manager.message(f"Error: Scene '{current_scene}' not found!", "error")
                 break
             
             scene = scenes[current_scene]
@@ -93,13 +133,26 @@ class GameLogic:
             if current_scene not in game_state["visited_scenes"]:
                 game_state["visited_scenes"].append(current_scene)
             
-            # Display scene
-            console.clear()
-            self.ui_manager.show_scene(scene, game_state)
+            # Choices whose conditions don't hold, with what they require
+            available = conditions.available_choices(current_scene, scene, game_state, self.state_mask)
+            locked = {
+                i: conditions.requirement(current_scene, i)
+                for i in range(len(scene.get("choices", [])))
+                if not available >> i & 1
+            }
+            
+            # Display scene, with the player's details filled into its text
+            shown_scene = templates.render(current_scene, scene, game_state, self.ui_manager.escape_markup)
+            if self.frame_renderer:
+                with self.frame_renderer.frame() as frame_console:
+                    self.ui_manager.with_console(frame_console).show_scene(shown_scene, game_state, locked)
+            else:
+                self.ui_manager.clear()
+                self.ui_manager.show_scene(shown_scene, game_state, locked)
             
             # Check if this is an ending
             if scene.get("ending"):
-                self.ui_manager.show_ending(scene, game_state)
+                self.ui_manager.show_ending(shown_scene, game_state)
                 
                 # Calculate final stats
                 end_time = datetime.now()
@@ -107,54 +160,55 @@ class GameLogic:
                 play_time = end_time - start_time
                 
                 # Save final statistics
-                self.stats_manager.save_final_stats(game_state, play_time)
+                self.stats_manager.save_final_stats(game_state, play_time, current_scene)
+                self.stats_manager.save_player_stats(game_state, play_time)
+                self.stats_manager.record_history(game_state, completed=True)
+                self.stats_manager.record_think_times(think_times)
                 
-                console.print("Press Enter to return to main menu...")
-                input()
+                self.ui_manager.pause("Press Enter to return to main menu...")
                 break
             
             # Get player choice
-            choice = self.get_player_choice(scene, game_state)
+            shown = time.monotonic()
+            choice = self.get_player_choice(scene, game_state, locked)
             
             if choice is None:  # Player quit
+                self.stats_manager.record_history(game_state, completed=False)
+                self.stats_manager.record_think_times(think_times)
                 break
             
+            if choice == "U":  # Rewound to an earlier turn
+                continue
+            
             # Process choice
             if choice.isdigit():
                 choice_index = int(choice) - 1
                 if 0 <= choice_index < len(scene["choices"]):
-                    choice_data = scene["choices"][choice_index]
-                    
-                    # Record choice
-                    game_state["choices_made"].append({
-                        "scene": current_scene,
-                        "choice": choice_data["text"],
-                        "timestamp": datetime.now().isoformat()
-                    })
-                    
-                    # Handle item collection
-                    if "item" in choice_data:
-                        if choice_data["item"] not in game_state["inventory"]:
-                            game_state["inventory"].append(choice_data["item"])
-                            game_state["items_collected"] += 1
-                            console.print(f"[green]You found: {choice_data['item']}[/green]")
-                            console.print("Press Enter to continue...")
-                            input()
-                    
-                    # Check if choice leads to death
-                    if choice_data.get("death"):
-                        game_state["deaths"] += 1
-                        console.print(f"[red]{choice_data.get('death_message', 'You died!')}[/red]")
-                        console.print("Press Enter to continue...")
-                        input()
-                    
-                    # Move to next scene
-                    game_state["current_scene"] = choice_data["next_scene"]
+                    think_times.record(game_state["story_type"], current_scene,
+                                       scene["choices"][choice_index]["text"], time.monotonic() - shown)
+                    for text, style in apply_choice(game_state, current_scene, scene["choices"][choice_index]):
+                        self.ui_manager.message(text, style)
+                        self.ui_manager.pause()
+                        self._printed_outside_frame()
+        
+        if self.memory_profiler:
+            self.memory_profiler.finish(game_state)
 
-    def get_player_choice(self, scene, game_state):
+    def _printed_outside_frame(self):
+        """Have the next frame redraw the screen, as output under the frame may have scrolled it"""
+        if self.frame_renderer:
+            self.frame_renderer.invalidate()
+
+    def get_player_choice(self, scene, game_state, locked=None):
         """Get and validate player choice"""
+        locked = locked or {}
+        first = True
         while True:
-            choice = Prompt.ask("Your choice").strip().upper()
+            if not first:
+                # Inventory, stats, saving or an error message was shown under the frame
+                self._printed_outside_frame()
+            first = False
+            choice = self.ui_manager.ask("Your choice").strip().upper()
             
             if choice == "I":
                 self.ui_manager.show_inventory(game_state)
@@ -166,32 +220,49 @@ class GameLogic:
                 self.ui_manager.show_current_stats(game_state)
                 continue
             elif choice == "Q":
-                if Confirm.ask("Are you sure you want to quit?"):
+                if self.ui_manager.confirm("Are you sure you want to quit?"):
                     return None
                 continue
+            elif choice == "U":
+                if not self.history or not self.history.can_rewind():
+                    self.ui_manager.message("Nothing to undo!", "error")
+                    continue
+                max_steps = len(self.history.snapshots) - 1
+                steps = self.ui_manager.ask_int(f"Undo how many turns? (1-{max_steps})", default=1)
+                if self.history.rewind(steps):
+                    self.state_mask.reset()
+                    return "U"
+                self.ui_manager.message("Can't undo that many turns!", "error")
+                continue
             
             # Validate numeric choice
             if choice.isdigit():
                 choice_index = int(choice) - 1
                 if 0 <= choice_index < len(scene["choices"]):
-                    choice_data = scene["choices"][choice_index]
-                    
-                    # Check if choice requires an item
-                    if "requires_item" in choice_data:
-                        if choice_data["requires_item"] not in game_state["inventory"]:
-                            console.print(f"[red]You need {choice_data['requires_item']} to do that![/red]")
-                            continue
+                    # Check if the choice's requirements are met
+                    if choice_index in locked:
+                        self.ui_manager.message(f"You need {locked[choice_index]} to do that!", "error")
+                        continue
                     
                     return choice
                 else:
-                    console.print("[red]Invalid choice number![/red]")
+                    self.ui_manager.message("Invalid choice number!", "error")
             else:
-                console.print("[red]Please enter a number or command![/red]")
+                self.ui_manager.message("Please enter a number or command!", "error")
 
     def load_game(self):
         """Load a saved game"""
         save_data = self.save_manager.load_game()
         if save_data:
-            console.print(f"Loading story for {save_data['player_name']}...", style="green")
-            console.clear()
+            # Saves made on an older version of the story follow its scene renames
+            plan = story_plan(self.story_manager, save_data["story_type"])
+            status = migrate_state(save_data, plan)
+            if status == "unknown_story":
+                self.ui_manager.message(f"The story '{save_data['story_type']}' of this save is not installed!", "error")
+                self.ui_manager.pause()
+                return
+            if status == "reset":
+                self.ui_manager.message("This story changed since the save; starting it from the beginning.", "warning")
+            self.ui_manager.message(f"Loading story for {save_data['player_name']}...", "success")
+            self.ui_manager.clear()
             self.play_story(save_data)
\ No newline at end of file
@@ -0,0 +1,11 @@
+"""
+Latency Module - Percentiles of measured latencies for benchmark reports
+"""
+
+
+def percentile(values, fraction):
+    """Return a percentile of a list of numbers (nearest rank)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
@@ -0,0 +1,164 @@
+"""
+Leaderboard Manager Module - Keeps fastest-completion leaderboards
+"""
+
+import heapq
+import json
+import logging
+import os
+from datetime import datetime
+
+from Code.file_lock import FileLock
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("play_time_seconds", "turns")
+
+
+class LeaderboardManager:
+    def __init__(self, log_file="stats/leaderboards.jsonl", size=10):
+        self.log_file = log_file
+        # Held by every process appending to or compacting the shared log
+        self.lock_file = f"{log_file}.lock"
+        self.size = size
+        self.boards = {}
+        self.log_lines = 0
+        self._seq = 0
+        self._load()
+
+    def _load(self):
+        """Rebuild the in-memory heaps by replaying the append-only log"""
+        try:
+            self._replay()
+        except Exception as e:
+            logger.error(f"Error reading leaderboards: {e}")
+
+    def _replay(self):
+        """Replace the heaps with those of the log as it is on disk now"""
+        self.boards = {}
+        self.log_lines = 0
+        if not os.path.exists(self.log_file):
+            return
+
+        with open(self.log_file, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn last line after a crash is simply skipped
+                    continue
+                self.log_lines += 1
+                self._push(record["board"], record["entry"])
+
+    def _push(self, board, entry):
+        """Insert an entry into a bounded heap, return True if it was kept"""
+        heap = self.boards.setdefault(board, [])
+        # Values are negated so heap[0] is the worst entry kept; on ties the
+        # newest entry counts as worse, so earlier records keep their place
+        self._seq += 1
+        item = (-entry["value"], -self._seq, entry)
+
+        if len(heap) < self.size:
+            heapq.heappush(heap, item)
+            return True
+        if item[0] > heap[0][0]:
+            heapq.heapreplace(heap, item)
+            return True
+        return False
+
+    def board_name(self, kind, key, metric):
+        """Return the name of a leaderboard, e.g. 'story:castle:turns'"""
+        return f"{kind}:{key}:{metric}"
+
+    def record_completion(self, game_state, play_time, ending=None):
+        """Record a finished game on its story and ending leaderboards"""
+        entry_base = {
+            "player_name": game_state["player_name"],
+            "story_type": game_state["story_type"],
+            "ending": ending,
+            "finished_at": datetime.now().isoformat(),
+        }
+        values = {
+            "play_time_seconds": round(play_time.total_seconds(), 3),
+            "turns": len(game_state["choices_made"]),
+        }
+
+        targets = [("story", game_state["story_type"])]
+        if ending:
+            targets.append(("ending", ending))
+
+        records = []
+        for kind, key in targets:
+            for metric in METRICS:
+                board = self.board_name(kind, key, metric)
+                entry = dict(entry_base, value=values[metric])
+                if self._push(board, entry):
+                    records.append({"board": board, "entry": entry})
+
+        if records:
+            self._append(records)
+
+    def _append(self, records):
+        """Append new leaderboard entries to the log without rewriting it"""
+        directory = os.path.dirname(self.log_file)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        # Under the lock, so an append can't land in a log being replaced
+        with FileLock(self.lock_file):
+            try:
+                with open(self.log_file, 'a') as f:
+                    f.write("".join(json.dumps(r) + "\n" for r in records))
+                self.log_lines += len(records)
+            except Exception as e:
+                logger.error(f"Error saving leaderboards: {e}")
+                return
+
+            # Entries pushed out of the heaps stay in the log until it is compacted
+            kept = sum(len(heap) for heap in self.boards.values())
+            if self.log_lines > 4 * max(kept, self.size):
+                self._compact()
+
+    def compact(self):
+        """Rewrite the log with only the entries still on a leaderboard"""
+        with FileLock(self.lock_file):
+            self._compact()
+
+    def _compact(self):
+        """Compact the log; the caller holds the lock"""
+        # Other processes append to the same log, so their entries are read
+        # back and merged before anything is dropped
+        boards, log_lines = self.boards, self.log_lines
+        try:
+            self._replay()
+        except Exception as e:
+            self.boards, self.log_lines = boards, log_lines
+            logger.error(f"Error reading leaderboards, not compacting: {e}")
+            return
+
+        temp_file = f"{self.log_file}.{os.getpid()}.tmp"
+        try:
+            with open(temp_file, 'w') as f:
+                for board, heap in self.boards.items():
+                    # Best first, so replaying keeps the tie-break order
+                    for _, _, entry in sorted(heap, reverse=True):
+                        f.write(json.dumps({"board": board, "entry": entry}) + "\n")
+            os.replace(temp_file, self.log_file)
+            self.log_lines = sum(len(heap) for heap in self.boards.values())
+        except Exception as e:
+            logger.error(f"Error compacting leaderboards: {e}")
+
+    def get_leaderboard(self, kind, key, metric="play_time_seconds"):
+        """Return leaderboard entries sorted from best to worst"""
+        heap = self.boards.get(self.board_name(kind, key, metric), [])
+        return [entry for _, _, entry in sorted(heap, reverse=True)]
+
+    def get_best(self, kind, key, metric="play_time_seconds"):
+        """Return the best entry of a leaderboard, or None if it is empty"""
+        heap = self.boards.get(self.board_name(kind, key, metric))
+        if not heap:
+            return None
+        return max(heap)[2]
@@ -0,0 +1,197 @@
+"""
+Load Test Module - Many processes finishing games and saving at the same time
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from Code.choice_conditions import StateMask
+from Code.latency import percentile
+from Code.player_stats_store import PlayerStatsStore
+from Code.save_manager import SaveManager
+from Code.stats_manager import StatsManager
+from Code.story_manager import StoryManager
+
+
+def scripted_game(story_manager, story_type, rng, max_turns=50):
+    """Play a story with random available choices, return the final game state"""
+    scenes = story_manager.get_story_scenes(story_type)
+    conditions = story_manager.get_choice_conditions(story_type)
+    game_state = {
+        "player_name": "",
+        "story_type": story_type,
+        "current_scene": f"{story_type}_start",
+        "inventory": [],
+        "visited_scenes": [],
+        "choices_made": [],
+        "deaths": 0,
+        "saves_used": 0,
+        "start_time": datetime.now().isoformat(),
+        "items_collected": 0
+    }
+    state_mask = StateMask(game_state)
+
+    for _ in range(max_turns):
+        scene = scenes.get(game_state["current_scene"])
+        if scene is None or scene.get("ending"):
+            break
+        if game_state["current_scene"] not in game_state["visited_scenes"]:
+            game_state["visited_scenes"].append(game_state["current_scene"])
+
+        available = conditions.available_choices(game_state["current_scene"], scene, game_state, state_mask)
+        indices = [i for i in range(len(scene.get("choices", []))) if available >> i & 1]
+        if not indices:
+            break
+        choice_data = scene["choices"][rng.choice(indices)]
+        game_state["choices_made"].append({
+            "scene": game_state["current_scene"],
+            "choice": choice_data["text"],
+            "timestamp": datetime.now().isoformat()
+        })
+        if "item" in choice_data and choice_data["item"] not in game_state["inventory"]:
+            game_state["inventory"].append(choice_data["item"])
+            game_state["items_collected"] += 1
+        if choice_data.get("death"):
+            game_state["deaths"] += 1
+        game_state["current_scene"] = choice_data["next_scene"]
+
+    return game_state
+
+
+def run_worker(worker_id, options, barrier, results):
+    """Play scripted games in one process, timing every save and stats update"""
+    # SaveManager and StatsManager use paths relative to the working directory
+    os.chdir(options["workdir"])
+
+    rng = random.Random(worker_id)
+    # Workers given a story image share its pages instead of loading the stories
+    story_manager = StoryManager(image_path=options["story_image"])
+    save_manager = SaveManager()
+    stats_manager = StatsManager(write_behind=options["write_behind"], flush_interval=None)
+    stories = list(story_manager.get_available_stories())
+
+    # Play every game first, so the timed part is only the contended I/O
+    games = []
+    for game in range(options["games"]):
+        game_state = scripted_game(story_manager, rng.choice(stories), rng)
+        game_state["player_name"] = f"player_{rng.randrange(options['players'])}"
+        games.append((game, game_state))
+
+    save_latencies, stats_latencies, errors = [], [], 0
+    barrier.wait()
+    started = time.perf_counter()
+
+    for game, game_state in games:
+        play_time = timedelta(seconds=rng.uniform(60, 1800))
+
+        begin = time.perf_counter()
+        try:
+            save_manager.write_save(game_state, f"w{worker_id}_g{game}")
+        except Exception:
+            errors += 1
+        save_latencies.append(time.perf_counter() - begin)
+
+        begin = time.perf_counter()
+        try:
+            stats_manager.save_final_stats(game_state, play_time, game_state["current_scene"])
+            stats_manager.save_player_stats(game_state, play_time)
+        except Exception:
+            errors += 1
+        stats_latencies.append(time.perf_counter() - begin)
+
+    if stats_manager.aggregator:
+        stats_manager.aggregator.close()
+
+    results.put({
+        "elapsed": time.perf_counter() - started,
+        "save_latencies": save_latencies,
+        "stats_latencies": stats_latencies,
+        "errors": errors
+    })
+
+
+def run_load_test(workers=8, games=50, players=20, workdir=None, write_behind=False, story_image=None):
+    """Run the load test and return throughput, latency and lost-update figures"""
+    workdir = workdir or tempfile.mkdtemp(prefix="story_load_")
+    options = {"workdir": workdir, "games": games, "players": players, "write_behind": write_behind,
+               "story_image": os.path.abspath(story_image) if story_image else None}
+
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [context.Process(target=run_worker, args=(i, options, barrier, results)) for i in range(workers)]
+    for process in processes:
+        process.start()
+    worker_results = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    save_latencies = [t for r in worker_results for t in r["save_latencies"]]
+    stats_latencies = [t for r in worker_results for t in r["stats_latencies"]]
+    elapsed = max(r["elapsed"] for r in worker_results)
+    expected_games = workers * games
+
+    global_games = 0
+    try:
+        with open(os.path.join(workdir, "stats", "global_stats.json"), 'r') as f:
+            global_games = json.load(f).get("total_games", 0)
+    except Exception:
+        pass
+
+    store = PlayerStatsStore(os.path.join(workdir, "stats"))
+    player_games = store.rollup(workers)["total_games"]
+    saved_files = len([f for f in os.listdir(os.path.join(workdir, "saves")) if f.endswith(".json")])
+
+    def latency_summary(values):
+        return {name: percentile(values, q) * 1000 for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))}
+
+    return {
+        "workdir": workdir,
+        "workers": workers,
+        "games": expected_games,
+        "elapsed_seconds": elapsed,
+        "games_per_second": expected_games / elapsed if elapsed else 0.0,
+        "save_latency_ms": latency_summary(save_latencies),
+        "stats_latency_ms": latency_summary(stats_latencies),
+        "errors": sum(r["errors"] for r in worker_results),
+        "lost_global_updates": expected_games - global_games,
+        "lost_player_updates": expected_games - player_games,
+        "lost_saves": expected_games - saved_files
+    }
+
+
+def main():
+    """Command line entry point for the load test"""
+    parser = argparse.ArgumentParser(description="Load test saves and stats with concurrent scripted players")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--games", type=int, default=50, help="games per worker")
+    parser.add_argument("--players", type=int, default=20, help="distinct player names shared by all workers")
+    parser.add_argument("--workdir", help="directory for saves/ and stats/ (default: a new temp dir)")
+    parser.add_argument("--write-behind", action="store_true", help="use the write-behind stats aggregator")
+    parser.add_argument("--story-image", help="compiled story image the workers map instead of loading stories")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    report = run_load_test(args.workers, args.games, args.players, args.workdir, args.write_behind, args.story_image)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{report['games']} games by {report['workers']} workers in {report['elapsed_seconds']:.2f}s "
+          f"({report['games_per_second']:.0f} games/s), results in {report['workdir']}")
+    for label in ("save_latency_ms", "stats_latency_ms"):
+        summary = report[label]
+        print(f"{label}: p50 {summary['p50']:.2f}  p95 {summary['p95']:.2f}  "
+              f"p99 {summary['p99']:.2f}  max {summary['max']:.2f}")
+    print(f"Lost updates: global {report['lost_global_updates']}, players {report['lost_player_updates']}, "
+          f"saves {report['lost_saves']}; errors {report['errors']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,28 +5,53 @@ Author: [Your Name]
 Main entry point for the game
 """
 
-from rich.console import Console
-from rich.panel import Panel
-from rich.text import Text
-from rich.prompt import Prompt
+import argparse
+import logging
+import sys
 
-from game_logic import GameLogic
-from Code.stats_manager import StatsManager
-from Code.ui_manager import UIManager
+from Code.game_logic import GameLogic
+from Code.memory_profiler import MemoryProfiler
+from Code.save_retention import RetentionWorker, load_policy
+from Code.ui_backends import BACKENDS, create_ui_manager
 
-console = Console()
+MAIN_MENU = [("1", "New Game"), ("2", "Load Game"), ("3", "Global Statistics"), ("4", "Exit")]
 
-def main():
+def main(argv=None, ui_manager=None):
     """Main game loop"""
-    console.clear()
-    show_title()
+    args = parse_args(argv)
+    # Background errors go to stderr, so they never mix with the UI on stdout
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    ui_manager = ui_manager or create_ui_manager(args.ui)
+    if args.record:
+        from Code.session_recorder import SessionRecorder
+        ui_manager = SessionRecorder(ui_manager, args.record, args.ui)
+    ui_manager.clear()
+    ui_manager.show_title()
     
-    game_logic = GameLogic()
-    stats_manager = StatsManager()
-    ui_manager = UIManager()
+    memory_profiler = None
+    if args.profile_memory:
+        memory_profiler = MemoryProfiler(args.profile_memory, args.profile_dump)
+    
+    # Scenes are redrawn differentially on terminals unless asked not to;
+    # only the rich backend draws screens, the others write a stream
+    frame_renderer = None
+    if args.ui == "rich" and sys.stdout.isatty() and not args.full_redraw:
+        from Code.frame_renderer import FrameRenderer
+        frame_renderer = FrameRenderer(color_system=ui_manager.console.color_system)
+    
+    # Saves are pruned in the background if the saves directory has a policy
+    try:
+        if load_policy("saves"):
+            RetentionWorker("saves")
+    except (OSError, ValueError) as e:
+        ui_manager.message(f"Error reading save retention policy: {e}", "error")
+    
+    game_logic = GameLogic(memory_profiler, frame_renderer, ui_manager)
+    stats_manager = game_logic.stats_manager
     
     while True:
-        choice = show_main_menu()
+        ui_manager.show_leaderboards(stats_manager.leaderboards, game_logic.story_manager.get_available_stories())
+        choice = show_main_menu(ui_manager)
         
         if choice == "1":
             game_logic.play_game()
@@ -35,33 +60,30 @@ def main():
         elif choice == "3":
             stats_manager.show_global_stats()
         elif choice == "4":
-            console.print("Thanks for playing!", style="green")
+            ui_manager.message("Thanks for playing!", "success")
             break
         else:
-            console.print("Invalid choice. Please try again.", style="red")
+            ui_manager.message("Invalid choice. Please try again.", "error")
 
-def show_title():
-    """Display the game title"""
-    title = Text("Interactive Story Generator", style="bold cyan")
-    subtitle = Text("CS50P Final Project", style="italic")
-    
-    title_panel = Panel.fit(f"{title}\n{subtitle}", border_style="cyan")
-    console.print(title_panel)
-    console.print()
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Interactive Story Generator")
+    parser.add_argument("--ui", choices=list(BACKENDS), default="rich",
+                        help="user interface: rich (default), plain text or JSON lines")
+    parser.add_argument("--record", metavar="FILE",
+                        help="record every input with its timing to FILE for playback")
+    parser.add_argument("--profile-memory", type=int, metavar="N",
+                        help="profile memory with tracemalloc every N turns")
+    parser.add_argument("--profile-dump", metavar="DIR",
+                        help="write memory profile reports for each session to DIR")
+    parser.add_argument("--full-redraw", action="store_true",
+                        help="clear and reprint the screen every turn instead of sending only changed lines")
+    return parser.parse_args(argv)
 
-def show_main_menu():
+def show_main_menu(ui_manager):
     """Display main menu and get user choice"""
-    menu_text = """
-[bold cyan]Main Menu[/bold cyan]
-
-[1] New Game
-[2] Load Game
-[3] Global Statistics
-[4] Exit
-
-Choose an option: """
-    
-    return Prompt.ask(menu_text, choices=["1", "2", "3", "4"])
+    ui_manager.show_menu("Main Menu", MAIN_MENU)
+    return ui_manager.ask("Choose an option", choices=[key for key, _ in MAIN_MENU])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,133 @@
+"""
+Memory Profiler Module - Tracks allocation growth over long sessions
+"""
+
+import json
+import logging
+import os
+import re
+import sys
+import tracemalloc
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+def deep_size(value, seen=None):
+    """Return the memory used by a value and everything it contains"""
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(deep_size(v, seen) for v in value)
+    return size
+
+
+class MemoryProfiler:
+    def __init__(self, every=10, dump_dir=None, top=10, frames=5):
+        self.every = every
+        self.dump_dir = dump_dir
+        self.top = top
+        self.frames = frames
+        self.turns = 0
+        self.reports = []
+        self._snapshot = None
+        self._field_sizes = {}
+        self._started_tracing = False
+
+    def start(self, game_state):
+        """Start tracing allocations for a session"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracing = True
+        self.turns = 0
+        self.reports = []
+        self._snapshot = self._take_snapshot()
+        self._field_sizes = self._measure_fields(game_state)
+
+    def _take_snapshot(self):
+        """Take a snapshot without the profiler's own allocations"""
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+
+    def _measure_fields(self, game_state):
+        """Return the deep size of every game state field"""
+        return {field: deep_size(value) for field, value in game_state.items()}
+
+    def on_turn(self, game_state):
+        """Record a turn, reporting growth every `every` turns"""
+        self.turns += 1
+        if self._snapshot is None or self.turns % self.every:
+            return None
+        return self._report(game_state)
+
+    def _report(self, game_state):
+        """Compare with the previous report and store the growth"""
+        snapshot = self._take_snapshot()
+        sites = []
+        for stat in snapshot.compare_to(self._snapshot, "lineno")[:self.top]:
+            frame = stat.traceback[0]
+            sites.append({
+                "site": f"{frame.filename}:{frame.lineno}",
+                "size_diff": stat.size_diff,
+                "count_diff": stat.count_diff,
+                "size": stat.size
+            })
+
+        field_sizes = self._measure_fields(game_state)
+        fields = {
+            field: {"size": size, "size_diff": size - self._field_sizes.get(field, 0)}
+            for field, size in field_sizes.items()
+        }
+
+        current, peak = tracemalloc.get_traced_memory()
+        report = {
+            "turn": self.turns,
+            "traced_current": current,
+            "traced_peak": peak,
+            "sites": sites,
+            "fields": fields
+        }
+        self.reports.append(report)
+        self._snapshot = snapshot
+        self._field_sizes = field_sizes
+        return report
+
+    def finish(self, game_state):
+        """Stop tracing, dump the reports if asked to, and return them"""
+        if self._snapshot is not None and self.turns % self.every:
+            self._report(game_state)
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self._snapshot = None
+
+        if self.dump_dir and self.reports:
+            self.dump(game_state)
+        return self.reports
+
+    def dump(self, game_state):
+        """Write the reports next to the session, named after player and start time"""
+        os.makedirs(self.dump_dir, exist_ok=True)
+        start = game_state.get("start_time", datetime.now().isoformat()).replace(":", "-")
+        player = re.sub(r"[^\w-]", "_", game_state.get("player_name", "player"))
+        filename = os.path.join(self.dump_dir, f"{player}_{start}.memory.json")
+        try:
+            with open(filename, 'w') as f:
+                json.dump({
+                    "player_name": game_state.get("player_name"),
+                    "story_type": game_state.get("story_type"),
+                    "every": self.every,
+                    "reports": self.reports
+                }, f, indent=2)
+            logger.info(f"Memory profile written to {filename}")
+        except Exception as e:
+            logger.error(f"Error writing memory profile: {e}")
+        return filename
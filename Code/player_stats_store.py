@@ -0,0 +1,196 @@
+"""
+Player Stats Store Module - Sharded storage and rollups of per-player statistics
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote, unquote
+
+from Code.file_lock import FileLock
+from Code.quantile_sketch import merge_quantiles
+
+# Device names Windows reserves whatever the extension
+RESERVED_NAMES = {"CON", "PRN", "AUX", "NUL"} | {f"{port}{n}" for port in ("COM", "LPT") for n in range(1, 10)}
+# Most filesystems allow 255 bytes; this leaves room for ".json" and temp file suffixes
+MAX_ENCODED_LENGTH = 200
+# quote() never writes an escaped '~', so this can't occur in a full-length name
+HASHED_MARKER = "%7E"
+
+
+class PlayerStatsStore:
+    def __init__(self, stats_dir="stats"):
+        self.stats_dir = stats_dir
+        self.players_dir = os.path.join(stats_dir, "players")
+
+    def encode_name(self, player_name):
+        """Encode a player name into a filename that is safe on any filesystem"""
+        # Percent-encode everything but letters, digits and '-_.~'; a leading
+        # dot is escaped too so names like '..' can't escape the shard
+        encoded = quote(player_name, safe="")
+        if encoded.startswith("."):
+            encoded = "%2E" + encoded[1:]
+        # CON, nul.txt and the like: escaping the first letter makes them ordinary names
+        if encoded.split(".")[0].upper() in RESERVED_NAMES:
+            encoded = f"%{ord(encoded[0]):02X}" + encoded[1:]
+        if len(encoded) > MAX_ENCODED_LENGTH:
+            # Too long to keep whole: a prefix, without splitting an escape, plus a hash
+            prefix = encoded[:MAX_ENCODED_LENGTH - len(HASHED_MARKER) - 40]
+            if "%" in prefix[-2:]:
+                prefix = prefix[:prefix.rindex("%")]
+            encoded = prefix + HASHED_MARKER + hashlib.sha1(player_name.encode("utf-8")).hexdigest()
+        return encoded or "%00"
+
+    def decode_name(self, filename):
+        """Return the player name stored in a player stats filename, or None if it was hashed"""
+        encoded = filename[:-5] if filename.endswith(".json") else filename
+        if HASHED_MARKER in encoded:
+            return None
+        return "" if encoded == "%00" else unquote(encoded)
+
+    def lock(self, player_name):
+        """Return the lock held while a player's stats are read, updated and written"""
+        return FileLock(f"{self.path_for(player_name)}.lock")
+
+    def shard_for(self, player_name):
+        """Return the shard directory name (two hex digits) for a player"""
+        return hashlib.sha1(player_name.encode("utf-8")).hexdigest()[:2]
+
+    def path_for(self, player_name):
+        """Return the stats file path for a player"""
+        return os.path.join(self.players_dir, self.shard_for(player_name), f"{self.encode_name(player_name)}.json")
+
+    def legacy_path_for(self, player_name):
+        """Return the flat stats file path used before sharding"""
+        return os.path.join(self.stats_dir, f"player_{player_name}.json")
+
+    def load(self, player_name):
+        """Load a player's stats, falling back to the legacy flat file"""
+        for path in (self.path_for(player_name), self.legacy_path_for(player_name)):
+            if os.path.exists(path):
+                try:
+                    with open(path, 'r') as f:
+                        return json.load(f)
+                except Exception:
+                    return None
+        return None
+
+    def save(self, player_name, player_stats):
+        """Write a player's stats atomically into its shard"""
+        path = self.path_for(player_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        temp_file = f"{path}.{os.getpid()}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(player_stats, f, indent=2)
+        os.replace(temp_file, path)
+
+        # Once written to its shard the legacy file would only shadow stale data
+        legacy_path = self.legacy_path_for(player_name)
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+
+    def shard_dirs(self):
+        """Return the paths of every shard directory"""
+        if not os.path.exists(self.players_dir):
+            return []
+        return [entry.path for entry in os.scandir(self.players_dir) if entry.is_dir()]
+
+    def rollup(self, workers=None):
+        """Rebuild global aggregates from all player files using a process pool"""
+        totals = empty_totals()
+        shards = self.shard_dirs()
+
+        if shards:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for partial in pool.map(rollup_shard, shards, chunksize=max(1, len(shards) // 64)):
+                    merge_totals(totals, partial)
+
+        # Legacy flat files are few and only until each player's next game
+        for entry in os.scandir(self.stats_dir) if os.path.exists(self.stats_dir) else []:
+            if entry.name.startswith("player_") and entry.name.endswith(".json"):
+                merge_totals(totals, rollup_files([entry.path]))
+
+        return finish_totals(totals)
+
+
+def empty_totals():
+    """Return an empty set of aggregate counters"""
+    return {
+        "total_games": 0,
+        "total_play_time_seconds": 0,
+        "total_deaths": 0,
+        "total_items_collected": 0,
+        "total_players": 0,
+        "stories_completed": {},
+        "quantiles": {},
+    }
+
+
+def merge_totals(totals, partial):
+    """Add the counters of one partial aggregate into another"""
+    for key in ("total_games", "total_play_time_seconds", "total_deaths", "total_items_collected", "total_players"):
+        totals[key] += partial[key]
+    for story, count in partial["stories_completed"].items():
+        totals["stories_completed"][story] = totals["stories_completed"].get(story, 0) + count
+    merge_quantiles(totals["quantiles"], partial["quantiles"])
+    return totals
+
+
+def finish_totals(totals):
+    """Turn aggregate counters into the global stats format"""
+    stats = dict(totals)
+    if stats["total_games"]:
+        stats["average_game_time_seconds"] = stats["total_play_time_seconds"] / stats["total_games"]
+    else:
+        stats["average_game_time_seconds"] = 0
+    return stats
+
+
+def rollup_files(paths):
+    """Aggregate a list of player stats files"""
+    totals = empty_totals()
+    for path in paths:
+        try:
+            with open(path, 'r') as f:
+                player_stats = json.load(f)
+        except Exception:
+            continue
+
+        totals["total_players"] += 1
+        totals["total_games"] += player_stats.get("games_played", 0)
+        totals["total_play_time_seconds"] += player_stats.get("total_play_time_seconds", 0)
+        totals["total_deaths"] += player_stats.get("total_deaths", 0)
+        totals["total_items_collected"] += player_stats.get("total_items_collected", 0)
+        for story, count in player_stats.get("stories_completed", {}).items():
+            totals["stories_completed"][story] = totals["stories_completed"].get(story, 0) + count
+        merge_quantiles(totals["quantiles"], player_stats.get("quantiles", {}))
+    return totals
+
+
+def rollup_shard(shard_dir):
+    """Aggregate every player stats file in one shard (runs in a worker process)"""
+    return rollup_files(
+        entry.path for entry in os.scandir(shard_dir)
+        if entry.name.endswith(".json")
+    )
+
+
+def main():
+    """Command line entry point for the stats rollup"""
+    parser = argparse.ArgumentParser(description="Rebuild global statistics from player stats files")
+    parser.add_argument("command", choices=["rollup"])
+    parser.add_argument("--stats-dir", default="stats")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    from Code.stats_manager import StatsManager
+    stats = StatsManager(args.stats_dir).rollup_global_stats(args.workers)
+    if stats:
+        print(f"Global statistics rebuilt from {stats['total_players']} players!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Quantile Sketch Module - Mergeable t-digests of game time, turns and deaths
+
+A t-digest keeps a sorted list of centroids (mean, weight) that are small
+near the tails and large in the middle, so p95 and p99 stay accurate in a
+few hundred numbers however many games are added. New values are buffered
+and merged in sorted batches; two digests merge by merging their
+centroids, so sketches from player files or other hosts add up.
+
+Stats keep one digest per metric for all games and for each story:
+
+    "quantiles": {"all": {"play_time_seconds": {...}, "turns": {...}, "deaths": {...}},
+                  "stories": {"castle": {...}}}
+
+Stories have their own map so that a story named "all" can't mix with the
+totals. Stats written before that kept stories next to "all"; they are
+moved into the map when merged into.
+"""
+
+import math
+
+COMPRESSION = 100
+METRICS = ("play_time_seconds", "turns", "deaths")
+ALL_STORIES = "all"
+STORIES = "stories"
+
+
+class TDigest:
+    __slots__ = ("compression", "centroids", "count", "min", "max", "_buffer")
+
+    def __init__(self, compression=COMPRESSION):
+        self.compression = compression
+        # [mean, weight] pairs sorted by mean
+        self.centroids = []
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self._buffer = []
+
+    def add(self, value, weight=1):
+        """Add a value; compressing is deferred so adding is amortised O(log n)"""
+        self._buffer.append([value, weight])
+        self.count += weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self._buffer) >= self.compression * 5:
+            self._compress()
+
+    def merge(self, other):
+        """Add every value of another digest to this one"""
+        if not other.count:
+            return self
+        self._buffer.extend([mean, weight] for mean, weight in other.centroids + other._buffer)
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if len(self._buffer) >= self.compression * 5:
+            self._compress()
+        return self
+
+    def _scale(self, q):
+        """The k1 scale function: centroids span at most one unit of it"""
+        return self.compression / (2 * math.pi) * math.asin(2 * min(max(q, 0.0), 1.0) - 1)
+
+    def _compress(self):
+        """Merge the buffered values into the centroids"""
+        if not self._buffer:
+            return
+        points = sorted(self.centroids + self._buffer)
+        self._buffer = []
+        total = self.count
+
+        merged = []
+        mean, weight = points[0]
+        weight_before = 0
+        k_left = self._scale(0.0)
+        for point_mean, point_weight in points[1:]:
+            if self._scale((weight_before + weight + point_weight) / total) - k_left <= 1:
+                weight += point_weight
+                mean += (point_mean - mean) * point_weight / weight
+            else:
+                merged.append([mean, weight])
+                weight_before += weight
+                k_left = self._scale(weight_before / total)
+                mean, weight = point_mean, point_weight
+        merged.append([mean, weight])
+        self.centroids = merged
+
+    def quantile(self, q):
+        """Return the estimated value at quantile q (0 to 1)"""
+        self._compress()
+        centroids = self.centroids
+        if not centroids:
+            return 0.0
+        if len(centroids) == 1:
+            return centroids[0][0]
+
+        target = q * self.count
+        cumulative = 0
+        previous_mean = self.min
+        previous_center = 0.0
+        for mean, weight in centroids:
+            center = cumulative + weight / 2
+            if target < center:
+                if center == previous_center:
+                    return mean
+                value = previous_mean + (mean - previous_mean) * (target - previous_center) / (center - previous_center)
+                return min(max(value, self.min), self.max)
+            cumulative += weight
+            previous_mean, previous_center = mean, center
+
+        if self.count == previous_center:
+            return self.max
+        value = previous_mean + (self.max - previous_mean) * (target - previous_center) / (self.count - previous_center)
+        return min(max(value, self.min), self.max)
+
+    def to_dict(self):
+        """Return the digest as compact JSON data, centroids flattened into one list"""
+        self._compress()
+        return {
+            "n": self.count,
+            "min": self.min if self.count else 0,
+            "max": self.max if self.count else 0,
+            "c": [round(value, 3) for centroid in self.centroids for value in centroid],
+        }
+
+    @classmethod
+    def from_dict(cls, data, compression=COMPRESSION):
+        digest = cls(compression)
+        flat = data.get("c", [])
+        digest.centroids = [[flat[i], flat[i + 1]] for i in range(0, len(flat), 2)]
+        digest.count = data.get("n", 0)
+        if digest.count:
+            digest.min, digest.max = data["min"], data["max"]
+        return digest
+
+
+def game_quantiles(game_state, play_time):
+    """Return the quantile sketches of one finished game, for all stories and its own"""
+    values = {
+        "play_time_seconds": play_time.total_seconds(),
+        "turns": len(game_state.get("choices_made", [])),
+        "deaths": game_state.get("deaths", 0),
+    }
+    sketches = {}
+    for metric, value in values.items():
+        digest = TDigest()
+        digest.add(value)
+        sketches[metric] = digest.to_dict()
+    return {ALL_STORIES: sketches, STORIES: {game_state["story_type"]: dict(sketches)}}
+
+
+def story_quantiles(quantiles):
+    """Return the per-story sketches of stored quantiles, including ones kept in the old layout"""
+    stories = {scope: sketches for scope, sketches in quantiles.items() if scope not in (ALL_STORIES, STORIES)}
+    stories.update(quantiles.get(STORIES, {}))
+    return stories
+
+
+def _merge_sketches(target, sketches):
+    for metric, sketch in sketches.items():
+        if metric in target:
+            target[metric] = TDigest.from_dict(target[metric]).merge(TDigest.from_dict(sketch)).to_dict()
+        else:
+            target[metric] = dict(sketch)
+
+
+def merge_quantiles(target, delta):
+    """Merge the sketches of one stats dict into another's, in place"""
+    stories = story_quantiles(target)
+    for scope in [scope for scope in target if scope not in (ALL_STORIES, STORIES)]:
+        del target[scope]
+    target[STORIES] = stories
+
+    if ALL_STORIES in delta:
+        _merge_sketches(target.setdefault(ALL_STORIES, {}), delta[ALL_STORIES])
+    for story, sketches in story_quantiles(delta).items():
+        _merge_sketches(stories.setdefault(story, {}), sketches)
+    return target
+
+
+def percentiles(sketch, fractions=(0.5, 0.95, 0.99)):
+    """Return the values at each fraction of a stored sketch"""
+    digest = TDigest.from_dict(sketch)
+    return [digest.quantile(fraction) for fraction in fractions]
@@ -0,0 +1,245 @@
+"""
+Save Index Module - Keeps a summary of every save for the load menu
+"""
+
+import json
+import logging
+import os
+
+from Code.chunk_store import manifest_chunks
+from Code.file_lock import FileLock
+
+logger = logging.getLogger(__name__)
+
+SORT_ORDERS = ("newest", "player")
+
+
+class SaveIndex:
+    def __init__(self, saves_dir="saves"):
+        self.saves_dir = saves_dir
+        # Not a .json file, so it never shows up as a save itself
+        self.index_file = os.path.join(saves_dir, ".save_index")
+        self.entries = {}
+        self.lock_file = os.path.join(saves_dir, ".save_index.lock")
+        self.dir_mtime = None
+        self.log_lines = 0
+        # Where the last read of the log stopped, and which file it was
+        self.log_offset = 0
+        self.log_identity = None
+        self._sorted_cache = {}
+
+    def summarize(self, save_data):
+        """Return the fields of a save needed to list, sort and filter it"""
+        return {
+            "player_name": save_data.get("player_name", "Unknown"),
+            "story_type": save_data.get("story_type", "Unknown"),
+            "save_timestamp": save_data.get("save_timestamp", save_data.get("start_time", "")),
+            "scenes_visited": save_data["history"]["visited_scenes"]["length"] if "history" in save_data
+                              else len(save_data.get("visited_scenes", [])),
+            # Chunk store references, so garbage collection needn't reopen every save
+            "chunks": manifest_chunks(save_data),
+            # Saves written before the chunk store are rewritten by the retention pass
+            "chunked": "history" in save_data,
+        }
+
+    def load(self):
+        """Load the index, picking up saves added or removed behind its back"""
+        # Other processes append to the same log, so read whatever they added
+        self._read_log()
+
+        if not os.path.exists(self.saves_dir):
+            return
+
+        # Saves written through update() keep the index current; a changed
+        # directory mtime means files were added or removed some other way
+        if os.stat(self.saves_dir).st_mtime != self.dir_mtime:
+            self._reconcile()
+
+    def lock(self):
+        """Return the lock writers of the index log hold"""
+        return FileLock(self.lock_file)
+
+    def _read_log(self):
+        """Replay the index log records added since the last read"""
+        try:
+            f = open(self.index_file, 'rb')
+        except FileNotFoundError:
+            return
+
+        try:
+            with f:
+                stat = os.fstat(f.fileno())
+                identity = (stat.st_dev, stat.st_ino)
+                if identity != self.log_identity or stat.st_size < self.log_offset:
+                    # New or compacted log: replay it from the start
+                    self.entries = {}
+                    self.dir_mtime = None
+                    self.log_lines = 0
+                    self.log_offset = 0
+                    self.log_identity = identity
+                    self._sorted_cache = {}
+                if stat.st_size == self.log_offset:
+                    return
+                f.seek(self.log_offset)
+                data = f.read()
+        except Exception as e:
+            logger.error(f"Error reading save index: {e}")
+            return
+
+        # A line still being written by another process is read next time
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            self.log_lines += 1
+            self._apply(record)
+        self.log_offset += end
+
+    def _apply(self, record):
+        """Apply one index log record to the in-memory entries"""
+        op = record.get("op")
+        if op == "put":
+            self.entries[record["file"]] = record["summary"]
+        elif op == "delete":
+            self.entries.pop(record["file"], None)
+        elif op == "mtime":
+            self.dir_mtime = record["value"]
+        self._sorted_cache = {}
+
+    def _append(self, records):
+        """Append records to the index log and catch up with it"""
+        if not os.path.exists(self.saves_dir):
+            os.makedirs(self.saves_dir, exist_ok=True)
+
+        try:
+            with self.lock():
+                with open(self.index_file, 'a') as f:
+                    f.write("".join(json.dumps(r) + "\n" for r in records))
+                # Our records are read back in log order, after any appended before them
+                self._read_log()
+                if self.log_lines > 2 * len(self.entries) + 100:
+                    self._compact()
+        except Exception as e:
+            for record in records:
+                self._apply(record)
+            logger.error(f"Error updating save index: {e}")
+
+    def _reconcile(self):
+        """Sync the index with the files actually present in the saves directory"""
+        on_disk = {f for f in os.listdir(self.saves_dir) if f.endswith('.json')}
+
+        records = [{"op": "delete", "file": f} for f in self.entries.keys() - on_disk]
+        for filename in on_disk - self.entries.keys():
+            try:
+                with open(os.path.join(self.saves_dir, filename), 'r') as f:
+                    save_data = json.load(f)
+            except Exception:
+                continue
+            records.append({"op": "put", "file": filename, "summary": self.summarize(save_data)})
+
+        records.append({"op": "mtime", "value": os.stat(self.saves_dir).st_mtime})
+        self._append(records)
+
+    def compact(self):
+        """Rewrite the index log with one record per save"""
+        try:
+            with self.lock():
+                self._compact()
+        except Exception as e:
+            logger.error(f"Error compacting save index: {e}")
+
+    def _compact(self):
+        """Rewrite the log; the caller holds the index lock"""
+        # Records other processes appended must survive the rewrite
+        self._read_log()
+        temp_file = f"{self.index_file}.{os.getpid()}.tmp"
+        with open(temp_file, 'w') as f:
+            for filename, summary in self.entries.items():
+                f.write(json.dumps({"op": "put", "file": filename, "summary": summary}) + "\n")
+        os.replace(temp_file, self.index_file)
+        # Replacing the index file changes the directory mtime itself
+        with open(self.index_file, 'a') as f:
+            f.write(json.dumps({"op": "mtime", "value": os.stat(self.saves_dir).st_mtime}) + "\n")
+        self._read_log()
+
+    def live_chunks(self):
+        """Return every chunk hash a save refers to, for garbage collection
+
+        The log is read again first, so saves other processes rewrote are
+        counted with their current chunks. Saves whose summary predates the
+        chunk store are read from disk, as they may have been compacted
+        since.
+        """
+        self.load()
+        live = set()
+        for filename, summary in self.entries.items():
+            if summary.get("chunked"):
+                live.update(summary.get("chunks", ()))
+                continue
+            try:
+                with open(os.path.join(self.saves_dir, filename), 'r') as f:
+                    live.update(manifest_chunks(json.load(f)))
+            except Exception:
+                continue
+        return live
+
+    def update(self, filename, save_data):
+        """Record a save that has just been written"""
+        self.load()
+        records = [{"op": "put", "file": filename, "summary": self.summarize(save_data)}]
+        records.append({"op": "mtime", "value": os.stat(self.saves_dir).st_mtime})
+        self._append(records)
+
+    def update_summaries(self, summaries):
+        """Record many rewritten saves at once, given {filename: summary}"""
+        self.load()
+        records = [{"op": "put", "file": filename, "summary": summary} for filename, summary in summaries.items()]
+        records.append({"op": "mtime", "value": os.stat(self.saves_dir).st_mtime})
+        self._append(records)
+
+    def remove(self, filename):
+        """Record a save that has just been deleted"""
+        self.load()
+        records = [{"op": "delete", "file": filename}]
+        records.append({"op": "mtime", "value": os.stat(self.saves_dir).st_mtime})
+        self._append(records)
+
+    def remove_files(self, filenames):
+        """Record many deleted saves at once"""
+        self.load()
+        records = [{"op": "delete", "file": filename} for filename in filenames]
+        records.append({"op": "mtime", "value": os.stat(self.saves_dir).st_mtime})
+        self._append(records)
+
+    def _sorted(self, sort, player=None, story=None):
+        """Return matching save filenames in order, cached until the index changes"""
+        key = (sort, player.lower() if player else None, story)
+        if key in self._sorted_cache:
+            return self._sorted_cache[key]
+
+        if player or story:
+            filenames = [
+                f for f in self._sorted(sort)
+                if (not player or self.entries[f]["player_name"].lower() == key[1])
+                and (not story or self.entries[f]["story_type"] == story)
+            ]
+        else:
+            filenames = sorted(self.entries, key=lambda f: self.entries[f]["save_timestamp"], reverse=True)
+            if sort == "player":
+                # Stable sort keeps newest-first within each player
+                filenames.sort(key=lambda f: self.entries[f]["player_name"].lower())
+
+        self._sorted_cache[key] = filenames
+        return filenames
+
+    def query(self, sort="newest", player=None, story=None, page=1, page_size=10):
+        """Return (entries, total_pages) for one page of the filtered saves"""
+        self.load()
+
+        filenames = self._sorted(sort, player, story)
+        total_pages = max(1, -(-len(filenames) // page_size))
+        page = min(max(page, 1), total_pages)
+        start = (page - 1) * page_size
+        return [(f, self.entries[f]) for f in filenames[start:start + page_size]], total_pages
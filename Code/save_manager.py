@@ -3,20 +3,47 @@ Save Manager Module - Handles game saving and loading
 """
 
 import json
+import logging
 import os
 from datetime import datetime
-from rich.console import Console
-from rich.prompt import Prompt
 
-console = Console()
+from Code.chunk_store import ChunkStore, GC_GRACE_SECONDS
+from Code.save_index import SaveIndex, SORT_ORDERS
+from Code.string_pool import POOL
+from Code.ui_backends import create_ui_manager
+
+logger = logging.getLogger(__name__)
 
 class SaveManager:
+    def __init__(self, ui_manager=None):
+        self.index = SaveIndex("saves")
+        self.chunks = ChunkStore("saves")
+        self.page_size = 10
+        self.ui_manager = ui_manager
+
+    def _ui(self):
+        """Return the UI backend, creating the rich one if none was given"""
+        if self.ui_manager is None:
+            self.ui_manager = create_ui_manager()
+        return self.ui_manager
+
     def save_game(self, game_state):
         """Save current game state"""
-        if not os.path.exists("saves"):
-            os.makedirs("saves")
+        ui_manager = self._ui()
+        save_name = ui_manager.ask("Enter save name", default=f"{game_state['player_name']}_save")
         
-        save_name = Prompt.ask("Enter save name", default=f"{game_state['player_name']}_save")
+        try:
+            self.write_save(game_state, save_name)
+            ui_manager.message(f"Game saved as '{save_name}'!", "success")
+        except Exception as e:
+            ui_manager.message(f"Error saving game: {e}", "error")
+        
+        ui_manager.pause()
+
+    def write_save(self, game_state, save_name):
+        """Write a game state to saves/<save_name>.json without prompting"""
+        if not os.path.exists("saves"):
+            os.makedirs("saves", exist_ok=True)
         
         # Add current timestamp to save data
         save_data = game_state.copy()
@@ -24,71 +51,66 @@ class SaveManager:
         
         filename = f"saves/{save_name}.json"
         
-        try:
-            with open(filename, 'w') as f:
-                json.dump(save_data, f, indent=2)
-            
-            game_state["saves_used"] += 1
-            console.print(f"[green]Game saved as '{save_name}'![/green]")
-        except Exception as e:
-            console.print(f"[red]Error saving game: {e}[/red]")
+        # History prefixes shared with other saves are stored once as chunks
+        manifest = self.chunks.split_history(save_data)
+        temp_file = f"{filename}.{os.getpid()}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(temp_file, filename)
+        self.index.update(f"{save_name}.json", manifest)
         
-        console.print("Press Enter to continue...")
-        input()
+        game_state["saves_used"] += 1
 
     def load_game(self):
         """Load a saved game"""
+        ui_manager = self._ui()
         if not os.path.exists("saves"):
-            console.print("[red]No saves directory found![/red]")
-            console.print("Press Enter to continue...")
-            input()
+            ui_manager.message("No saves directory found!", "error")
+            ui_manager.pause()
             return None
         
-        save_files = [f for f in os.listdir("saves") if f.endswith('.json')]
-        
-        if not save_files:
-            console.print("[red]No save files found![/red]")
-            console.print("Press Enter to continue...")
-            input()
-            return None
-        
-        # Show available saves
-        from Code.ui_manager import UIManager
-        ui_manager = UIManager()
-        
-        valid_saves = []
-        for i, filename in enumerate(save_files, 1):
-            try:
-                with open(f"saves/{filename}", 'r') as f:
-                    save_data = json.load(f)
-                
-                valid_saves.append((i, filename, save_data))
-            except Exception as e:
-                console.print(f"[red]Error reading {filename}: {e}[/red]")
+        page = 1
+        sort = "newest"
+        player = None
+        story = None
         
-        if not valid_saves:
-            console.print("[red]No valid save files found![/red]")
-            console.print("Press Enter to continue...")
-            input()
-            return None
-        
-        # Display saves using UI manager
-        ui_manager.show_save_list(valid_saves)
-        
-        console.print(f"[{len(valid_saves) + 1}] Back to Main Menu")
-        console.print()
-        
-        choice = Prompt.ask("Choose save to load", choices=[str(i) for i in range(1, len(valid_saves) + 2)])
-        
-        if choice == str(len(valid_saves) + 1):
-            return None
-        
-        # Load the chosen save
-        for save_id, filename, save_data in valid_saves:
-            if save_id == int(choice):
-                return save_data
-        
-        return None
+        while True:
+            entries, total_pages = self.index.query(sort, player, story, page, self.page_size)
+            page = min(page, total_pages)
+            
+            if not entries and not (player or story):
+                ui_manager.message("No save files found!", "error")
+                ui_manager.pause()
+                return None
+            
+            # Display saves using UI manager
+            first = (page - 1) * self.page_size + 1
+            ui_manager.show_save_list([(first + i, filename, summary) for i, (filename, summary) in enumerate(entries)])
+            ui_manager.show_save_menu_options(page, total_pages, sort, player, story)
+            
+            choice = ui_manager.ask("Choose save to load").strip().upper()
+            
+            if choice == "B":
+                return None
+            elif choice == "N":
+                page = min(page + 1, total_pages)
+            elif choice == "P":
+                page = max(page - 1, 1)
+            elif choice == "O":
+                sort = ui_manager.ask("Sort by", choices=list(SORT_ORDERS), default=sort)
+                page = 1
+            elif choice == "F":
+                player = ui_manager.ask("Filter by player (blank for all)", default="").strip() or None
+                story = ui_manager.ask("Filter by story (blank for all)", default="").strip().lower() or None
+                page = 1
+            elif choice.isdigit() and first <= int(choice) < first + len(entries):
+                filename = entries[int(choice) - first][0]
+                try:
+                    return POOL.intern_game_state(self.read_save(filename))
+                except Exception as e:
+                    ui_manager.message(f"Error reading {filename}: {e}", "error")
+            else:
+                ui_manager.message("Invalid choice!", "error")
 
     def get_save_files(self):
         """Get list of available save files"""
@@ -99,20 +121,54 @@ class SaveManager:
         for filename in os.listdir("saves"):
             if filename.endswith('.json'):
                 try:
-                    with open(f"saves/{filename}", 'r') as f:
-                        save_data = json.load(f)
+                    save_data = self.read_save(filename)
                     save_files.append((filename, save_data))
                 except Exception:
                     continue
         
         return save_files
 
+    def read_save(self, filename):
+        """Read a save file, joining its history back from the chunk store"""
+        with open(f"saves/{filename}", 'r') as f:
+            return self.chunks.join_history(json.load(f))
+
+    def collect_garbage(self, grace_seconds=GC_GRACE_SECONDS):
+        """Delete history chunks no save refers to any more"""
+        # One collection at a time, from what the saves refer to right now
+        with self.chunks.lock():
+            return self.chunks.collect_garbage(self.index.live_chunks(), grace_seconds)
+
+    def migrate_saves(self):
+        """Move the history of saves written before the chunk store into chunks"""
+        converted = 0
+        for filename in os.listdir("saves") if os.path.exists("saves") else []:
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(f"saves/{filename}", 'r') as f:
+                    save_data = json.load(f)
+                if "history" in save_data:
+                    continue
+                manifest = self.chunks.split_history(save_data)
+                temp_file = f"saves/{filename}.{os.getpid()}.tmp"
+                with open(temp_file, 'w') as f:
+                    json.dump(manifest, f)
+                os.replace(temp_file, f"saves/{filename}")
+                self.index.update(filename, manifest)
+                converted += 1
+            except Exception as e:
+                logger.error(f"Error converting {filename}: {e}")
+        return converted
+
     def delete_save(self, filename):
         """Delete a save file"""
         try:
             os.remove(f"saves/{filename}")
-            console.print(f"[green]Save '{filename[:-5]}' deleted successfully![/green]")
+            self.index.remove(filename)
+            self.collect_garbage()
+            self._ui().message(f"Save '{filename[:-5]}' deleted successfully!", "success")
             return True
         except Exception as e:
-            console.print(f"[red]Error deleting save: {e}[/red]")
+            self._ui().message(f"Error deleting save: {e}", "error")
             return False
\ No newline at end of file
@@ -0,0 +1,208 @@
+"""
+Save Migration Module - Moves saves onto the current version of their story
+
+A story's info (story.json, or a pack manifest) can carry a version and a
+table of scene renames for each version:
+
+    "version": 3,
+    "migrations": {"2": {"castle_hall": "castle_great_hall"},
+                   "3": {"castle_cellar": null}}
+
+A save made on version 1 gets the renames of versions 2 and 3 applied in
+order. Scenes mapped to null were removed: they are dropped from the
+history, and a save standing on one goes back to the start of the story.
+Saves of a story that is no longer installed are left as they are.
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from Code.chunk_store import ChunkStore
+from Code.save_index import SaveIndex
+from Code.save_retention import file_signature
+
+
+def story_plan(story_manager, story_type):
+    """Return what is needed to migrate saves of a story (plain, picklable data)"""
+    return {
+        "version": story_manager.get_story_version(story_type),
+        "migrations": story_manager.get_scene_migrations(story_type),
+        "scenes": list(story_manager.get_story_scenes(story_type)),
+        "start_scene": f"{story_type}_start",
+    }
+
+
+def story_plans(story_manager):
+    """Return the migration plan of every available story"""
+    return {story_type: story_plan(story_manager, story_type) for story_type in story_manager.get_available_stories()}
+
+
+def scene_remap(plan, from_version):
+    """Compose the renames from a save's version up to the story's version"""
+    remap = {}
+    for version in range(from_version + 1, plan["version"] + 1):
+        step = plan["migrations"].get(version, {})
+        # Earlier renames pointing at a scene renamed again follow it
+        remap = {old: step.get(new, new) if new is not None else None for old, new in remap.items()}
+        for old, new in step.items():
+            remap.setdefault(old, new)
+    return remap
+
+
+def migrate_state(game_state, plan, scene_ids=None):
+    """Migrate a game state in place, returning "unchanged", "migrated", "reset" or "unknown_story" """
+    from_version = int(game_state.get("story_version", 1))
+    scene_ids = scene_ids if scene_ids is not None else set(plan["scenes"])
+    if plan["start_scene"] not in scene_ids:
+        # Not installed (any more): there is nothing to migrate to or restart from
+        return "unknown_story"
+    if from_version >= plan["version"] and game_state.get("current_scene") in scene_ids:
+        return "unchanged"
+
+    remap = scene_remap(plan, from_version)
+
+    def moved(scene_id):
+        return remap.get(scene_id, scene_id)
+
+    visited = []
+    for scene_id in game_state.get("visited_scenes", []):
+        scene_id = moved(scene_id)
+        if scene_id is not None and scene_id not in visited:
+            visited.append(scene_id)
+    game_state["visited_scenes"] = visited
+
+    for entry in game_state.get("choices_made", []):
+        if isinstance(entry, dict) and entry.get("scene") is not None:
+            scene_id = moved(entry["scene"])
+            entry["scene"] = scene_id if scene_id is not None else entry["scene"]
+
+    status = "migrated"
+    current = moved(game_state.get("current_scene"))
+    if current not in scene_ids:
+        current = plan["start_scene"]
+        status = "reset"
+    game_state["current_scene"] = current
+    game_state["story_version"] = plan["version"]
+    return status
+
+
+def migrate_files(saves_dir, filenames, plans, dry_run=False):
+    """Migrate a batch of save files (runs in a worker process)"""
+    chunks = ChunkStore(saves_dir)
+    index = SaveIndex(saves_dir)
+    scene_sets = {story: set(plan["scenes"]) for story, plan in plans.items()}
+    results = []
+    for filename in filenames:
+        path = os.path.join(saves_dir, filename)
+        result = {"file": filename}
+        try:
+            with open(path, 'r') as f:
+                stat = os.fstat(f.fileno())
+                save_data = chunks.join_history(json.load(f))
+            story = save_data.get("story_type")
+            if story not in plans:
+                result["status"] = "unknown_story"
+                results.append(result)
+                continue
+
+            result["from"] = int(save_data.get("story_version", 1))
+            result["status"] = migrate_state(save_data, plans[story], scene_sets[story])
+            result["to"] = save_data.get("story_version", result["from"])
+
+            if result["status"] in ("migrated", "reset") and not dry_run:
+                manifest = chunks.split_history(save_data)
+                temp_file = f"{path}.{os.getpid()}.tmp"
+                with open(temp_file, 'w') as f:
+                    json.dump(manifest, f)
+                if file_signature(path) != (stat.st_mtime_ns, stat.st_size):
+                    # The game saved it again meanwhile; that save is newer than what was migrated
+                    os.remove(temp_file)
+                    result["status"] = "skipped"
+                    results.append(result)
+                    continue
+                os.replace(temp_file, path)
+                result["summary"] = index.summarize(manifest)
+        except Exception as e:
+            result["status"] = "error"
+            result["error"] = str(e)
+        results.append(result)
+    return results
+
+
+def migrate_saves(saves_dir="saves", story_manager=None, workers=None, batch_size=64, dry_run=False):
+    """Migrate every save in parallel and return a report of the results"""
+    if story_manager is None:
+        from Code.story_manager import StoryManager
+        story_manager = StoryManager()
+    plans = story_plans(story_manager)
+
+    started = time.perf_counter()
+    filenames = sorted(f for f in os.listdir(saves_dir) if f.endswith(".json")) if os.path.isdir(saves_dir) else []
+    batches = [filenames[i:i + batch_size] for i in range(0, len(filenames), batch_size)]
+
+    results = []
+    if batches:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(migrate_files, saves_dir, batch, plans, dry_run) for batch in batches]
+            for future in futures:
+                results.extend(future.result())
+
+    # The workers only rewrite files; the index is updated from here, so
+    # its log has a single writer
+    rewritten = [r for r in results if "summary" in r]
+    if rewritten:
+        SaveIndex(saves_dir).update_summaries({r["file"]: r.pop("summary") for r in rewritten})
+
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    elapsed = time.perf_counter() - started
+    return {
+        "saves": len(filenames),
+        "counts": counts,
+        "elapsed_seconds": elapsed,
+        "saves_per_second": len(filenames) / elapsed if elapsed else 0.0,
+        "errors": [r for r in results if r["status"] == "error"],
+        "reset": [r["file"] for r in results if r["status"] == "reset"],
+        "unknown_story": [r["file"] for r in results if r["status"] == "unknown_story"],
+        "skipped": [r["file"] for r in results if r["status"] == "skipped"],
+        "dry_run": dry_run,
+    }
+
+
+def main():
+    """Command line entry point for the save migration"""
+    parser = argparse.ArgumentParser(description="Migrate saves to the current version of their stories")
+    parser.add_argument("--saves-dir", default="saves")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without writing")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = migrate_saves(args.saves_dir, workers=args.workers, batch_size=args.batch_size, dry_run=args.dry_run)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    counts = ", ".join(f"{count} {status}" for status, count in sorted(report["counts"].items())) or "nothing to do"
+    print(f"{report['saves']} saves in {report['elapsed_seconds']:.2f}s "
+          f"({report['saves_per_second']:.0f}/s){' [dry run]' if report['dry_run'] else ''}: {counts}")
+    for name in report["reset"][:10]:
+        print(f"  reset to story start: {name}")
+    for name in report["unknown_story"][:10]:
+        print(f"  story not installed, left as is: {name}")
+    for name in report["skipped"][:10]:
+        print(f"  saved again during the migration, left as is: {name}")
+    for error in report["errors"][:10]:
+        print(f"  error in {error['file']}: {error['error']}")
+    hidden = sum(max(len(report[key]) - 10, 0) for key in ("reset", "unknown_story", "skipped", "errors"))
+    if hidden:
+        print(f"  ... and {hidden} more (use --json for the full list)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""
+Save Retention Module - Prunes and compacts the saves directory
+
+A retention policy lives in saves/.retention, for example
+
+    {"keep_last": 5, "max_age_days": 90}
+
+which keeps each player's five newest saves and drops saves older than 90
+days (a player's newest save is kept whatever its age). The pass works
+from the save index rather than scanning the directory, and handles a
+batch of saves per step so it can run in the background between games:
+expired saves are deleted, saves still in the inline format are moved into
+the chunk store, and at the end of the sweep unreferenced chunks, stale
+temp files and the index log are cleaned up. Only one process sweeps a
+directory at a time, and a save written again after the sweep looked at it
+is left alone.
+"""
+
+import argparse
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from Code.chunk_store import ChunkStore, GC_GRACE_SECONDS
+from Code.file_lock import FileLock
+from Code.save_index import SaveIndex
+
+logger = logging.getLogger(__name__)
+
+POLICY_FILE = ".retention"
+LOCK_FILE = ".retention.lock"
+
+
+class RetentionPolicy:
+    def __init__(self, keep_last=None, max_age_days=None, keep_newest=True):
+        self.keep_last = keep_last
+        self.max_age_days = max_age_days
+        self.keep_newest = keep_newest
+
+    def to_dict(self):
+        return {"keep_last": self.keep_last, "max_age_days": self.max_age_days, "keep_newest": self.keep_newest}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("keep_last"), data.get("max_age_days"), data.get("keep_newest", True))
+
+    def expired(self, entries, now=None):
+        """Return the saves the policy drops, given the index's {filename: summary}"""
+        cutoff = None
+        if self.max_age_days is not None:
+            cutoff = (now or datetime.now()) - timedelta(days=self.max_age_days)
+
+        by_player = {}
+        for filename, summary in entries.items():
+            by_player.setdefault(summary.get("player_name", "Unknown").lower(), []).append(filename)
+
+        expired = set()
+        for filenames in by_player.values():
+            filenames.sort(key=lambda f: entries[f].get("save_timestamp", ""), reverse=True)
+            for rank, filename in enumerate(filenames):
+                if self.keep_last is not None and rank >= self.keep_last:
+                    expired.add(filename)
+                elif cutoff and not (self.keep_newest and rank == 0):
+                    try:
+                        saved = datetime.fromisoformat(entries[filename].get("save_timestamp", ""))
+                    except ValueError:
+                        continue
+                    if saved < cutoff:
+                        expired.add(filename)
+        return expired
+
+
+def load_policy(saves_dir="saves"):
+    """Return the retention policy configured for a saves directory, or None"""
+    try:
+        with open(os.path.join(saves_dir, POLICY_FILE), 'r') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    if not isinstance(data, dict):
+        raise ValueError(f"{POLICY_FILE} must hold a JSON object")
+    return RetentionPolicy.from_dict(data)
+
+
+def save_policy(saves_dir, policy):
+    os.makedirs(saves_dir, exist_ok=True)
+    path = os.path.join(saves_dir, POLICY_FILE)
+    temp_file = f"{path}.{os.getpid()}.tmp"
+    with open(temp_file, 'w') as f:
+        json.dump(policy.to_dict(), f, indent=2)
+    os.replace(temp_file, path)
+
+
+def file_signature(path):
+    """Return (mtime, size) of a file, or None if it is gone"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class RetentionPass:
+    """One sweep over the saves, done a batch at a time"""
+
+    def __init__(self, saves_dir="saves", policy=None, batch_size=100, grace_seconds=GC_GRACE_SECONDS,
+                 dry_run=False):
+        self.saves_dir = saves_dir
+        self.policy = policy or load_policy(saves_dir) or RetentionPolicy()
+        self.batch_size = batch_size
+        self.grace_seconds = grace_seconds
+        self.dry_run = dry_run
+        self.index = SaveIndex(saves_dir)
+        self.chunks = ChunkStore(saves_dir)
+        self.lock = FileLock(os.path.join(saves_dir, LOCK_FILE))
+        self.queue = None
+        # What the expired saves looked like when the sweep chose to drop them
+        self.signatures = {}
+        self.finished = False
+        self.report = {"deleted": [], "compacted": 0, "chunks_removed": 0, "bytes_freed": 0,
+                       "temp_files_removed": 0, "skipped": [], "busy": False, "errors": []}
+
+    def start(self, now=None):
+        """Work out what the sweep has to do from the save index
+
+        Returns False, doing nothing, if another process is already sweeping
+        the directory.
+        """
+        if not self.dry_run and not self.lock.acquire(blocking=False):
+            self.report["busy"] = True
+            self.queue = deque()
+            self.finished = True
+            return False
+
+        self.index.load()
+        expired = self.policy.expired(self.index.entries, now)
+        self.signatures = {f: file_signature(os.path.join(self.saves_dir, f)) for f in expired}
+        self.queue = deque(("delete", f) for f in sorted(expired))
+        # Summaries written before "chunked" existed don't say, so check those files
+        self.queue.extend(
+            ("compact", f) for f, summary in sorted(self.index.entries.items())
+            if f not in expired and not summary.get("chunked", False)
+        )
+
+    def step(self):
+        """Handle the next batch, returning False once the sweep is finished"""
+        if self.queue is None:
+            self.start()
+        if self.finished:
+            return False
+
+        deleted = []
+        compacted = {}
+        for _ in range(min(self.batch_size, len(self.queue))):
+            action, filename = self.queue.popleft()
+            path = os.path.join(self.saves_dir, filename)
+            try:
+                if action == "delete":
+                    if not self.dry_run:
+                        signature = file_signature(path)
+                        if signature is not None and signature != self.signatures.get(filename):
+                            # Saved again under the same name since the sweep started
+                            self.report["skipped"].append(filename)
+                            continue
+                        os.remove(path)
+                    deleted.append(filename)
+                    continue
+
+                with open(path, 'r') as f:
+                    stat = os.fstat(f.fileno())
+                    save_data = json.load(f)
+                if "history" not in save_data:
+                    if self.dry_run:
+                        self.report["compacted"] += 1
+                        continue
+                    save_data = self.chunks.split_history(save_data)
+                    temp_file = f"{path}.{os.getpid()}.tmp"
+                    with open(temp_file, 'w') as f:
+                        json.dump(save_data, f)
+                    if file_signature(path) != (stat.st_mtime_ns, stat.st_size):
+                        # Written meanwhile; the new save is newer than what was read
+                        os.remove(temp_file)
+                        self.report["skipped"].append(filename)
+                        continue
+                    os.replace(temp_file, path)
+                    self.report["compacted"] += 1
+                compacted[filename] = self.index.summarize(save_data)
+            except FileNotFoundError:
+                # Deleted by the player meanwhile
+                deleted.append(filename)
+            except Exception as e:
+                self.report["errors"].append({"file": filename, "error": str(e)})
+
+        self.report["deleted"].extend(deleted)
+        if not self.dry_run:
+            if deleted:
+                self.index.remove_files(deleted)
+            if compacted:
+                self.index.update_summaries(compacted)
+
+        if not self.queue:
+            try:
+                self.finish()
+            finally:
+                self.finished = True
+                self.lock.release()
+            return False
+        return True
+
+    def finish(self):
+        """Collect unreferenced chunks and stale temp files and compact the index"""
+        if self.dry_run:
+            return
+        with self.chunks.lock():
+            removed, freed = self.chunks.collect_garbage(self.index.live_chunks(), self.grace_seconds)
+        self.report["chunks_removed"] += removed
+        self.report["bytes_freed"] += freed
+
+        # Left behind by writers that crashed before renaming them into place
+        cutoff = time.time() - self.grace_seconds
+        with os.scandir(self.saves_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(".tmp") and entry.stat().st_mtime < cutoff:
+                    try:
+                        os.remove(entry.path)
+                        self.report["temp_files_removed"] += 1
+                    except FileNotFoundError:
+                        pass
+        self.index.compact()
+
+    def close(self):
+        """Give up the sweep, letting another process start one"""
+        self.finished = True
+        self.lock.release()
+
+    def run(self):
+        """Do the whole sweep at once and return its report"""
+        if os.path.isdir(self.saves_dir):
+            try:
+                while self.step():
+                    pass
+            finally:
+                self.close()
+        return self.report
+
+
+class RetentionWorker:
+    """Runs retention sweeps in a background thread, one small batch at a time"""
+
+    def __init__(self, saves_dir="saves", policy=None, interval=3600.0, batch_size=50, pause=0.1):
+        self.saves_dir = saves_dir
+        self.policy = policy
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.last_report = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                if os.path.isdir(self.saves_dir):
+                    sweep = RetentionPass(self.saves_dir, self.policy, self.batch_size)
+                    try:
+                        # Pausing between batches leaves the disk to the game
+                        while sweep.step() and not self._stop.wait(self.pause):
+                            pass
+                    finally:
+                        sweep.close()
+                    self.last_report = sweep.report
+            except Exception as e:
+                logger.error(f"Error applying save retention: {e}")
+            self._stop.wait(self.interval)
+
+    def close(self):
+        """Stop after the current batch"""
+        self._stop.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+
+
+def main():
+    """Command line entry point to configure and apply save retention"""
+    parser = argparse.ArgumentParser(description="Prune old saves and compact the rest")
+    parser.add_argument("--saves-dir", default="saves")
+    parser.add_argument("--keep-last", type=int, help="saves kept per player")
+    parser.add_argument("--max-age-days", type=float, help="drop saves older than this")
+    parser.add_argument("--set", action="store_true", help="store the options as the directory's policy")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be removed without removing it")
+    args = parser.parse_args()
+
+    policy = load_policy(args.saves_dir) or RetentionPolicy()
+    if args.keep_last is not None:
+        policy.keep_last = args.keep_last
+    if args.max_age_days is not None:
+        policy.max_age_days = args.max_age_days
+    if args.set:
+        save_policy(args.saves_dir, policy)
+        print(f"Retention policy saved: {policy.to_dict()}")
+
+    report = RetentionPass(args.saves_dir, policy, dry_run=args.dry_run).run()
+    prefix = "Would delete" if args.dry_run else "Deleted"
+    if report["busy"]:
+        print("Another process is already applying retention to this directory")
+        return
+    print(f"{prefix} {len(report['deleted'])} saves, compacted {report['compacted']}, "
+          f"removed {report['chunks_removed']} chunks ({report['bytes_freed']} bytes) "
+          f"and {report['temp_files_removed']} stale temp files")
+    if report["skipped"]:
+        print(f"Left {len(report['skipped'])} saves that were written during the sweep")
+    for error in report["errors"][:10]:
+        print(f"  error in {error['file']}: {error['error']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Scene Templates Module - Compiles player placeholders in scene text
+
+Scene titles, descriptions and choice texts can mention the player:
+
+    "Welcome back, {player_name}. You are carrying {inventory}."
+
+Placeholders are the names in FIELDS; doubled braces ({{ and }}) are
+literal braces. Each text is parsed once into its literal parts and field
+getters, so rendering a turn is a join. Compiled texts are cached by their
+content, so a reloaded story only compiles the texts that changed, and
+texts without placeholders are shown as they are. A scene whose text can't
+be compiled is shown as written rather than stopping the game. Filled-in
+values can be escaped for the UI, so a player named "[/]" is shown as such
+instead of being read as rich markup.
+"""
+
+from functools import lru_cache
+from string import Formatter
+
+
+class TemplateError(ValueError):
+    """Raised when scene text has a placeholder that can't be filled"""
+
+
+FIELDS = {
+    "player_name": lambda game_state: game_state.get("player_name", ""),
+    "inventory": lambda game_state: ", ".join(game_state["inventory"]) or "nothing",
+    "inventory_count": lambda game_state: str(len(game_state["inventory"])),
+    "deaths": lambda game_state: str(game_state.get("deaths", 0)),
+    "items_collected": lambda game_state: str(game_state.get("items_collected", 0)),
+}
+TEXT_FIELDS = ("title", "description", "ending_title")
+
+
+class Template:
+    __slots__ = ("parts",)
+
+    def __init__(self, parts):
+        # Literal strings and field getters, in order
+        self.parts = parts
+
+    def render(self, game_state, escape=None):
+        if escape is None:
+            return "".join([part if part.__class__ is str else part(game_state) for part in self.parts])
+        return "".join([part if part.__class__ is str else escape(part(game_state)) for part in self.parts])
+
+
+@lru_cache(maxsize=4096)
+def compile_template(text):
+    """Return a Template for text with placeholders, or the text itself if it has none"""
+    parts = []
+    try:
+        parsed = list(Formatter().parse(text))
+    except ValueError as e:
+        raise TemplateError(f"Invalid template {text!r}: {e}") from None
+
+    for literal, field, format_spec, conversion in parsed:
+        if literal:
+            parts.append(literal)
+        if field is None:
+            continue
+        if field not in FIELDS or format_spec or conversion:
+            raise TemplateError(f"Unknown placeholder {{{field}}} in {text!r}")
+        parts.append(FIELDS[field])
+
+    if all(part.__class__ is str for part in parts):
+        return "".join(parts)
+    return Template(tuple(parts))
+
+
+def compile_scene(scene):
+    """Return (text templates, choice templates) of a scene, raising TemplateError on bad text"""
+    texts = {field: compile_template(scene[field]) for field in TEXT_FIELDS if isinstance(scene.get(field), str)}
+    choices = [compile_template(choice.get("text", "")) for choice in scene.get("choices", [])]
+    return texts, choices
+
+
+def _render(compiled, game_state, escape):
+    return compiled if compiled.__class__ is str else compiled.render(game_state, escape)
+
+
+class SceneTemplates:
+    def __init__(self, scenes):
+        # scene id -> None for static scenes, else (text templates, choice templates)
+        self.compiled = {}
+        # scene id -> why its text is shown unfilled
+        self.errors = {}
+
+        # Lazily read scenes (story packs) are compiled as they are reached
+        if not getattr(scenes, "lazy", False):
+            for scene_id, scene in scenes.items():
+                self._compile_scene(scene_id, scene)
+
+    def _compile_scene(self, scene_id, scene):
+        """Compile the texts of one scene, remembering scenes that have no placeholders"""
+        try:
+            texts, choices = compile_scene(scene)
+        except TemplateError as e:
+            self.errors[scene_id] = str(e)
+            self.compiled[scene_id] = None
+            return
+        if all(compiled.__class__ is str for compiled in [*texts.values(), *choices]):
+            self.compiled[scene_id] = None
+        else:
+            self.compiled[scene_id] = (texts, choices)
+
+    def render(self, scene_id, scene, game_state, escape=None):
+        """Return the scene with its text filled in for the player (the scene itself if static)
+
+        escape, if given, is applied to each filled-in value, e.g. the UI's markup escape.
+        """
+        if scene_id not in self.compiled:
+            self._compile_scene(scene_id, scene)
+        compiled = self.compiled[scene_id]
+        if compiled is None:
+            return scene
+
+        texts, choices = compiled
+        rendered = dict(scene)
+        for field, template in texts.items():
+            rendered[field] = _render(template, game_state, escape)
+        if choices:
+            rendered["choices"] = [
+                dict(choice, text=_render(template, game_state, escape))
+                for choice, template in zip(scene["choices"], choices)
+            ]
+        return rendered
@@ -0,0 +1,402 @@
+"""
+Session Manager Module - Many game sessions within a memory budget
+
+Each session is driven one input at a time. Sessions live in memory in
+least-recently-used order; when their total size passes the budget, or a
+session has been idle too long, it is hibernated to disk in the compact
+save format (history in the shared chunk store) and resumed on its next
+input.
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from urllib.parse import quote
+
+from Code.choice_conditions import StateMask
+from Code.chunk_store import ChunkStore, GC_GRACE_SECONDS, manifest_chunks
+from Code.game_logic import apply_choice
+from Code.latency import percentile
+from Code.memory_profiler import deep_size
+from Code.state_history import StateHistory
+from Code.story_manager import StoryManager
+from Code.string_pool import POOL
+from Code.think_time import ThinkTimes
+
+
+# Inputs between full measurements of a session's size; in between only
+# what was appended to its lists is added
+SIZE_SAMPLE_INPUTS = 32
+POINTER_SIZE = 8
+
+
+class GameSession:
+    def __init__(self, session_id, game_state, story_manager, snapshots=None, think_times=None):
+        self.session_id = session_id
+        self.game_state = game_state
+        self.story_manager = story_manager
+        self.history = StateHistory(game_state)
+        self.history.snapshots = snapshots or []
+        self.state_mask = StateMask(game_state)
+        self.think_times = think_times or ThinkTimes()
+        self.last_used = 0.0
+        self.size = 0
+        self.size_lengths = None
+        self.inputs_since_measure = 0
+        self.status = "playing"
+        self._scene = None
+
+    def _growing_lists(self):
+        game_state = self.game_state
+        return (game_state["choices_made"], game_state["visited_scenes"], game_state["inventory"],
+                self.history.snapshots)
+
+    def update_size(self):
+        """Update the estimated memory used by the session, returning the change"""
+        lists = self._growing_lists()
+        lengths = tuple(len(values) for values in lists)
+        old_size = self.size
+        if (self.size_lengths is None or self.inputs_since_measure >= SIZE_SAMPLE_INPUTS
+                or any(length < measured for length, measured in zip(lengths, self.size_lengths))):
+            # First input, a rewind or time for a full measurement
+            self.size = deep_size(self.game_state) + deep_size(self.history.snapshots)
+            self.inputs_since_measure = 0
+        else:
+            for values, measured in zip(lists, self.size_lengths):
+                self.size += sum(deep_size(value) + POINTER_SIZE for value in values[measured:])
+            self.inputs_since_measure += 1
+        self.size_lengths = lengths
+        return self.size - old_size
+
+    def scene(self):
+        # Looked up several times per input, and image scenes are decoded on every lookup
+        scenes = self.story_manager.get_story_scenes(self.game_state["story_type"])
+        current_scene = self.game_state["current_scene"]
+        cached = self._scene
+        if cached is None or cached[0] is not scenes or cached[1] != current_scene:
+            cached = self._scene = (scenes, current_scene, scenes.get(current_scene))
+        return cached[2]
+
+    def start_turn(self):
+        """Record the turn for undo and mark the scene visited, like play_story does"""
+        self.history.record()
+        current_scene = self.game_state["current_scene"]
+        if current_scene not in self.game_state["visited_scenes"]:
+            self.game_state["visited_scenes"].append(current_scene)
+        scene = self.scene()
+        if scene is None:
+            self.status = "error"
+        elif scene.get("ending"):
+            self.status = "ended"
+
+    def locked(self, scene):
+        """Return {choice index: requirement} for the choices that can't be taken"""
+        conditions = self.story_manager.get_choice_conditions(self.game_state["story_type"])
+        current_scene = self.game_state["current_scene"]
+        available = conditions.available_choices(current_scene, scene, self.game_state, self.state_mask)
+        return {
+            i: conditions.requirement(current_scene, i)
+            for i in range(len(scene.get("choices", [])))
+            if not available >> i & 1
+        }
+
+    def view(self, messages=()):
+        """Return what the player sees after an input"""
+        scene = self.scene()
+        response = {"session": self.session_id, "status": self.status, "messages": list(messages),
+                    "scene": self.game_state["current_scene"]}
+        if scene is None:
+            response["messages"].append((f"Error: Scene '{self.game_state['current_scene']}' not found!", "error"))
+            return response
+
+        locked = self.locked(scene)
+        templates = self.story_manager.get_scene_templates(self.game_state["story_type"])
+        scene = templates.render(self.game_state["current_scene"], scene, self.game_state)
+        response.update({
+            "title": scene.get("title"),
+            "description": scene.get("description"),
+            "ending_title": scene.get("ending_title") if scene.get("ending") else None,
+            "choices": [
+                {"key": str(i), "text": choice["text"], "requires": locked.get(i - 1)}
+                for i, choice in enumerate(scene.get("choices", []), 1)
+            ]
+        })
+        return response
+
+    def handle(self, command, think=None):
+        """Apply one player input (a choice number, U, I or Q) and return the new view
+
+        think is how long the player looked at the scene before this input.
+        """
+        command = command.strip().upper()
+        if self.status != "playing":
+            return self.view([("This game is over.", "warning")])
+
+        if command == "I":
+            items = self.game_state["inventory"]
+            return self.view([("Inventory: " + (", ".join(items) if items else "Empty"), "info")])
+        if command == "Q":
+            self.status = "quit"
+            return self.view()
+        if command == "U":
+            if not self.history.rewind(1):
+                return self.view([("Nothing to undo!", "error")])
+            self.state_mask.reset()
+            self.start_turn()
+            return self.view()
+
+        scene = self.scene()
+        choices = scene.get("choices", []) if scene else []
+        if not command.isdigit() or not 0 < int(command) <= len(choices):
+            return self.view([("Please enter a choice number or command!", "error")])
+        index = int(command) - 1
+        locked = self.locked(scene)
+        if index in locked:
+            return self.view([(f"You need {locked[index]} to do that!", "error")])
+
+        if think is not None:
+            self.think_times.record(self.game_state["story_type"], self.game_state["current_scene"],
+                                    choices[index]["text"], think)
+        messages = apply_choice(self.game_state, self.game_state["current_scene"], choices[index])
+        self.start_turn()
+        return self.view(messages)
+
+
+class SessionManager:
+    def __init__(self, memory_budget=64 * 1024 * 1024, sessions_dir="sessions", idle_seconds=300.0,
+                 story_manager=None, stats_manager=None, clock=time.monotonic, gc_interval=600.0):
+        self.memory_budget = memory_budget
+        self.sessions_dir = sessions_dir
+        self.idle_seconds = idle_seconds
+        self.story_manager = story_manager or StoryManager()
+        self.stats_manager = stats_manager
+        self.clock = clock
+        self.chunks = ChunkStore(sessions_dir)
+        self.gc_interval = gc_interval
+        self.last_gc = clock()
+        # Least recently used first
+        self.sessions = OrderedDict()
+        self.resident_bytes = 0
+        self.hibernations = 0
+        self.resume_latencies = []
+        self.lock = threading.RLock()
+
+    def _path(self, session_id):
+        """Return the hibernation file of a session, quoting the id into a file name"""
+        return os.path.join(self.sessions_dir, f"{quote(str(session_id), safe='')}.json")
+
+    def start(self, session_id, player_name, story_type):
+        """Start a new game for a session and return its first view"""
+        with self.lock:
+            self.end(session_id)
+            game_state = {
+                "player_name": player_name,
+                "story_type": story_type,
+                "current_scene": POOL.intern(f"{story_type}_start"),
+                "inventory": [],
+                "visited_scenes": [],
+                "choices_made": [],
+                "deaths": 0,
+                "saves_used": 0,
+                "start_time": datetime.now().isoformat(),
+                "items_collected": 0,
+                "story_version": self.story_manager.get_story_version(story_type)
+            }
+            session = GameSession(session_id, game_state, self.story_manager)
+            session.start_turn()
+            self.sessions[session_id] = session
+            return self._after_input(session, session.view())
+
+    def handle(self, session_id, command):
+        """Apply one input to a session, resuming it from disk if it was hibernated"""
+        with self.lock:
+            session = self._get(session_id)
+            response = session.handle(command, self.clock() - session.last_used)
+            return self._after_input(session, response)
+
+    def _get(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is not None:
+            self.sessions.move_to_end(session_id)
+            return session
+        return self._resume(session_id)
+
+    def _after_input(self, session, response):
+        """Finish ended games, then keep the resident sessions within budget"""
+        if session.status != "playing":
+            self._finish(session)
+            self._drop(session.session_id)
+            return response
+
+        session.last_used = self.clock()
+        self.resident_bytes += session.update_size()
+
+        self.hibernate_idle()
+        while self.resident_bytes > self.memory_budget and len(self.sessions) > 1:
+            oldest = next(iter(self.sessions))
+            if oldest == session.session_id:
+                break
+            self.hibernate(oldest)
+        return response
+
+    def _finish(self, session):
+        """Record statistics of an ended or abandoned game"""
+        if not self.stats_manager:
+            return
+        game_state = session.game_state
+        if session.status == "ended":
+            play_time = datetime.now() - datetime.fromisoformat(game_state["start_time"])
+            self.stats_manager.save_final_stats(game_state, play_time, game_state["current_scene"])
+            self.stats_manager.save_player_stats(game_state, play_time)
+            self.stats_manager.record_history(game_state, completed=True)
+        elif session.status == "quit":
+            self.stats_manager.record_history(game_state, completed=False)
+        self.stats_manager.record_think_times(session.think_times)
+
+    def hibernate(self, session_id):
+        """Write a session to disk in the compact save format and free its memory"""
+        with self.lock:
+            session = self.sessions.pop(session_id, None)
+            if session is None:
+                return False
+            self.resident_bytes -= session.size
+
+            manifest = self.chunks.split_history(session.game_state)
+            manifest["undo_history"] = session.history.snapshots
+            manifest["think_times"] = session.think_times.to_dict()
+            # The clock may be monotonic, which means nothing to another process
+            manifest["last_used_wall"] = time.time() - (self.clock() - session.last_used)
+            os.makedirs(self.sessions_dir, exist_ok=True)
+            path = self._path(session_id)
+            temp_file = f"{path}.{os.getpid()}.tmp"
+            with open(temp_file, 'w') as f:
+                json.dump(manifest, f)
+            os.replace(temp_file, path)
+            self.hibernations += 1
+            return True
+
+    def hibernate_idle(self, now=None):
+        """Hibernate every session idle for longer than idle_seconds"""
+        now = self.clock() if now is None else now
+        idle = [sid for sid, session in self.sessions.items() if now - session.last_used > self.idle_seconds]
+        for session_id in idle:
+            self.hibernate(session_id)
+        if now - self.last_gc >= self.gc_interval:
+            self.collect_garbage()
+        return len(idle)
+
+    def collect_garbage(self, grace_seconds=GC_GRACE_SECONDS):
+        """Delete history chunks no hibernated session refers to any more"""
+        with self.lock, self.chunks.lock():
+            self.last_gc = self.clock()
+            live = set()
+            for name in os.listdir(self.sessions_dir) if os.path.isdir(self.sessions_dir) else []:
+                if not name.endswith(".json"):
+                    continue
+                try:
+                    with open(os.path.join(self.sessions_dir, name), 'r') as f:
+                        live.update(manifest_chunks(json.load(f)))
+                except (OSError, ValueError):
+                    # Ended meanwhile
+                    continue
+            return self.chunks.collect_garbage(live, grace_seconds)
+
+    def _resume(self, session_id):
+        """Load a hibernated session back into memory"""
+        began = time.perf_counter()
+        path = self._path(session_id)
+        try:
+            with open(path, 'r') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            raise KeyError(session_id) from None
+
+        snapshots = [tuple(snapshot) for snapshot in manifest.pop("undo_history", [])]
+        think_times = ThinkTimes.from_dict(manifest.pop("think_times", {}))
+        idle = max(time.time() - manifest.pop("last_used_wall", time.time()), 0.0)
+        manifest.pop("last_used", None)
+        last_used = self.clock() - idle
+        game_state = POOL.intern_game_state(self.chunks.join_history(manifest))
+        session = GameSession(session_id, game_state, self.story_manager, snapshots, think_times)
+        session.last_used = last_used
+        self.sessions[session_id] = session
+        # The file stays until the session is hibernated again or ends, so a
+        # crash while it is resident loses at most what was played since
+        self.resume_latencies.append(time.perf_counter() - began)
+        return session
+
+    def _drop(self, session_id):
+        session = self.sessions.pop(session_id, None)
+        if session is not None:
+            self.resident_bytes -= session.size
+        try:
+            os.remove(self._path(session_id))
+        except FileNotFoundError:
+            pass
+
+    def end(self, session_id):
+        """Forget a session, in memory and on disk"""
+        with self.lock:
+            self._drop(session_id)
+
+    def stats(self):
+        """Return resident and hibernated session counts, memory and resume latency"""
+        with self.lock:
+            resident = {os.path.basename(self._path(session_id)) for session_id in self.sessions}
+            hibernated = len([f for f in os.listdir(self.sessions_dir) if f.endswith(".json") and f not in resident]) \
+                if os.path.isdir(self.sessions_dir) else 0
+            return {
+                "resident": len(self.sessions),
+                "hibernated": hibernated,
+                "resident_bytes": self.resident_bytes,
+                "memory_budget": self.memory_budget,
+                "hibernations": self.hibernations,
+                "resumes": len(self.resume_latencies),
+                "resume_ms_p50": percentile(self.resume_latencies, 0.5) * 1000,
+                "resume_ms_max": percentile(self.resume_latencies, 1.0) * 1000,
+            }
+
+
+def main():
+    """Command line entry point: drive many random sessions and report memory and resume times"""
+    parser = argparse.ArgumentParser(description="Simulate many concurrent sessions under a memory budget")
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--inputs", type=int, default=20000)
+    parser.add_argument("--budget-kb", type=int, default=512)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--story-image", help="serve stories from a compiled story image")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as sessions_dir:
+        manager = SessionManager(args.budget_kb * 1024, sessions_dir,
+                                 story_manager=StoryManager(image_path=args.story_image))
+        stories = list(manager.story_manager.get_available_stories())
+        views = {}
+        started = time.perf_counter()
+        for _ in range(args.inputs):
+            session_id = rng.randrange(args.sessions)
+            view = views.get(session_id)
+            if view is None or view["status"] != "playing" or not view.get("choices"):
+                view = manager.start(session_id, f"player{session_id}", rng.choice(stories))
+            else:
+                view = manager.handle(session_id, rng.choice(view["choices"])["key"])
+            views[session_id] = view
+        elapsed = time.perf_counter() - started
+
+        stats = manager.stats()
+        print(f"{args.inputs} inputs in {elapsed:.2f}s ({args.inputs / elapsed:.0f}/s)")
+        print(f"{stats['resident']} resident sessions using {stats['resident_bytes']} of "
+              f"{stats['memory_budget']} bytes, {stats['hibernated']} hibernated")
+        print(f"{stats['hibernations']} hibernations, {stats['resumes']} resumes "
+              f"(p50 {stats['resume_ms_p50']:.2f}ms, max {stats['resume_ms_max']:.2f}ms)")
+
+
+if __name__ == "__main__":
+    main()
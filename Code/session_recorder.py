@@ -0,0 +1,224 @@
+"""
+Session Recorder Module - Records player input and plays it back
+
+A recording is a JSON lines file: a header line, then one line per input
+with the UI method, its prompt, the answer and how long the player took.
+Recording and playback both wrap a UI backend, so the game runs its real
+menu, save and load code either way.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import time
+
+from Code.latency import percentile
+from Code.ui_backends import BACKENDS, create_ui_manager
+
+
+class PlaybackFinished(EOFError):
+    """Raised when the game asks for input after the last recorded answer"""
+
+
+class PlaybackDiverged(Exception):
+    """Raised when the game asks for a different kind of input than was recorded"""
+
+
+class SessionRecorder:
+    """Wraps a UI backend and appends every answer to a recording file"""
+
+    def __init__(self, ui_manager, path, ui="rich"):
+        self.ui_manager = ui_manager
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Every input is written as it happens, so an interrupted session
+        # still leaves a usable recording
+        self.file = open(path, 'w')
+        self.started = time.perf_counter()
+        self._write({"version": 1, "ui": ui, "started": time.time()})
+
+    def _write(self, record):
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def _record(self, method, prompt, *args, **kwargs):
+        begin = time.perf_counter()
+        answer = getattr(self.ui_manager, method)(prompt, *args, **kwargs)
+        end = time.perf_counter()
+        self._write({
+            "method": method,
+            "prompt": prompt,
+            "answer": answer,
+            "think": round(end - begin, 6),
+            "at": round(end - self.started, 6)
+        })
+        return answer
+
+    def ask(self, prompt, choices=None, default=None):
+        return self._record("ask", prompt, choices=choices, default=default)
+
+    def ask_int(self, prompt, default=None):
+        return self._record("ask_int", prompt, default=default)
+
+    def confirm(self, prompt):
+        return self._record("confirm", prompt)
+
+    def pause(self, text="Press Enter to continue..."):
+        return self._record("pause", text)
+
+    def close(self):
+        self.file.close()
+
+    def __getattr__(self, name):
+        # Everything that only displays goes straight to the wrapped backend
+        return getattr(self.ui_manager, name)
+
+
+def load_recording(path):
+    """Return the header and the input records of a recording"""
+    with open(path, 'r') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if not records or "version" not in records[0]:
+        raise ValueError(f"{path} is not a session recording")
+    return records[0], records[1:]
+
+
+class SessionPlayer:
+    """Wraps a UI backend and answers its prompts from a recording"""
+
+    def __init__(self, ui_manager, inputs, pace=0.0):
+        self.ui_manager = ui_manager
+        self.inputs = inputs
+        # 0 answers at once, 1 waits as long as the player did
+        self.pace = pace
+        self.position = 0
+        self.mismatches = 0
+        self.latencies = []
+        self.think_time = 0.0
+        self.started = time.perf_counter()
+        self._answered = self.started
+        self._answered_prompt = "(start)"
+        self.finished = self.started
+
+    def _respond(self):
+        # Time from the previous answer to now is the game's own work
+        now = time.perf_counter()
+        self.latencies.append((self._answered_prompt, now - self._answered))
+        self.finished = now
+
+    def finish(self):
+        """Time the work done after the last answer, when the game exits by itself"""
+        self._respond()
+
+    def _answer(self, method, prompt):
+        self._respond()
+
+        if self.position >= len(self.inputs):
+            raise PlaybackFinished(f"recording ended before '{prompt}'")
+        record = self.inputs[self.position]
+        if record["method"] != method:
+            raise PlaybackDiverged(f"input {self.position + 1}: recorded {record['method']} "
+                                   f"'{record['prompt']}', game asked {method} '{prompt}'")
+        if record["prompt"] != prompt:
+            self.mismatches += 1
+        self.position += 1
+
+        if self.pace:
+            wait = record.get("think", 0.0) * self.pace
+            time.sleep(wait)
+            self.think_time += wait
+
+        self._answered = time.perf_counter()
+        self._answered_prompt = prompt
+        return record["answer"]
+
+    def ask(self, prompt, choices=None, default=None):
+        return self._answer("ask", prompt)
+
+    def ask_int(self, prompt, default=None):
+        return self._answer("ask_int", prompt)
+
+    def confirm(self, prompt):
+        return self._answer("confirm", prompt)
+
+    def pause(self, text="Press Enter to continue..."):
+        return self._answer("pause", text)
+
+    def report(self):
+        """Return end-to-end and per-prompt latency figures for the playback"""
+        elapsed = self.finished - self.started
+        latencies = [seconds for _, seconds in self.latencies]
+        by_prompt = {}
+        for prompt, seconds in self.latencies:
+            by_prompt.setdefault(prompt, []).append(seconds)
+
+        def summary(values):
+            return {name: percentile(values, q) * 1000 for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))}
+
+        return {
+            "inputs": self.position,
+            "recorded_inputs": len(self.inputs),
+            "prompt_mismatches": self.mismatches,
+            "elapsed_seconds": elapsed,
+            "think_seconds": self.think_time,
+            "latency_ms": summary(latencies),
+            "by_prompt": {prompt: {"count": len(values), **summary(values)} for prompt, values in by_prompt.items()}
+        }
+
+    def __getattr__(self, name):
+        return getattr(self.ui_manager, name)
+
+
+def play_recording(path, pace=0.0, ui=None, show=False, argv=()):
+    """Run main.main with answers from a recording and return the latency report"""
+    from Code import main as game_main
+
+    header, inputs = load_recording(path)
+    ui = ui or header.get("ui", "plain")
+    with open(os.devnull, 'w') as devnull, (contextlib.nullcontext() if show else contextlib.redirect_stdout(devnull)):
+        player = SessionPlayer(create_ui_manager(ui), inputs, pace)
+        try:
+            game_main.main(["--ui", ui, *argv], ui_manager=player)
+        except PlaybackFinished:
+            pass
+        else:
+            player.finish()
+    return player.report()
+
+
+def main():
+    """Command line entry point to play back a recording"""
+    parser = argparse.ArgumentParser(description="Play back a recorded session and report latency")
+    parser.add_argument("recording")
+    parser.add_argument("--pace", type=float, default=0.0,
+                        help="fraction of the recorded think time to wait (0 = full speed, 1 = recorded pace)")
+    parser.add_argument("--ui", choices=list(BACKENDS), help="UI backend (default: the recorded one)")
+    parser.add_argument("--workdir", help="directory holding saves/ and stats/ for the playback")
+    parser.add_argument("--show", action="store_true", help="show the game output while playing")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    recording = os.path.abspath(args.recording)
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+        os.chdir(args.workdir)
+
+    report = play_recording(recording, args.pace, args.ui, args.show)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{report['inputs']}/{report['recorded_inputs']} inputs in {report['elapsed_seconds']:.3f}s "
+          f"({report['think_seconds']:.3f}s think time, {report['prompt_mismatches']} prompt mismatches)")
+    summary = report["latency_ms"]
+    print(f"latency_ms: p50 {summary['p50']:.2f}  p95 {summary['p95']:.2f}  "
+          f"p99 {summary['p99']:.2f}  max {summary['max']:.2f}")
+    for prompt, summary in sorted(report["by_prompt"].items(), key=lambda item: -item[1]["max"]):
+        print(f"  {prompt[:40]:40} x{summary['count']:<4} p50 {summary['p50']:.2f}  max {summary['max']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
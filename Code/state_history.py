@@ -0,0 +1,45 @@
+"""
+State History Module - Undo/rewind through earlier game states
+"""
+
+# Fields restored by a rewind; saves_used and start_time belong to the
+# session, not to a point in the story, so they are left as they are
+SCALAR_FIELDS = ("current_scene", "deaths", "items_collected")
+LIST_FIELDS = ("inventory", "visited_scenes", "choices_made")
+
+
+class StateHistory:
+    def __init__(self, game_state):
+        self.game_state = game_state
+        self.snapshots = []
+
+    def record(self):
+        """Snapshot the game state at the start of a turn"""
+        # The lists only grow between rewinds, so every snapshot shares them
+        # and just remembers how long each one was
+        game_state = self.game_state
+        self.snapshots.append(
+            tuple(game_state[field] for field in SCALAR_FIELDS)
+            + tuple(len(game_state[field]) for field in LIST_FIELDS)
+        )
+
+    def can_rewind(self, steps=1):
+        """Return True if the history goes back at least that many turns"""
+        return 0 < steps < len(self.snapshots)
+
+    def rewind(self, steps=1):
+        """Restore the game state from that many turns ago"""
+        if not self.can_rewind(steps):
+            return False
+
+        target = len(self.snapshots) - 1 - steps
+        snapshot = self.snapshots[target]
+        # The restored turn is recorded again when it starts
+        del self.snapshots[target:]
+
+        game_state = self.game_state
+        for field, value in zip(SCALAR_FIELDS, snapshot):
+            game_state[field] = value
+        for field, length in zip(LIST_FIELDS, snapshot[len(SCALAR_FIELDS):]):
+            del game_state[field][length:]
+        return True
@@ -0,0 +1,175 @@
+"""
+Stats Aggregator Module - Write-behind batching of global statistics
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+
+from Code.file_lock import FileLock
+from Code.quantile_sketch import game_quantiles, merge_quantiles
+from Code.think_time import ThinkTimes, merge_think_times
+
+logger = logging.getLogger(__name__)
+
+
+def game_stats_delta(game_state, play_time):
+    """Return the global stats increments for one finished game"""
+    return {
+        "total_games": 1,
+        "total_play_time_seconds": play_time.total_seconds(),
+        "total_deaths": game_state["deaths"],
+        "total_items_collected": game_state["items_collected"],
+        "stories_completed": {game_state["story_type"]: 1},
+        "quantiles": game_quantiles(game_state, play_time),
+    }
+
+
+def trend_delta(stats_delta):
+    """Return the time-series increments of one game's stats delta"""
+    return {
+        "games": 1,
+        "play_time_seconds": stats_delta["total_play_time_seconds"],
+        "deaths": stats_delta["total_deaths"],
+        "items_collected": stats_delta["total_items_collected"],
+    }
+
+
+def merge_stats(stats, delta):
+    """Add a stats delta into a stats dict and refresh derived values"""
+    for key, value in delta.items():
+        if key == "quantiles":
+            merge_quantiles(stats.setdefault(key, {}), value)
+        elif isinstance(value, dict):
+            target = stats.setdefault(key, {})
+            for sub_key, count in value.items():
+                target[sub_key] = target.get(sub_key, 0) + count
+        elif key != "average_game_time_seconds":
+            stats[key] = stats.get(key, 0) + value
+
+    if stats.get("total_games"):
+        stats["average_game_time_seconds"] = stats["total_play_time_seconds"] / stats["total_games"]
+    return stats
+
+
+def merge_stats_file(stats_file, delta):
+    """Add a stats delta into a stats file, locked against other processes doing the same"""
+    directory = os.path.dirname(stats_file)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+
+    with FileLock(f"{stats_file}.lock"):
+        stats = {}
+        if os.path.exists(stats_file):
+            try:
+                with open(stats_file, 'r') as f:
+                    stats = json.load(f)
+            except Exception:
+                stats = {}
+
+        merge_stats(stats, delta)
+
+        temp_file = f"{stats_file}.{os.getpid()}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(stats, f, indent=2)
+        os.replace(temp_file, stats_file)
+
+
+class StatsAggregator:
+    def __init__(self, stats_file, max_pending=100, flush_interval=30.0, time_series=None,
+                 think_times_file=None):
+        self.stats_file = stats_file
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.time_series = time_series
+        self.think_times_file = think_times_file
+        self.pending = {}
+        self.pending_games = 0
+        # (finish time, increments) for the time series, written with the stats
+        self.pending_trends = []
+        # Think times of finished and abandoned games, merged into one set of histograms
+        self.pending_think_times = ThinkTimes()
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Time-based flushes happen even when no more games finish
+        if flush_interval:
+            self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, game_state, play_time):
+        """Accumulate one finished game, flushing if a threshold is reached"""
+        delta = game_stats_delta(game_state, play_time)
+        with self.lock:
+            merge_stats(self.pending, delta)
+            self.pending_trends.append((time.time(), trend_delta(delta)))
+            self.pending_games += 1
+            due = (self.pending_games >= self.max_pending
+                   or (self.flush_interval and time.monotonic() - self.last_flush >= self.flush_interval))
+
+        if due:
+            self.flush()
+
+    def record_think_times(self, think_times):
+        """Merge a game's think-time histograms into the pending ones"""
+        with self.lock:
+            self.pending_think_times.merge(think_times)
+
+    def _flush_loop(self):
+        """Flush pending increments every flush_interval seconds"""
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Write all pending increments to the global stats file"""
+        with self.lock:
+            self.last_flush = time.monotonic()
+            if self.pending_think_times and self.think_times_file:
+                think_times = self.pending_think_times
+                self.pending_think_times = ThinkTimes()
+                try:
+                    merge_think_times(self.think_times_file, think_times)
+                except Exception as e:
+                    self.pending_think_times.merge(think_times)
+                    logger.error(f"Error saving think times: {e}")
+
+            if not self.pending_games:
+                return
+            delta = self.pending
+            trends = self.pending_trends
+            self.pending = {}
+            self.pending_trends = []
+            self.pending_games = 0
+
+            if self.time_series is not None and trends:
+                try:
+                    self.time_series.record_many(trends)
+                except Exception as e:
+                    logger.error(f"Error saving statistics trends: {e}")
+
+            try:
+                merge_stats_file(self.stats_file, delta)
+            except Exception as e:
+                # Keep the increments so the next flush can retry them
+                merge_stats(self.pending, delta)
+                self.pending_games += delta["total_games"]
+                logger.error(f"Error saving statistics: {e}")
+
+    def pending_view(self, stats):
+        """Return stats with the not-yet-flushed increments applied"""
+        with self.lock:
+            if not self.pending_games:
+                return stats
+            return merge_stats(json.loads(json.dumps(stats)), self.pending)
+
+    def close(self):
+        """Stop the flush thread and write anything still pending"""
+        self._stop.set()
+        self.flush()
+        atexit.unregister(self.close)
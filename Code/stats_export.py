@@ -0,0 +1,290 @@
+"""
+Stats Export Module - Streams global, player and game statistics to CSV and columnar files
+
+Rows are produced by generators over the stats directory and written as
+they come, so memory stays constant however many players there are. The
+columnar format stores rows in groups; each group holds one contiguous
+block per column, so analysis tools can read only the columns they need:
+
+    b"SCOL" | uint32 schema length | schema JSON
+    row group: uint32 rows | per column: uint64 length | column data
+    footer JSON (row group offsets) | uint64 footer offset | b"SCOL"
+
+Integers are int64, floats float64 and booleans int8, all little-endian;
+strings are uint32 end offsets followed by their UTF-8 bytes.
+"""
+
+import argparse
+import csv
+import json
+import os
+import struct
+from array import array
+
+from Code.player_stats_store import PlayerStatsStore
+
+MAGIC = b"SCOL"
+FORMATS = ("csv", "columnar")
+ARRAY_TYPES = {"int": "q", "float": "d", "bool": "b"}
+
+GLOBAL_COLUMNS = [
+    ("total_games", "int"),
+    ("total_play_time_seconds", "float"),
+    ("average_game_time_seconds", "float"),
+    ("total_deaths", "int"),
+    ("total_items_collected", "int"),
+    ("stories_completed", "str"),
+]
+PLAYER_COLUMNS = [
+    ("player_name", "str"),
+    ("games_played", "int"),
+    ("total_play_time_seconds", "float"),
+    ("total_deaths", "int"),
+    ("total_items_collected", "int"),
+    ("stories_completed", "str"),
+]
+GAME_COLUMNS = [
+    ("player_name", "str"),
+    ("story_type", "str"),
+    ("final_scene", "str"),
+    ("completed", "bool"),
+    ("scenes_visited", "int"),
+    ("choices_made", "int"),
+    ("deaths", "int"),
+    ("items_collected", "int"),
+    ("start_time", "str"),
+]
+
+
+def iter_global_rows(stats_dir):
+    """Yield the global statistics as a single row"""
+    try:
+        with open(os.path.join(stats_dir, "global_stats.json"), 'r') as f:
+            stats = json.load(f)
+    except (OSError, ValueError):
+        return
+    yield {
+        **stats,
+        "stories_completed": json.dumps(stats.get("stories_completed", {}), sort_keys=True)
+    }
+
+
+def iter_player_files(stats_dir):
+    """Yield the path of every player stats file, one shard at a time"""
+    store = PlayerStatsStore(stats_dir)
+    for shard in sorted(store.shard_dirs()):
+        with os.scandir(shard) as entries:
+            for entry in entries:
+                if entry.name.endswith(".json"):
+                    yield entry.path
+    if os.path.exists(stats_dir):
+        with os.scandir(stats_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith("player_") and entry.name.endswith(".json"):
+                    yield entry.path
+
+
+def iter_player_rows(stats_dir):
+    """Yield one row per player"""
+    for path in iter_player_files(stats_dir):
+        try:
+            with open(path, 'r') as f:
+                player_stats = json.load(f)
+        except (OSError, ValueError):
+            continue
+        yield {
+            **player_stats,
+            "stories_completed": json.dumps(player_stats.get("stories_completed", {}), sort_keys=True)
+        }
+
+
+def iter_game_rows(stats_dir):
+    """Yield one row per finished or abandoned game in the history log"""
+    history_file = os.path.join(stats_dir, "histories.jsonl")
+    if not os.path.exists(history_file):
+        return
+    with open(history_file, 'r') as f:
+        for line in f:
+            try:
+                history = json.loads(line)
+            except ValueError:
+                continue
+            yield {
+                **history,
+                "final_scene": history.get("current_scene"),
+                "scenes_visited": len(history.get("visited_scenes", [])),
+                "choices_made": len(history.get("choices_made", [])),
+            }
+
+
+TABLES = {
+    "global": (GLOBAL_COLUMNS, iter_global_rows),
+    "players": (PLAYER_COLUMNS, iter_player_rows),
+    "games": (GAME_COLUMNS, iter_game_rows),
+}
+
+
+def _value(row, name, kind):
+    """Return a row value converted to its column type"""
+    value = row.get(name)
+    if kind == "str":
+        return "" if value is None else str(value)
+    if kind == "float":
+        return float(value or 0)
+    return int(value or 0)
+
+
+class CsvWriter:
+    def __init__(self, path, columns):
+        self.columns = columns
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([name for name, _ in columns])
+
+    def write(self, row):
+        self.writer.writerow([_value(row, name, kind) for name, kind in self.columns])
+
+    def close(self):
+        self.file.close()
+
+
+class ColumnarWriter:
+    def __init__(self, path, columns, group_size=65536):
+        self.columns = columns
+        self.group_size = group_size
+        self.file = open(path, 'wb')
+        self.row_groups = []
+        self.rows = 0
+        self._reset()
+
+        schema = json.dumps({"columns": columns}).encode("utf-8")
+        self.file.write(MAGIC + struct.pack("<I", len(schema)) + schema)
+
+    def _reset(self):
+        """Start empty column buffers for the next row group"""
+        self.buffers = [[] if kind == "str" else array(ARRAY_TYPES[kind]) for _, kind in self.columns]
+        self.pending = 0
+
+    def write(self, row):
+        for buffer, (name, kind) in zip(self.buffers, self.columns):
+            buffer.append(_value(row, name, kind))
+        self.pending += 1
+        if self.pending >= self.group_size:
+            self._flush()
+
+    def _flush(self):
+        """Write the buffered rows as one row group"""
+        if not self.pending:
+            return
+        self.row_groups.append({"offset": self.file.tell(), "rows": self.pending})
+        self.file.write(struct.pack("<I", self.pending))
+        for buffer, (_, kind) in zip(self.buffers, self.columns):
+            if kind == "str":
+                encoded = [value.encode("utf-8") for value in buffer]
+                offsets = array("I")
+                end = 0
+                for value in encoded:
+                    end += len(value)
+                    offsets.append(end)
+                data = offsets.tobytes() + b"".join(encoded)
+            else:
+                data = buffer.tobytes()
+            self.file.write(struct.pack("<Q", len(data)))
+            self.file.write(data)
+        self.rows += self.pending
+        self._reset()
+
+    def close(self):
+        self._flush()
+        footer_offset = self.file.tell()
+        self.file.write(json.dumps({"rows": self.rows, "row_groups": self.row_groups}).encode("utf-8"))
+        self.file.write(struct.pack("<Q", footer_offset) + MAGIC)
+        self.file.close()
+
+
+def read_columnar(path, columns=None):
+    """Yield the rows of a columnar file as dicts, reading only the wanted columns"""
+    with open(path, 'rb') as f:
+        if f.read(4) != MAGIC:
+            raise ValueError(f"{path} is not a columnar stats file")
+        (schema_length,) = struct.unpack("<I", f.read(4))
+        schema = json.loads(f.read(schema_length))["columns"]
+
+        f.seek(-12, os.SEEK_END)
+        (footer_offset,) = struct.unpack("<Q", f.read(8))
+        f.seek(footer_offset)
+        footer = json.loads(f.read()[:-12])
+        wanted = set(columns or [name for name, _ in schema])
+
+        for group in footer["row_groups"]:
+            f.seek(group["offset"])
+            (rows,) = struct.unpack("<I", f.read(4))
+            values = {}
+            for name, kind in schema:
+                (length,) = struct.unpack("<Q", f.read(8))
+                if name not in wanted:
+                    f.seek(length, os.SEEK_CUR)
+                    continue
+                data = f.read(length)
+                if kind == "str":
+                    offsets = array("I")
+                    offsets.frombytes(data[:rows * 4])
+                    blob = data[rows * 4:]
+                    starts = [0] + offsets.tolist()[:-1]
+                    values[name] = [blob[start:end].decode("utf-8") for start, end in zip(starts, offsets)]
+                else:
+                    column = array(ARRAY_TYPES[kind])
+                    column.frombytes(data)
+                    values[name] = [bool(v) for v in column] if kind == "bool" else column.tolist()
+            for i in range(rows):
+                yield {name: column[i] for name, column in values.items()}
+
+
+def export_table(rows, columns, output_base, formats=FORMATS, group_size=65536):
+    """Stream rows into every requested format in one pass, returning the row count"""
+    writers = []
+    if "csv" in formats:
+        writers.append(CsvWriter(f"{output_base}.csv", columns))
+    if "columnar" in formats:
+        writers.append(ColumnarWriter(f"{output_base}.scol", columns, group_size))
+
+    count = 0
+    try:
+        for row in rows:
+            for writer in writers:
+                writer.write(row)
+            count += 1
+    finally:
+        for writer in writers:
+            writer.close()
+    return count
+
+
+def export_all(stats_dir, output_dir, formats=FORMATS, tables=None):
+    """Export the global, players and games tables, returning rows written per table"""
+    os.makedirs(output_dir, exist_ok=True)
+    counts = {}
+    for table in tables or TABLES:
+        columns, rows = TABLES[table]
+        counts[table] = export_table(rows(stats_dir), columns, os.path.join(output_dir, table), formats)
+    return counts
+
+
+def main():
+    """Command line entry point for the bulk stats export"""
+    parser = argparse.ArgumentParser(description="Export statistics to CSV and columnar files")
+    parser.add_argument("output_dir")
+    parser.add_argument("--stats-dir", default="stats")
+    parser.add_argument("--format", choices=FORMATS, action="append",
+                        help="output format, may be repeated (default: all)")
+    parser.add_argument("--table", choices=list(TABLES), action="append",
+                        help="table to export, may be repeated (default: all)")
+    args = parser.parse_args()
+
+    counts = export_all(args.stats_dir, args.output_dir, args.format or FORMATS, args.table)
+    for table, count in counts.items():
+        print(f"{table}: {count} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,103 +3,163 @@ Stats Manager Module - Handles game statistics
 """
 
 import json
+import logging
 import os
-from rich.console import Console
 
-console = Console()
+from Code.leaderboard_manager import LeaderboardManager
+from Code.player_stats_store import PlayerStatsStore
+from Code.quantile_sketch import game_quantiles, merge_quantiles
+from Code.stats_aggregator import StatsAggregator, game_stats_delta, merge_stats_file, trend_delta
+from Code.think_time import load_think_times, merge_think_times
+from Code.time_series import TimeSeriesStats
+from Code.ui_backends import create_ui_manager
+
+logger = logging.getLogger(__name__)
 
 class StatsManager:
-    def __init__(self):
-        self.stats_file = "stats/global_stats.json"
+    def __init__(self, stats_dir="stats", write_behind=False, max_pending=100, flush_interval=30.0,
+                 ui_manager=None):
+        self.stats_dir = stats_dir
+        self.ui_manager = ui_manager
+        self.stats_file = os.path.join(stats_dir, "global_stats.json")
+        self.history_file = os.path.join(stats_dir, "histories.jsonl")
+        self.think_times_file = os.path.join(stats_dir, "think_times.json")
+        self.leaderboards = LeaderboardManager(os.path.join(stats_dir, "leaderboards.jsonl"))
+        self.player_store = PlayerStatsStore(stats_dir)
+        self.time_series = TimeSeriesStats(os.path.join(stats_dir, "timeseries.bin"))
+        self._cached_stats = None
+        self._cached_mtime = None
+        
+        # Server and batch modes batch global stats writes in memory
+        self.aggregator = None
+        if write_behind:
+            self.aggregator = StatsAggregator(self.stats_file, max_pending, flush_interval, self.time_series,
+                                              self.think_times_file)
+
+    def load_global_stats(self):
+        """Return global stats, re-reading the file only when its mtime changes"""
+        try:
+            stat = os.stat(self.stats_file)
+            mtime = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            mtime = None
+        
+        if mtime != self._cached_mtime:
+            stats = None
+            if mtime is not None:
+                with open(self.stats_file, 'r') as f:
+                    stats = json.load(f)
+            self._cached_stats = stats
+            self._cached_mtime = mtime
+        
+        stats = self._cached_stats
+        if self.aggregator and self.aggregator.pending_games:
+            stats = self.aggregator.pending_view(stats or {})
+        return stats
 
     def show_global_stats(self):
         """Display global statistics across all games"""
-        if not os.path.exists(self.stats_file):
-            console.print("[red]No global statistics found![/red]")
-            console.print("Press Enter to continue...")
-            input()
-            return
-
+        if self.ui_manager is None:
+            self.ui_manager = create_ui_manager()
+        ui_manager = self.ui_manager
         try:
-            with open(self.stats_file, 'r') as f:
-                stats = json.load(f)
+            stats = self.load_global_stats()
             
-            from Code.ui_manager import UIManager
-            ui_manager = UIManager()
-            ui_manager.show_global_stats_display(stats)
+            if stats is None:
+                ui_manager.message("No global statistics found!", "error")
+            else:
+                ui_manager.show_global_stats_display(stats, self.time_series.summary())
             
         except Exception as e:
-            console.print(f"[red]Error reading global statistics: {e}[/red]")
+            ui_manager.message(f"Error reading global statistics: {e}", "error")
         
-        console.print("Press Enter to continue...")
-        input()
+        ui_manager.pause()
 
-    def save_final_stats(self, game_state, play_time):
+    def save_final_stats(self, game_state, play_time, ending=None):
         """Save final game statistics to global stats"""
-        if not os.path.exists("stats"):
-            os.makedirs("stats")
-        
-        # Load existing stats or create new
-        if os.path.exists(self.stats_file):
-            try:
-                with open(self.stats_file, 'r') as f:
-                    stats = json.load(f)
-            except:
-                stats = {}
-        else:
-            stats = {}
+        self.leaderboards.record_completion(game_state, play_time, ending)
         
-        # Update stats
-        stats["total_games"] = stats.get("total_games", 0) + 1
-        stats["total_play_time_seconds"] = stats.get("total_play_time_seconds", 0) + play_time.total_seconds()
-        stats["average_game_time_seconds"] = stats["total_play_time_seconds"] / stats["total_games"]
-        stats["total_deaths"] = stats.get("total_deaths", 0) + game_state["deaths"]
-        stats["total_items_collected"] = stats.get("total_items_collected", 0) + game_state["items_collected"]
-        
-        # Track stories completed
-        if "stories_completed" not in stats:
-            stats["stories_completed"] = {}
+        if self.aggregator:
+            # Trends are batched with the global stats
+            self.aggregator.record(game_state, play_time)
+            return
+        self.record_trend(game_state, play_time)
         
-        story_type = game_state["story_type"]
-        stats["stories_completed"][story_type] = stats["stories_completed"].get(story_type, 0) + 1
+        # Other game processes update the same file
+        try:
+            merge_stats_file(self.stats_file, game_stats_delta(game_state, play_time))
+        except Exception as e:
+            logger.error(f"Error saving statistics: {e}")
+
+    def record_trend(self, game_state, play_time, when=None):
+        """Add a finished game to the minute, hour and day buckets"""
+        try:
+            self.time_series.record(trend_delta(game_stats_delta(game_state, play_time)), when)
+        except Exception as e:
+            logger.error(f"Error saving statistics trends: {e}")
+
+    def record_history(self, game_state, completed):
+        """Append the scene and choice history of a finished or abandoned game"""
+        history = {
+            "player_name": game_state.get("player_name"),
+            "story_type": game_state["story_type"],
+            "current_scene": game_state["current_scene"],
+            "visited_scenes": game_state["visited_scenes"],
+            "choices_made": [{"scene": c["scene"], "choice": c["choice"]} for c in game_state["choices_made"]],
+            "completed": completed,
+            "deaths": game_state.get("deaths", 0),
+            "items_collected": game_state.get("items_collected", 0),
+            "start_time": game_state.get("start_time")
+        }
         
-        # Save updated stats
         try:
-            with open(self.stats_file, 'w') as f:
-                json.dump(stats, f, indent=2)
+            if not os.path.exists(self.stats_dir):
+                os.makedirs(self.stats_dir, exist_ok=True)
+            with open(self.history_file, 'a') as f:
+                f.write(json.dumps(history) + "\n")
         except Exception as e:
-            console.print(f"[red]Error saving statistics: {e}[/red]")
+            logger.error(f"Error saving game history: {e}")
+
+    def record_think_times(self, think_times):
+        """Merge the think-time histograms of a game into the global ones"""
+        if not think_times:
+            return
+        if self.aggregator:
+            # Merged in memory and written with the next flush
+            self.aggregator.record_think_times(think_times)
+            return
+        try:
+            merge_think_times(self.think_times_file, think_times)
+        except Exception as e:
+            logger.error(f"Error saving think times: {e}")
+
+    def think_time_report(self, story_type=None, by_choice=False):
+        """Return think-time percentiles per scene or choice, slowest first"""
+        think_times = load_think_times(self.think_times_file)
+        if self.aggregator:
+            with self.aggregator.lock:
+                think_times.merge(self.aggregator.pending_think_times)
+        return think_times.report(story_type, by_choice=by_choice)
 
     def get_player_stats(self, player_name):
         """Get statistics for a specific player"""
-        player_stats_file = f"stats/player_{player_name}.json"
-        
-        if not os.path.exists(player_stats_file):
-            return None
-        
-        try:
-            with open(player_stats_file, 'r') as f:
-                return json.load(f)
-        except Exception:
-            return None
+        return self.player_store.load(player_name)
 
     def save_player_stats(self, game_state, play_time):
         """Save statistics for individual player"""
-        if not os.path.exists("stats"):
-            os.makedirs("stats")
-        
         player_name = game_state["player_name"]
-        player_stats_file = f"stats/player_{player_name}.json"
         
+        # Another process may be finishing a game of the same player
+        try:
+            with self.player_store.lock(player_name):
+                self._update_player_stats(player_name, game_state, play_time)
+        except Exception as e:
+            logger.error(f"Error saving player statistics: {e}")
+
+    def _update_player_stats(self, player_name, game_state, play_time):
+        """Add one game to a player's stats file; the caller holds the player's lock"""
         # Load existing player stats or create new
-        if os.path.exists(player_stats_file):
-            try:
-                with open(player_stats_file, 'r') as f:
-                    player_stats = json.load(f)
-            except:
-                player_stats = {}
-        else:
-            player_stats = {}
+        player_stats = self.player_store.load(player_name) or {}
         
         # Update player stats
         player_stats["player_name"] = player_name
@@ -115,37 +175,67 @@ class StatsManager:
         story_type = game_state["story_type"]
         player_stats["stories_completed"][story_type] = player_stats["stories_completed"].get(story_type, 0) + 1
         
+        # Sketches of the player's own games, merged into the global ones by rollups
+        merge_quantiles(player_stats.setdefault("quantiles", {}), game_quantiles(game_state, play_time))
+        
         # Save player stats
+        self.player_store.save(player_name, player_stats)
+
+    def rollup_global_stats(self, workers=None):
+        """Rebuild global statistics from every player stats file"""
         try:
-            with open(player_stats_file, 'w') as f:
-                json.dump(player_stats, f, indent=2)
+            stats = self.player_store.rollup(workers)
+            
+            if not os.path.exists(self.stats_dir):
+                os.makedirs(self.stats_dir, exist_ok=True)
+            
+            temp_file = f"{self.stats_file}.{os.getpid()}.tmp"
+            with open(temp_file, 'w') as f:
+                json.dump(stats, f, indent=2)
+            os.replace(temp_file, self.stats_file)
+            
+            logger.info(f"Global statistics rebuilt from {stats['total_players']} players!")
+            return stats
         except Exception as e:
-            console.print(f"[red]Error saving player statistics: {e}[/red]")
+            logger.error(f"Error rebuilding statistics: {e}")
+            return None
 
     def reset_global_stats(self):
         """Reset global statistics (use with caution)"""
         try:
             if os.path.exists(self.stats_file):
                 os.remove(self.stats_file)
-            console.print("[green]Global statistics reset successfully![/green]")
+            logger.info("Global statistics reset successfully!")
+        except Exception as e:
+            logger.error(f"Error resetting statistics: {e}")
+
+    def export_bulk(self, output_dir, formats=("csv", "columnar")):
+        """Stream global, player and game statistics into CSV and columnar files"""
+        from Code.stats_export import export_all
+        try:
+            counts = export_all(self.stats_dir, output_dir, formats)
+            logger.info(f"Exported {counts['players']} players and {counts['games']} games to {output_dir}!")
+            return counts
         except Exception as e:
-            console.print(f"[red]Error resetting statistics: {e}[/red]")
+            logger.error(f"Error exporting statistics: {e}")
+            return None
 
     def export_stats(self, filename):
         """Export statistics to a file"""
         try:
             if not os.path.exists(self.stats_file):
-                console.print("[red]No statistics to export![/red]")
+                logger.error("No statistics to export!")
                 return False
             
             with open(self.stats_file, 'r') as f:
                 stats = json.load(f)
+            stats["trends"] = self.time_series.export()
             
             with open(filename, 'w') as f:
                 json.dump(stats, f, indent=2)
             
-            console.print(f"[green]Statistics exported to {filename}![/green]")
+            logger.info(f"Statistics exported to {filename}!")
             return True
         except Exception as e:
-            console.print(f"[red]Error exporting statistics: {e}[/red]")
+            logger.error(f"Error exporting statistics: {e}")
             return False
\ No newline at end of file
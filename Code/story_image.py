@@ -0,0 +1,349 @@
+"""
+Story Image Module - Every story compiled into one memory-mapped file
+
+The image holds fixed-size records and a string table, little-endian:
+
+    header    b"SIMG", format, story, scene, choice and string counts
+    stories   id, title, description, difficulty, info JSON, first scene, scene count
+    scenes    id, title, description, ending title, extra JSON, flags, first choice, choice count
+    choices   text, next scene, item, death message, ending title, required item,
+              condition JSON, extra JSON, flags
+    strings   end offset of each string, then their UTF-8 bytes
+
+Strings are referred to by their number in the table, NO_STRING when
+absent. Each story's scenes are sorted by id, so a scene is found by
+binary search without building an index. Worker processes map the file
+read-only and build a scene dict only when it is used, so every process
+shares the same physical pages and adding workers costs almost no memory
+for story data. A replaced image is unmapped once the last scenes object
+handed out from it is gone.
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import tracemalloc
+import weakref
+from array import array
+from collections.abc import Mapping
+
+from Code.string_pool import POOL
+
+MAGIC = b"SIMG"
+IMAGE_FORMAT = 1
+NO_STRING = 0xFFFFFFFF
+HEADER = struct.Struct("<4s5I")
+STORY = struct.Struct("<7I")
+SCENE = struct.Struct("<8I")
+CHOICE = struct.Struct("<9I")
+
+ENDING_FLAG = 1
+DEATH_FLAG = 2
+SCENE_STRINGS = ("title", "description", "ending_title")
+CHOICE_STRINGS = ("text", "next_scene", "item", "death_message", "ending_title", "requires_item")
+# Short identifiers that end up in game states, so they are pooled
+POOLED_CHOICE_FIELDS = ("text", "next_scene", "item")
+STORY_INFO_STRINGS = ("title", "description", "difficulty")
+
+
+class StringTable:
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def add(self, value):
+        """Return the number of a string, adding it if it is new"""
+        if value is None:
+            return NO_STRING
+        number = self.ids.get(value)
+        if number is None:
+            number = self.ids[value] = len(self.strings)
+            self.strings.append(value)
+        return number
+
+    def add_json(self, value):
+        return self.add(json.dumps(value, separators=(",", ":"), sort_keys=True)) if value else NO_STRING
+
+
+def _split(record, string_fields, flag_fields):
+    """Split a scene or choice into its string fields, flags and everything else"""
+    strings = {}
+    flags = 0
+    extra = {}
+    for key, value in record.items():
+        if key in string_fields and isinstance(value, str):
+            strings[key] = value
+        elif key in flag_fields and value is True:
+            flags |= flag_fields[key]
+        elif key not in ("choices", "requires"):
+            extra[key] = value
+    return strings, flags, extra
+
+
+def build_image(path, stories):
+    """Write {story id: (info, scenes)} into an image file, returning the record counts"""
+    table = StringTable()
+    story_records, scene_records, choice_records = [], [], []
+
+    for story_id in sorted(stories):
+        info, scenes = stories[story_id]
+        extra_info = {key: value for key, value in info.items() if key not in STORY_INFO_STRINGS}
+        story_records.append(STORY.pack(
+            table.add(story_id), *(table.add(info.get(key)) for key in STORY_INFO_STRINGS),
+            table.add_json(extra_info), len(scene_records), len(scenes)
+        ))
+
+        for scene_id in sorted(scenes, key=lambda scene_id: scene_id.encode("utf-8")):
+            scene = scenes[scene_id]
+            strings, flags, extra = _split(scene, SCENE_STRINGS, {"ending": ENDING_FLAG})
+            choices = scene.get("choices")
+            if choices is None:
+                # Told apart from an empty list of choices
+                extra["no_choices"] = True
+                choices = []
+            scene_records.append(SCENE.pack(
+                table.add(scene_id), *(table.add(strings.get(key)) for key in SCENE_STRINGS),
+                table.add_json(extra), flags, len(choice_records), len(choices)
+            ))
+            for choice in choices:
+                strings, flags, extra = _split(choice, CHOICE_STRINGS, {"ending": ENDING_FLAG, "death": DEATH_FLAG})
+                choice_records.append(CHOICE.pack(
+                    *(table.add(strings.get(key)) for key in CHOICE_STRINGS),
+                    table.add_json(choice.get("requires")), table.add_json(extra), flags
+                ))
+
+    encoded = [value.encode("utf-8") for value in table.strings]
+    offsets = array("I")
+    end = 0
+    for value in encoded:
+        end += len(value)
+        offsets.append(end)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_file = f"{path}.{os.getpid()}.tmp"
+    with open(temp_file, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, IMAGE_FORMAT, len(story_records), len(scene_records),
+                            len(choice_records), len(encoded)))
+        for records in (story_records, scene_records, choice_records):
+            f.write(b"".join(records))
+        f.write(offsets.tobytes())
+        f.write(b"".join(encoded))
+    # Workers that mapped the old image keep it until they reopen
+    os.replace(temp_file, path)
+    return {"stories": len(story_records), "scenes": len(scene_records),
+            "choices": len(choice_records), "strings": len(encoded)}
+
+
+def build_from_manager(story_manager, path):
+    """Compile every story a StoryManager offers into an image"""
+    stories = {}
+    for story_id, info in story_manager.get_available_stories().items():
+        info = dict(info, version=story_manager.get_story_version(story_id),
+                    migrations=story_manager.get_scene_migrations(story_id))
+        stories[story_id] = (info, dict(story_manager.get_story_scenes(story_id)))
+    return build_image(path, stories)
+
+
+class StoryImage:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.signature = (stat.st_mtime_ns, stat.st_size)
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, image_format, story_count, scene_count, choice_count, string_count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or image_format != IMAGE_FORMAT:
+            raise ValueError(f"{path} is not a story image of format {IMAGE_FORMAT}")
+        self.stories_offset = HEADER.size
+        self.scenes_offset = self.stories_offset + story_count * STORY.size
+        self.choices_offset = self.scenes_offset + scene_count * SCENE.size
+        self.offsets_offset = self.choices_offset + choice_count * CHOICE.size
+        self.strings_offset = self.offsets_offset + string_count * 4
+
+        # Only the few story records are read up front
+        self.stories = {}
+        for i in range(story_count):
+            story_id, *info_strings, extra, first_scene, count = STORY.unpack_from(
+                self.data, self.stories_offset + i * STORY.size)
+            info = {key: self.string(number) for key, number in zip(STORY_INFO_STRINGS, info_strings)}
+            info.update(self.json(extra) or {})
+            self.stories[self.string(story_id)] = {"info": info, "first_scene": first_scene, "scene_count": count}
+
+        self._scenes = {}
+        self._live_scenes = 0
+        self.retired = False
+        for story_id, story in self.stories.items():
+            scenes = self._scenes[story_id] = ImageScenes(self, story["first_scene"], story["scene_count"])
+            self._live_scenes += 1
+            # Counts the scenes objects still in use once the image is retired
+            weakref.finalize(scenes, self._scenes_released)
+
+    def scenes(self, story_id):
+        """Return the scenes of a story, or None if the image has no such story"""
+        return self._scenes.get(story_id)
+
+    def _scenes_released(self):
+        self._live_scenes -= 1
+        if self.retired and not self._live_scenes:
+            self.close()
+
+    def retire(self):
+        """Unmap the image as soon as no scenes object from it is in use"""
+        self.retired = True
+        # Only the sessions still playing on it hold its scenes after this
+        self._scenes = {}
+        if not self._live_scenes:
+            self.close()
+
+    def string_bytes(self, number):
+        """Return the UTF-8 bytes of a string in the table"""
+        start = struct.unpack_from("<I", self.data, self.offsets_offset + (number - 1) * 4)[0] if number else 0
+        end = struct.unpack_from("<I", self.data, self.offsets_offset + number * 4)[0]
+        return self.data[self.strings_offset + start:self.strings_offset + end]
+
+    def string(self, number):
+        if number == NO_STRING:
+            return None
+        return self.string_bytes(number).decode("utf-8")
+
+    def json(self, number):
+        return None if number == NO_STRING else json.loads(self.string(number))
+
+    def story_infos(self):
+        """Return the title, description and difficulty of every story in the image"""
+        return {story_id: {key: story["info"][key] for key in STORY_INFO_STRINGS}
+                for story_id, story in self.stories.items()}
+
+    def close(self):
+        if not self.data.closed:
+            self.data.close()
+
+
+class ImageScenes(Mapping):
+    """The scenes of one story in an image, each built from the mapped file when used"""
+
+    # Tells CompiledConditions and SceneTemplates to compile each scene when it is reached
+    lazy = True
+
+    def __init__(self, image, first, count):
+        self.image = image
+        self.first = first
+        self.count = count
+
+    def _record(self, index):
+        return SCENE.unpack_from(self.image.data, self.image.scenes_offset + (self.first + index) * SCENE.size)
+
+    def _find(self, scene_id):
+        """Binary search the story's sorted scene ids, returning the scene's index or None"""
+        if not isinstance(scene_id, str):
+            return None
+        key = scene_id.encode("utf-8")
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            found = self.image.string_bytes(self._record(middle)[0])
+            if found == key:
+                return middle
+            if found < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def __getitem__(self, scene_id):
+        index = self._find(scene_id)
+        if index is None:
+            raise KeyError(scene_id)
+        image = self.image
+        _, *strings, extra, flags, first_choice, choice_count = self._record(index)
+
+        scene = {key: image.string(number) for key, number in zip(SCENE_STRINGS, strings) if number != NO_STRING}
+        scene.update(image.json(extra) or {})
+        if flags & ENDING_FLAG:
+            scene["ending"] = True
+        if not scene.pop("no_choices", False):
+            scene["choices"] = [self._choice(first_choice + i) for i in range(choice_count)]
+        return scene
+
+    def _choice(self, number):
+        image = self.image
+        *strings, requires, extra, flags = CHOICE.unpack_from(image.data, image.choices_offset + number * CHOICE.size)
+        choice = {}
+        for key, value in zip(CHOICE_STRINGS, strings):
+            if value != NO_STRING:
+                value = image.string(value)
+                choice[key] = POOL.intern(value) if key in POOLED_CHOICE_FIELDS else value
+        if requires != NO_STRING:
+            choice["requires"] = image.json(requires)
+        choice.update(image.json(extra) or {})
+        if flags & ENDING_FLAG:
+            choice["ending"] = True
+        if flags & DEATH_FLAG:
+            choice["death"] = True
+        return choice
+
+    def __contains__(self, scene_id):
+        return self._find(scene_id) is not None
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield POOL.intern(self.image.string(self._record(index)[0]))
+
+    def __len__(self):
+        return self.count
+
+
+def measure_story_memory(image_path=None):
+    """Return the Python heap bytes a process holds after reading every scene of every story"""
+    from Code.story_manager import StoryManager
+    tracemalloc.start()
+    story_manager = StoryManager(image_path=image_path)
+    for story_id in story_manager.get_available_stories():
+        scenes = story_manager.get_story_scenes(story_id)
+        for scene_id in scenes:
+            scenes[scene_id]
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return held
+
+
+def main():
+    """Command line entry point to build, inspect and measure story images"""
+    parser = argparse.ArgumentParser(description="Compile all stories into one memory-mapped image")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="compile the installed stories")
+    build.add_argument("path")
+    info = subparsers.add_parser("info", help="list the stories in an image")
+    info.add_argument("path")
+    measure = subparsers.add_parser("measure", help="compare per-process story memory with and without the image")
+    measure.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        from Code.story_manager import StoryManager
+        counts = build_from_manager(StoryManager(), args.path)
+        print(f"Compiled {counts['stories']} stories ({counts['scenes']} scenes, "
+              f"{counts['choices']} choices, {counts['strings']} strings) into {args.path}!")
+    elif args.command == "info":
+        image = StoryImage(args.path)
+        for story_id, story in image.stories.items():
+            print(f"{story_id} v{story['info'].get('version', 1)}: {story['info']['title']} ({story['scene_count']} scenes)")
+        print(f"{os.path.getsize(args.path)} bytes")
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        # A fresh process for each, so neither sees strings pooled by the other
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            private = pool.submit(measure_story_memory).result()
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            mapped = pool.submit(measure_story_memory, os.path.abspath(args.path)).result()
+        print(f"Per worker: {private} bytes of story data loaded privately, "
+              f"{mapped} bytes with the image mapped ({os.path.getsize(args.path)} bytes shared)")
+
+
+if __name__ == "__main__":
+    main()
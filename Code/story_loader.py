@@ -0,0 +1,253 @@
+"""
+Story Loader Module - Loads stories from scene files and hot-reloads them
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import time
+
+from Code.choice_conditions import CompiledConditions, ConditionError
+from Code.scene_templates import TemplateError, compile_scene
+from Code.string_pool import POOL
+
+logger = logging.getLogger(__name__)
+
+STORY_INFO_FILE = "story.json"
+WORD_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+class StoryIndex:
+    """Link graph, word index and broken-link report of one story, updated per scene"""
+
+    def __init__(self):
+        self.links = {}
+        self.backlinks = {}
+        self.scene_words = {}
+        self.words = {}
+        self.broken_links = {}
+
+    def _scene_text(self, scene):
+        """Return the searchable text of a scene"""
+        parts = [scene.get("title", ""), scene.get("description", "")]
+        parts.extend(choice.get("text", "") for choice in scene.get("choices", []))
+        return " ".join(parts).lower()
+
+    def _remove(self, scene_id):
+        """Drop everything a scene contributed to the index"""
+        for target in self.links.pop(scene_id, ()):
+            self.backlinks.get(target, set()).discard(scene_id)
+        for word in self.scene_words.pop(scene_id, ()):
+            scene_ids = self.words.get(word)
+            if scene_ids is not None:
+                scene_ids.discard(scene_id)
+                if not scene_ids:
+                    del self.words[word]
+        self.broken_links.pop(scene_id, None)
+
+    def _add(self, scene_id, scene):
+        """Index the links and words of a scene"""
+        targets = {choice["next_scene"] for choice in scene.get("choices", []) if "next_scene" in choice}
+        self.links[scene_id] = targets
+        for target in targets:
+            self.backlinks.setdefault(target, set()).add(scene_id)
+
+        words = set(WORD_PATTERN.findall(self._scene_text(scene)))
+        self.scene_words[scene_id] = words
+        for word in words:
+            self.words.setdefault(word, set()).add(scene_id)
+
+    def _check_links(self, scene_id, scenes):
+        """Recompute the broken links of one scene"""
+        missing = sorted(target for target in self.links.get(scene_id, ()) if target not in scenes)
+        if missing:
+            self.broken_links[scene_id] = missing
+        else:
+            self.broken_links.pop(scene_id, None)
+
+    def update(self, scenes, changed, removed):
+        """Re-index changed and removed scenes against the new scenes dict"""
+        for scene_id in list(changed) + list(removed):
+            self._remove(scene_id)
+        for scene_id in changed:
+            self._add(scene_id, scenes[scene_id])
+
+        # Only scenes linking to an added or removed scene can change status
+        to_check = set(changed)
+        for scene_id in list(changed) + list(removed):
+            to_check.update(self.backlinks.get(scene_id, ()))
+        for scene_id in to_check:
+            if scene_id in scenes:
+                self._check_links(scene_id, scenes)
+
+    def search(self, query):
+        """Return the ids of scenes containing every word of the query"""
+        words = WORD_PATTERN.findall(query.lower())
+        if not words:
+            return set()
+        result = set(self.words.get(words[0], set()))
+        for word in words[1:]:
+            result &= self.words.get(word, set())
+        return result
+
+
+class StoryLoader:
+    def __init__(self, stories_dir="stories"):
+        self.stories_dir = stories_dir
+        self.stories = {}
+
+    def _file_signature(self, entry):
+        """Return what identifies a version of a file without reading it"""
+        stat = entry.stat()
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _read_json(self, path):
+        """Read a JSON file, returning None if it is missing or invalid"""
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Error reading {path}: {e}")
+            return None
+
+    def reload(self):
+        """Pick up changed story files, return a report of what changed per story"""
+        if not os.path.isdir(self.stories_dir):
+            return {}
+
+        reports = {}
+        seen = set()
+        for entry in os.scandir(self.stories_dir):
+            if entry.is_dir() and os.path.exists(os.path.join(entry.path, STORY_INFO_FILE)):
+                seen.add(entry.name)
+                report = self._reload_story(entry.name, entry.path)
+                if report:
+                    reports[entry.name] = report
+
+        for story_id in set(self.stories) - seen:
+            del self.stories[story_id]
+            reports[story_id] = {"removed_story": True}
+
+        return reports
+
+    def _reload_story(self, story_id, story_path):
+        """Re-parse only the files of one story whose signature changed"""
+        old = self.stories.get(story_id)
+        signatures = {}
+        changed_files = []
+        for entry in os.scandir(story_path):
+            if entry.name.endswith(".json"):
+                signatures[entry.name] = signature = self._file_signature(entry)
+                if not old or old["signatures"].get(entry.name) != signature:
+                    changed_files.append(entry.name)
+
+        old_signatures = old["signatures"] if old else {}
+        removed_files = [name for name in old_signatures if name not in signatures]
+        if old and not changed_files and not removed_files:
+            return None
+
+        # A new scenes dict per version: sessions holding the old one keep it
+        info = old["info"] if old else {}
+        scenes = dict(old["scenes"]) if old else {}
+        changed, removed = [], []
+
+        for name in changed_files:
+            data = self._read_json(os.path.join(story_path, name))
+            if data is None:
+                # Keep the last good version of a file that fails to parse
+                signatures[name] = old_signatures.get(name)
+                continue
+            if name == STORY_INFO_FILE:
+                info = data
+                continue
+            scene_id = name[:-5]
+            try:
+                compile_scene(data)
+                CompiledConditions({scene_id: data})
+            except (TemplateError, ConditionError) as e:
+                logger.error(f"Error in {os.path.join(story_path, name)}: {e}")
+                # Keep the last good version, or leave a new scene out until it is fixed
+                signatures[name] = old_signatures.get(name)
+                continue
+            if scenes.get(scene_id) != data:
+                scenes[scene_id] = POOL.intern_value(data)
+                changed.append(scene_id)
+
+        for name in removed_files:
+            scene_id = name[:-5]
+            if name != STORY_INFO_FILE and scene_id in scenes:
+                del scenes[scene_id]
+                removed.append(scene_id)
+
+        index = old["index"] if old else StoryIndex()
+        index.update(scenes, changed, removed)
+
+        self.stories[story_id] = {
+            "info": info,
+            "scenes": scenes,
+            "version": (old["version"] + 1) if old else 1,
+            "signatures": signatures,
+            "index": index,
+        }
+        return {"version": self.stories[story_id]["version"], "changed": changed, "removed": removed}
+
+    def story_infos(self):
+        """Return the title, description and difficulty of every loaded story"""
+        return {story_id: story["info"] for story_id, story in self.stories.items()}
+
+    def export_story(self, story_id, info, scenes):
+        """Write a story as one file per scene, e.g. to start editing a built-in story"""
+        story_path = os.path.join(self.stories_dir, story_id)
+        os.makedirs(story_path, exist_ok=True)
+        with open(os.path.join(story_path, STORY_INFO_FILE), 'w') as f:
+            json.dump(info, f, indent=2)
+        for scene_id, scene in scenes.items():
+            with open(os.path.join(story_path, f"{scene_id}.json"), 'w') as f:
+                json.dump(scene, f, indent=2)
+
+    def watch(self, interval=1.0, on_reload=None):
+        """Poll the stories directory and reload changed scenes until interrupted"""
+        try:
+            while True:
+                reports = self.reload()
+                if reports and on_reload:
+                    on_reload(reports)
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+
+
+def main():
+    """Command line entry point to export or watch file-based stories"""
+    parser = argparse.ArgumentParser(description="Export or watch file-based stories")
+    parser.add_argument("command", choices=["export", "watch"])
+    parser.add_argument("--stories-dir", default="stories")
+    parser.add_argument("--interval", type=float, default=1.0)
+    args = parser.parse_args()
+
+    from Code.story_manager import StoryManager
+    story_manager = StoryManager(args.stories_dir)
+
+    if args.command == "export":
+        for story_id, info in story_manager.get_available_stories().items():
+            story_manager.loader.export_story(story_id, info, story_manager.get_story_scenes(story_id))
+        print(f"Stories exported to {args.stories_dir}!")
+        return
+
+    def show_report(reports):
+        for story_id, report in reports.items():
+            if report.get("removed_story"):
+                print(f"{story_id}: story removed")
+                continue
+            broken = story_manager.loader.stories[story_id]["index"].broken_links
+            print(f"{story_id} v{report['version']}: {len(report['changed'])} changed, "
+                  f"{len(report['removed'])} removed, {len(broken)} scenes with broken links")
+
+    print(f"Watching {args.stories_dir} for changes (Ctrl+C to stop)...")
+    story_manager.loader.watch(args.interval, show_report)
+
+
+if __name__ == "__main__":
+    main()
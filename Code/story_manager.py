@@ -2,9 +2,63 @@
 Story Manager Module - Handles story data and scenes
 """
 
+import os
+
+from Code.choice_conditions import CompiledConditions
+from Code.scene_templates import SceneTemplates
+from Code.story_image import StoryImage
+from Code.story_loader import StoryLoader
+from Code.story_pack import PackLibrary
+from Code.string_pool import POOL
+
 class StoryManager:
+    def __init__(self, stories_dir="stories", packs_dir="packs", image_path=None):
+        # Installed story packs override the built-in stories, and stories
+        # found in stories_dir override both. A compiled story image replaces
+        # all of them: workers sharing it don't load their own copies
+        self.loader = StoryLoader(stories_dir)
+        self.packs = PackLibrary(packs_dir)
+        self.image = StoryImage(image_path) if image_path else None
+        if self.image is None:
+            self.loader.reload()
+            self.packs.scan()
+        self._builtin_scenes = None
+        self._conditions = {}
+        self._templates = {}
+
+    def reload_stories(self):
+        """Pick up edited story files and new packs, return what changed per story"""
+        if self.image is not None:
+            return self._reload_image()
+        self.packs.scan()
+        return self.loader.reload()
+
+    def _reload_image(self):
+        """Map a newly built story image, if the file was replaced"""
+        try:
+            stat = os.stat(self.image.path)
+        except FileNotFoundError:
+            return {}
+        if (stat.st_mtime_ns, stat.st_size) == self.image.signature:
+            return {}
+        # Sessions holding scenes of the old image keep it mapped until they let go
+        old_image, self.image = self.image, StoryImage(self.image.path)
+        self._conditions.clear()
+        self._templates.clear()
+        old_image.retire()
+        return {story_id: {"image": True} for story_id in self.image.stories}
+
     def get_available_stories(self):
         """Return available stories information"""
+        if self.image is not None:
+            return self.image.story_infos()
+        stories = self._get_builtin_stories()
+        stories.update(self.packs.story_infos())
+        stories.update(self.loader.story_infos())
+        return stories
+
+    def _get_builtin_stories(self):
+        """Return information about the built-in stories"""
         return {
             "castle": {
                 "title": "The Enchanted Castle",
@@ -151,13 +205,67 @@ class StoryManager:
 
     def get_story_scenes(self, story_type):
         """Return scenes for the specified story type"""
-        stories = {
-            "castle": self._get_castle_scenes(),
-            "forest": self._get_forest_scenes(),
-            "space": self._get_space_scenes()
-        }
+        if self.image is not None:
+            scenes = self.image.scenes(story_type)
+            return scenes if scenes is not None else {}
+        
+        if story_type in self.loader.stories:
+            return self.loader.stories[story_type]["scenes"]
         
-        return stories.get(story_type, {})
+        pack_scenes = self.packs.get_scenes(story_type)
+        if pack_scenes is not None:
+            return pack_scenes
+        
+        # Built once and pooled, so sessions share the story's strings
+        if self._builtin_scenes is None:
+            self._builtin_scenes = POOL.intern_value({
+                "castle": self._get_castle_scenes(),
+                "forest": self._get_forest_scenes(),
+                "space": self._get_space_scenes()
+            })
+        
+        return self._builtin_scenes.get(story_type, {})
+
+    def _story_info(self, story_type):
+        """Return the info of an image, file-based story or pack manifest, or {}"""
+        if self.image is not None:
+            story = self.image.stories.get(story_type)
+            return story["info"] if story else {}
+        if story_type in self.loader.stories:
+            return self.loader.stories[story_type]["info"]
+        pack = self.packs.packs.get(story_type)
+        return pack["manifest"] if pack else {}
+
+    def get_story_version(self, story_type):
+        """Return the content version of a story (1 for built-in stories)"""
+        return int(self._story_info(story_type).get("version", 1))
+
+    def get_scene_migrations(self, story_type):
+        """Return {version: {old scene id: new scene id or None}} for a story"""
+        migrations = self._story_info(story_type).get("migrations", {})
+        return {int(version): remap for version, remap in migrations.items()}
+
+    def get_choice_conditions(self, story_type):
+        """Return the compiled choice conditions of a story, compiled once per version"""
+        scenes = self.get_story_scenes(story_type)
+        cached = self._conditions.get(story_type)
+        if cached is None or cached[0] is not scenes:
+            cached = self._conditions[story_type] = (scenes, CompiledConditions(scenes))
+        return cached[1]
+
+    def get_scene_templates(self, story_type):
+        """Return the compiled text templates of a story, compiled once per version"""
+        scenes = self.get_story_scenes(story_type)
+        cached = self._templates.get(story_type)
+        if cached is None or cached[0] is not scenes:
+            cached = self._templates[story_type] = (scenes, SceneTemplates(scenes))
+        return cached[1]
+
+    def search_scenes(self, story_type, query):
+        """Return ids of scenes in a file-based story that contain every query word"""
+        if story_type not in self.loader.stories:
+            return set()
+        return self.loader.stories[story_type]["index"].search(query)
 
     def _get_castle_scenes(self):
         """Return castle story scenes"""
@@ -0,0 +1,249 @@
+"""
+Story Pack Module - Single-file story archives with random-access scenes
+
+A pack is a zip archive holding:
+
+    manifest.json   id, title, description, difficulty, version, scene count
+    index.json      scene id -> [offset, length] inside scenes.bin
+    scenes.bin      every scene as zlib-compressed JSON, stored uncompressed
+                    in the zip so a scene can be read by seeking to it
+
+Listing packs only needs their manifests, which are cached by file mtime
+and size in packs/.manifests, so installed packs cost nothing at startup.
+A pack's index is read when it is first played, and each scene when it is
+first reached.
+"""
+
+import argparse
+import json
+import logging
+import os
+import struct
+import zipfile
+import zlib
+from collections.abc import Mapping
+
+from Code.string_pool import POOL
+
+logger = logging.getLogger(__name__)
+
+PACK_EXTENSION = ".storypack"
+PACK_FORMAT = 1
+MANIFEST_FILE = "manifest.json"
+INDEX_FILE = "index.json"
+SCENES_FILE = "scenes.bin"
+# Fixed part of a zip local file header, see the zip APPNOTE section 4.3.7
+LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+
+
+def build_pack(path, story_id, info, scenes, version=1):
+    """Write a story into a pack file"""
+    # Packs are only read lazily, so broken conditions and templates are caught here
+    from Code.choice_conditions import CompiledConditions
+    from Code.scene_templates import SceneTemplates
+    CompiledConditions(scenes)
+    SceneTemplates(scenes)
+
+    blob = bytearray()
+    index = {}
+    for scene_id, scene in scenes.items():
+        data = zlib.compress(json.dumps(scene, separators=(",", ":")).encode("utf-8"))
+        index[scene_id] = [len(blob), len(data)]
+        blob += data
+
+    manifest = {
+        "format": PACK_FORMAT,
+        "id": story_id,
+        "title": info.get("title", story_id.title()),
+        "description": info.get("description", ""),
+        "difficulty": info.get("difficulty", "Unknown"),
+        "version": version,
+        "scenes": len(index),
+        "start_scene": f"{story_id}_start",
+        # Scene renames of each version, used to migrate older saves
+        "migrations": info.get("migrations", {}),
+    }
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_file = f"{path}.{os.getpid()}.tmp"
+    with zipfile.ZipFile(temp_file, 'w') as archive:
+        archive.writestr(MANIFEST_FILE, json.dumps(manifest, indent=2), zipfile.ZIP_DEFLATED)
+        archive.writestr(INDEX_FILE, json.dumps(index), zipfile.ZIP_DEFLATED)
+        archive.writestr(SCENES_FILE, bytes(blob), zipfile.ZIP_STORED)
+    os.replace(temp_file, path)
+    return manifest
+
+
+def read_manifest(path):
+    """Read only the manifest of a pack"""
+    with zipfile.ZipFile(path) as archive:
+        manifest = json.loads(archive.read(MANIFEST_FILE))
+    if manifest.get("format") != PACK_FORMAT:
+        raise ValueError(f"unsupported pack format {manifest.get('format')!r}")
+    return manifest
+
+
+class PackScenes(Mapping):
+    """The scenes of a pack, each read from disk the first time it is used"""
+
+    # Tells CompiledConditions to compile each scene when it is reached
+    lazy = True
+
+    def __init__(self, path):
+        self.path = path
+        with zipfile.ZipFile(path) as archive:
+            self.index = json.loads(archive.read(INDEX_FILE))
+            member = archive.getinfo(SCENES_FILE)
+        if member.compress_type != zipfile.ZIP_STORED:
+            raise ValueError(f"{SCENES_FILE} must be stored uncompressed")
+
+        with open(path, 'rb') as f:
+            f.seek(member.header_offset)
+            header = LOCAL_HEADER.unpack(f.read(LOCAL_HEADER.size))
+        # The data follows the local header, its file name and extra field
+        self.data_offset = member.header_offset + LOCAL_HEADER.size + header[-2] + header[-1]
+        self._scenes = {}
+
+    def __getitem__(self, scene_id):
+        scene = self._scenes.get(scene_id)
+        if scene is None:
+            offset, length = self.index[scene_id]
+            with open(self.path, 'rb') as f:
+                f.seek(self.data_offset + offset)
+                data = f.read(length)
+            scene = self._scenes[scene_id] = POOL.intern_value(json.loads(zlib.decompress(data)))
+        return scene
+
+    def __contains__(self, scene_id):
+        return scene_id in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def loaded(self):
+        """Return how many scenes have been read so far"""
+        return len(self._scenes)
+
+
+class PackLibrary:
+    def __init__(self, packs_dir="packs"):
+        self.packs_dir = packs_dir
+        self.cache_file = os.path.join(packs_dir, ".manifests")
+        self.packs = {}
+        self._scenes = {}
+        self._cache = None
+
+    def _read_cache(self):
+        """Load the manifests cached by earlier runs"""
+        self._cache = {}
+        try:
+            with open(self.cache_file, 'r') as f:
+                self._cache = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def _write_cache(self):
+        temp_file = f"{self.cache_file}.{os.getpid()}.tmp"
+        try:
+            with open(temp_file, 'w') as f:
+                json.dump(self._cache, f)
+            os.replace(temp_file, self.cache_file)
+        except OSError as e:
+            logger.error(f"Error writing pack manifest cache: {e}")
+
+    def scan(self):
+        """Find installed packs, opening only those added or changed since the last scan"""
+        if self._cache is None:
+            self._read_cache()
+        if not os.path.isdir(self.packs_dir):
+            self.packs = {}
+            return self.packs
+
+        packs = {}
+        changed = False
+        seen = set()
+        for entry in os.scandir(self.packs_dir):
+            if not entry.name.endswith(PACK_EXTENSION):
+                continue
+            seen.add(entry.name)
+            stat = entry.stat()
+            signature = [stat.st_mtime_ns, stat.st_size]
+            cached = self._cache.get(entry.name)
+            if not cached or cached["signature"] != signature:
+                try:
+                    cached = {"signature": signature, "manifest": read_manifest(entry.path)}
+                except Exception as e:
+                    logger.error(f"Error reading story pack {entry.name}: {e}")
+                    continue
+                self._cache[entry.name] = cached
+                changed = True
+            packs[cached["manifest"]["id"]] = {"path": entry.path, **cached}
+
+        for name in set(self._cache) - seen:
+            del self._cache[name]
+            changed = True
+        if changed:
+            self._write_cache()
+
+        self.packs = packs
+        return packs
+
+    def story_infos(self):
+        """Return the title, description and difficulty of every pack"""
+        return {
+            story_id: {key: pack["manifest"][key] for key in ("title", "description", "difficulty")}
+            for story_id, pack in self.packs.items()
+        }
+
+    def get_scenes(self, story_id):
+        """Return the lazily read scenes of a pack, or None if there is no such pack"""
+        pack = self.packs.get(story_id)
+        if pack is None:
+            return None
+        key = (pack["path"], tuple(pack["signature"]))
+        scenes = self._scenes.get(story_id)
+        if scenes is None or scenes[0] != key:
+            # A replaced pack gets a new scenes object; running sessions keep the old one
+            scenes = self._scenes[story_id] = (key, PackScenes(pack["path"]))
+        return scenes[1]
+
+
+def main():
+    """Command line entry point to build and inspect story packs"""
+    parser = argparse.ArgumentParser(description="Build and inspect story packs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="pack an installed story")
+    build.add_argument("story")
+    build.add_argument("--packs-dir", default="packs")
+    build.add_argument("--version", type=int, help="pack version (default: the story's version)")
+    listing = subparsers.add_parser("list", help="list installed packs")
+    listing.add_argument("--packs-dir", default="packs")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        from Code.story_manager import StoryManager
+        story_manager = StoryManager(packs_dir=args.packs_dir)
+        stories = story_manager.get_available_stories()
+        if args.story not in stories:
+            print(f"Unknown story: {args.story}")
+            return
+        path = os.path.join(args.packs_dir, f"{args.story}{PACK_EXTENSION}")
+        info = dict(stories[args.story], migrations=story_manager.get_scene_migrations(args.story))
+        manifest = build_pack(path, args.story, info, dict(story_manager.get_story_scenes(args.story)),
+                              args.version or story_manager.get_story_version(args.story))
+        print(f"Packed {manifest['scenes']} scenes into {path}!")
+        return
+
+    for story_id, pack in PackLibrary(args.packs_dir).scan().items():
+        manifest = pack["manifest"]
+        print(f"{story_id} v{manifest['version']}: {manifest['title']} "
+              f"({manifest['scenes']} scenes) - {pack['path']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+String Pool Module - Shares repeated story strings between stories and sessions
+"""
+
+import argparse
+import json
+import tracemalloc
+from datetime import datetime
+
+# Game state fields whose values come from story content and repeat across
+# sessions; player names and timestamps are unique and are left alone. Game
+# states only share strings already pooled by a story, so loaded saves never
+# grow the pool
+SCENE_FIELDS = ("story_type", "current_scene")
+LIST_FIELDS = ("inventory", "visited_scenes")
+CHOICE_FIELDS = ("scene", "choice")
+
+# Hot reloads add the edited texts of a story without dropping the old ones;
+# past this many strings the pool starts over. Strings already shared stay
+# shared, only new copies stop matching them
+MAX_STRINGS = 500000
+
+
+class StringPool:
+    def __init__(self, max_strings=MAX_STRINGS):
+        self._strings = {}
+        self.max_strings = max_strings
+
+    def __len__(self):
+        return len(self._strings)
+
+    def intern(self, value):
+        """Return the pooled copy of a string, adding it if it is new"""
+        if type(value) is not str:
+            return value
+        strings = self._strings
+        pooled = strings.get(value)
+        if pooled is None:
+            if len(strings) >= self.max_strings:
+                strings.clear()
+            pooled = strings[value] = value
+        return pooled
+
+    def get(self, value):
+        """Return the pooled copy of a string if there is one, else the string itself"""
+        if type(value) is not str:
+            return value
+        return self._strings.get(value, value)
+
+    def intern_value(self, value):
+        """Intern every string in a nested structure of dicts and lists"""
+        if isinstance(value, dict):
+            return {self.intern(k): self.intern_value(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.intern_value(v) for v in value]
+        return self.intern(value)
+
+    def intern_scenes(self, scenes):
+        """Intern all keys and strings of a story's scenes"""
+        return self.intern_value(scenes)
+
+    def intern_game_state(self, game_state):
+        """Replace story strings in a game state with their pooled copies, in place"""
+        intern = self.get
+        for field in SCENE_FIELDS:
+            if field in game_state:
+                game_state[field] = intern(game_state[field])
+        for field in LIST_FIELDS:
+            if field in game_state:
+                game_state[field] = [intern(v) for v in game_state[field]]
+        if "choices_made" in game_state:
+            for entry in game_state["choices_made"]:
+                if isinstance(entry, dict):
+                    for field in CHOICE_FIELDS:
+                        if field in entry:
+                            entry[field] = intern(entry[field])
+        return game_state
+
+
+# The pool shared by StoryManager, GameLogic and SaveManager
+POOL = StringPool()
+
+
+def measure_session_memory(sessions=10000, choices=30):
+    """Return bytes used by loaded sessions without and with interning"""
+    from Code.story_manager import StoryManager
+    scenes = StoryManager().get_story_scenes("castle")
+    scene_ids = [scene_id for scene_id, scene in scenes.items() if scene.get("choices")]
+
+    # A long castle session, serialized like a save file
+    template = {
+        "player_name": "Player",
+        "story_type": "castle",
+        "current_scene": scene_ids[0],
+        "inventory": ["golden key", "magic flower", "silver dagger"],
+        "visited_scenes": scene_ids,
+        "choices_made": [
+            {
+                "scene": scene_ids[i % len(scene_ids)],
+                "choice": scenes[scene_ids[i % len(scene_ids)]]["choices"][0]["text"],
+                "timestamp": datetime.now().isoformat()
+            }
+            for i in range(choices)
+        ],
+        "deaths": 0,
+        "saves_used": 0,
+        "start_time": datetime.now().isoformat(),
+        "items_collected": 3
+    }
+    encoded = json.dumps(template)
+
+    results = {}
+    for label, use_pool in (("plain", False), ("interned", True)):
+        pool = StringPool()
+        pool.intern_scenes(scenes)
+        tracemalloc.start()
+        loaded = []
+        for _ in range(sessions):
+            state = json.loads(encoded)
+            loaded.append(pool.intern_game_state(state) if use_pool else state)
+        results[label] = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del loaded
+    return results
+
+
+def main():
+    """Report the memory saved by interning per 10k concurrent sessions"""
+    parser = argparse.ArgumentParser(description="Measure session memory with and without string interning")
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--choices", type=int, default=30)
+    args = parser.parse_args()
+
+    results = measure_session_memory(args.sessions, args.choices)
+    saved = results["plain"] - results["interned"]
+    scale = 10000 / args.sessions
+    print(f"Without interning: {results['plain'] * scale / 1e6:.1f} MB per 10k sessions")
+    print(f"With interning:    {results['interned'] * scale / 1e6:.1f} MB per 10k sessions")
+    print(f"Saved:             {saved * scale / 1e6:.1f} MB per 10k sessions "
+          f"({saved / results['plain']:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,13 +4,45 @@ Tests for Interactive Story Generator - CS50P Final Project
 """
 
 import pytest
+import csv
+import io
 import json
 import os
+import random
+import shutil
+import subprocess
+import sys
 import tempfile
 from datetime import datetime, timedelta
 from Code.story_manager import StoryManager
+from rich.console import Console
 from Code.ui_manager import UIManager
 from Code.stats_manager import StatsManager
+from Code.leaderboard_manager import LeaderboardManager
+from Code.save_index import SaveIndex
+from Code.player_stats_store import PlayerStatsStore
+from Code.choice_analytics import ChoiceAnalytics
+from Code.string_pool import POOL, StringPool
+from Code.choice_conditions import CompiledConditions, ConditionError, StateMask
+from Code.state_history import StateHistory
+from Code.load_runner import run_load_test
+from Code.memory_profiler import MemoryProfiler, deep_size
+from Code.frame_renderer import FrameRenderer, measure_rendering
+from Code.ui_backends import create_ui_manager, quantile_rows
+from Code.session_recorder import load_recording, play_recording
+from Code import main as game_main
+from Code.time_series import TimeSeriesStats
+from Code.stats_export import export_table, read_columnar, PLAYER_COLUMNS
+from Code.save_manager import SaveManager
+from Code.story_image import build_from_manager, build_image
+from Code.story_pack import build_pack, PackScenes
+from Code.quantile_sketch import TDigest, game_quantiles, merge_quantiles, percentiles
+import Code.save_migration as save_migration
+from Code.save_migration import migrate_files, migrate_saves, migrate_state, story_plan, story_plans
+from Code.save_retention import RetentionPass, RetentionPolicy, load_policy
+from Code.scene_templates import TemplateError, compile_template
+from Code.session_manager import GameSession, SessionManager
+from Code.think_time import BUCKET_COUNT, MAX_MILLISECONDS, ThinkTimes, bucket_index, bucket_range, load_think_times
 
 # Create instances for reuse
 story_manager = StoryManager()
@@ -362,5 +394,1066 @@ def test_item_requirements():
                         # Required item should be obtainable in the story
                         assert required_item in available_items, f"Required item {required_item} not obtainable in {story_type}"
 
+def test_leaderboards():
+    """Test that leaderboards keep the best K completions and persist them"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        log_file = os.path.join(temp_dir, "leaderboards.jsonl")
+        leaderboards = LeaderboardManager(log_file, size=3)
+        
+        for minutes, turns in [(10, 5), (3, 9), (7, 2), (12, 1), (5, 4)]:
+            game_state = {
+                "player_name": f"Player {minutes}",
+                "story_type": "castle",
+                "choices_made": ["choice"] * turns
+            }
+            leaderboards.record_completion(game_state, timedelta(minutes=minutes), "castle_magic_end")
+        
+        fastest = leaderboards.get_leaderboard("story", "castle")
+        assert [e["value"] for e in fastest] == [180, 300, 420], "fastest leaderboard incorrect"
+        fewest = leaderboards.get_leaderboard("ending", "castle_magic_end", "turns")
+        assert [e["value"] for e in fewest] == [1, 2, 4], "fewest turns leaderboard incorrect"
+        
+        # A new instance rebuilds the same boards from the log
+        reloaded = LeaderboardManager(log_file, size=3)
+        assert reloaded.get_leaderboard("story", "castle") == fastest, "leaderboard not persisted"
+        assert reloaded.get_best("story", "castle", "turns")["value"] == 1, "best entry incorrect"
+        
+        reloaded.compact()
+        compacted = LeaderboardManager(log_file, size=3)
+        assert compacted.get_leaderboard("story", "castle") == fastest, "compaction lost entries"
+        
+        # Compacting merges in what other processes appended since this one loaded
+        game_state = {"player_name": "Other", "story_type": "castle", "choices_made": []}
+        reloaded.record_completion(game_state, timedelta(minutes=1))
+        compacted.compact()
+        assert LeaderboardManager(log_file, size=3).get_best("story", "castle")["player_name"] == "Other", \
+            "compaction dropped another process's entry"
+        assert compacted.get_best("story", "castle")["player_name"] == "Other", "merged entries not picked up"
+
+def test_save_index_paging():
+    """Test that the save index pages, sorts and filters saves"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        saves_dir = os.path.join(temp_dir, "saves")
+        os.makedirs(saves_dir)
+        
+        # Saves written directly to disk are picked up on the first load
+        for i in range(25):
+            save_data = {
+                "player_name": "Alice" if i % 2 else "Bob",
+                "story_type": "castle" if i < 20 else "space",
+                "visited_scenes": ["castle_start"],
+                "save_timestamp": datetime(2024, 1, 1, 12, i).isoformat()
+            }
+            with open(os.path.join(saves_dir, f"save_{i}.json"), 'w') as f:
+                json.dump(save_data, f)
+        
+        index = SaveIndex(saves_dir)
+        entries, total_pages = index.query(page=1, page_size=10)
+        assert total_pages == 3, "wrong number of pages"
+        assert entries[0][0] == "save_24.json", "newest save should come first"
+        
+        entries, total_pages = index.query(page=3, page_size=10)
+        assert len(entries) == 5, "last page should hold the remaining saves"
+        
+        entries, _ = index.query(sort="player", page_size=30)
+        assert [e[1]["player_name"] for e in entries][:12] == ["Alice"] * 12, "saves not sorted by player"
+        
+        entries, _ = index.query(player="bob", story="space", page_size=30)
+        assert [e[0] for e in entries] == ["save_24.json", "save_22.json", "save_20.json"], "filter incorrect"
+        
+        # Updates and removals are persisted for the next index instance
+        os.remove(os.path.join(saves_dir, "save_24.json"))
+        index.remove("save_24.json")
+        index.update("save_99.json", {"player_name": "Carol", "story_type": "forest"})
+        reloaded = SaveIndex(saves_dir)
+        reloaded.load()
+        assert "save_24.json" not in reloaded.entries, "removed save still indexed"
+        assert reloaded.entries["save_99.json"]["player_name"] == "Carol", "updated save not indexed"
+
+def test_sharded_player_stats_and_rollup():
+    """Test sharded player stats files and the parallel global rollup"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store = PlayerStatsStore(temp_dir)
+        
+        # Unsafe names are encoded and stay inside the players directory
+        for name in ["../evil", "a/b", ".", "Zoë", "CON", "nul.txt", "Com1"]:
+            path = store.path_for(name)
+            assert os.path.dirname(os.path.dirname(path)) == store.players_dir, f"unsafe path for {name!r}"
+            assert store.decode_name(os.path.basename(path)) == name, f"name {name!r} not round-tripped"
+            assert os.path.basename(path).split(".")[0].upper() not in ("CON", "NUL", "COM1"), f"reserved name {name!r}"
+        long_names = ["é" * 300, "é" * 300 + "x"]
+        paths = [store.path_for(name) for name in long_names]
+        assert paths[0] != paths[1] and all(len(os.path.basename(p).encode()) < 255 for p in paths), "long name not shortened"
+        assert store.decode_name(os.path.basename(paths[0])) is None, "hashed name decoded"
+        
+        manager = StatsManager(temp_dir)
+        for i in range(20):
+            game_state = {
+                "player_name": f"Player {i % 5}",
+                "story_type": "castle" if i % 2 else "forest",
+                "deaths": 1,
+                "items_collected": 2
+            }
+            manager.save_player_stats(game_state, timedelta(minutes=1))
+        
+        assert manager.get_player_stats("Player 3")["games_played"] == 4, "player stats not accumulated"
+        
+        stats = manager.rollup_global_stats(workers=2)
+        assert stats["total_players"] == 5, "rollup player count incorrect"
+        assert stats["total_games"] == 20, "rollup game count incorrect"
+        assert stats["total_deaths"] == 20, "rollup deaths incorrect"
+        assert stats["stories_completed"] == {"castle": 10, "forest": 10}, "rollup stories incorrect"
+        assert stats["average_game_time_seconds"] == 60, "rollup average incorrect"
+        
+        with open(manager.stats_file, 'r') as f:
+            assert json.load(f)["total_games"] == 20, "rollup not written to global stats"
+
+def test_write_behind_stats_aggregator():
+    """Test that write-behind stats are batched in memory and flushed"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        manager = StatsManager(temp_dir, write_behind=True, max_pending=3, flush_interval=None)
+        game_state = {
+            "player_name": "Test Player",
+            "story_type": "space",
+            "deaths": 1,
+            "items_collected": 2,
+            "choices_made": ["choice1"]
+        }
+        
+        manager.save_final_stats(game_state, timedelta(minutes=2))
+        manager.save_final_stats(game_state, timedelta(minutes=4))
+        assert not os.path.exists(manager.stats_file), "stats written before the batch was full"
+        assert not os.path.exists(manager.time_series.path), "trends written per game"
+        
+        # Pending increments are still visible in the cached view
+        stats = manager.load_global_stats()
+        assert stats["total_games"] == 2, "pending games missing from view"
+        assert stats["average_game_time_seconds"] == 180, "pending average incorrect"
+        
+        manager.save_final_stats(game_state, timedelta(minutes=6))
+        with open(manager.stats_file, 'r') as f:
+            stats = json.load(f)
+        assert stats["total_games"] == 3, "batch not flushed at size threshold"
+        assert stats["stories_completed"]["space"] == 3, "stories not flushed"
+        assert TimeSeriesStats(manager.time_series.path).summary()["last_hour"]["games"] == 3, "trends not flushed"
+        
+        manager.save_final_stats(game_state, timedelta(minutes=1))
+        manager.aggregator.close()
+        assert manager.load_global_stats()["total_games"] == 4, "pending stats not flushed on close"
+
+def test_choice_analytics():
+    """Test choice heatmaps and drop-off funnels built from histories"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        manager = StatsManager(temp_dir)
+        castle_start = story_manager.get_story_scenes("castle")["castle_start"]
+        first, second = castle_start["choices"][0], castle_start["choices"][1]
+        
+        for i in range(4):
+            choice = first if i < 3 else second
+            game_state = {
+                "story_type": "castle",
+                "current_scene": choice["next_scene"],
+                "visited_scenes": ["castle_start", choice["next_scene"]],
+                "choices_made": [{"scene": "castle_start", "choice": choice["text"], "timestamp": ""}]
+            }
+            manager.record_history(game_state, completed=(i == 0))
+        
+        analytics = ChoiceAnalytics(chunk_size=2)
+        analytics.add_path(manager.history_file)
+        report = analytics.report()
+        
+        assert report["sessions"] == 4, "session count incorrect"
+        assert report["completed"] == 1, "completed count incorrect"
+        start = report["stories"]["castle"]["castle_start"]
+        assert start["choices"] == {first["text"]: 3, second["text"]: 1}, "choice frequencies incorrect"
+        assert start["reached"] == 4 and start["quit"] == 0, "start scene funnel incorrect"
+        
+        quit_scene = report["stories"]["castle"][first["next_scene"]]
+        assert quit_scene["quit"] == 2 and quit_scene["reached"] == 3, "quit counts incorrect"
+        assert abs(quit_scene["drop_off"] - 2 / 3) < 1e-9, "drop-off rate incorrect"
+        
+        choice_matrix, _, _ = analytics.matrices()
+        assert choice_matrix.sum() == 4, "choice matrix total incorrect"
+        
+        # Damaged entries are skipped without losing the good ones
+        analytics.add_session({"story_type": "castle",
+                               "choices_made": ["junk", {"choice": "x"}, {"scene": "castle_start", "choice": first["text"]}]})
+        assert analytics.report()["stories"]["castle"]["castle_start"]["choices"][first["text"]] == 4, \
+            "damaged history not skipped"
+        
+        # Another story with the same scene id is counted on its own
+        analytics.add_session({"story_type": "forest", "visited_scenes": ["castle_start"], "current_scene": "castle_start",
+                               "choices_made": [{"scene": "castle_start", "choice": first["text"]}]})
+        stories = analytics.report()["stories"]
+        assert stories["forest"]["castle_start"] == {"reached": 1, "quit": 1, "drop_off": 1.0, "session_share_quit": 1 / 6,
+                                                     "choices": {"(other)": 1}}, "scene ids of stories merged"
+        assert stories["castle"]["castle_start"]["reached"] == 4 and stories["castle"]["castle_start"]["quit"] == 0
+
+def test_story_hot_reload():
+    """Test that edited story files are re-indexed scene by scene"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        builtin = StoryManager(os.path.join(temp_dir, "missing"))
+        manager = StoryManager(temp_dir)
+        castle_info = builtin.get_available_stories()["castle"]
+        manager.loader.export_story("castle", castle_info, builtin.get_story_scenes("castle"))
+        
+        assert manager.reload_stories()["castle"]["version"] == 1, "exported story not loaded"
+        old_scenes = manager.get_story_scenes("castle")
+        assert old_scenes == builtin.get_story_scenes("castle"), "file-based story differs from built-in"
+        assert manager.reload_stories() == {}, "unchanged story reloaded"
+        
+        # Edit one scene and delete another
+        story_path = os.path.join(temp_dir, "castle")
+        edited = dict(old_scenes["castle_start"], description="A dragon guards the drawbridge.")
+        with open(os.path.join(story_path, "castle_start.json"), 'w') as f:
+            json.dump(edited, f)
+        os.utime(os.path.join(story_path, "castle_start.json"), ns=(1, 1))
+        target = old_scenes["castle_start"]["choices"][0]["next_scene"]
+        os.remove(os.path.join(story_path, f"{target}.json"))
+        
+        report = manager.reload_stories()["castle"]
+        assert report["changed"] == ["castle_start"], "only the edited scene should be re-parsed"
+        assert report["removed"] == [target], "removed scene not reported"
+        
+        new_scenes = manager.get_story_scenes("castle")
+        assert "dragon" in new_scenes["castle_start"]["description"], "edit not applied"
+        assert target in old_scenes and "dragon" not in old_scenes["castle_start"]["description"], "old version changed"
+        
+        index = manager.loader.stories["castle"]["index"]
+        assert target in index.broken_links.get("castle_start", []), "broken link not detected"
+        assert manager.search_scenes("castle", "dragon drawbridge") == {"castle_start"}, "search index not updated"
+
+def test_string_interning():
+    """Test that loaded sessions share story strings through the pool"""
+    scenes = story_manager.get_story_scenes("castle")
+    choice = scenes["castle_start"]["choices"][0]
+    assert story_manager.get_story_scenes("castle") is scenes, "built-in scenes rebuilt on every call"
+    
+    # Strings parsed from a save are equal but not identical to the story's
+    game_state = json.loads(json.dumps({
+        "player_name": "Test Player",
+        "story_type": "castle",
+        "current_scene": "castle_start",
+        "inventory": ["golden key"],
+        "visited_scenes": ["castle_start"],
+        "choices_made": [{"scene": "castle_start", "choice": choice["text"], "timestamp": "2024-01-01T00:00:00"}]
+    }))
+    assert game_state["choices_made"][0]["choice"] is not choice["text"]
+    
+    POOL.intern_game_state(game_state)
+    assert game_state["choices_made"][0]["choice"] is choice["text"], "choice text not interned"
+    assert game_state["visited_scenes"][0] is POOL.intern("castle_start"), "scene id not interned"
+    assert game_state["choices_made"][0]["timestamp"] == "2024-01-01T00:00:00", "timestamp changed"
+    
+    size = len(POOL)
+    POOL.intern_game_state(dict(game_state, player_name="Someone Else", inventory=["edited out item"],
+                                visited_scenes=["castle_removed_scene"]))
+    assert len(POOL) == size, "game states should not grow the pool"
+    
+    # Reloads can't grow it forever
+    pool = StringPool(max_strings=3)
+    for text in ("a", "b", "c", "d"):
+        pool.intern(text)
+    assert len(pool) == 1 and pool.get("d") == "d", "pool not bounded"
+
+def test_choice_conditions():
+    """Test that choice conditions compile into correct bitmask predicates"""
+    scenes = {
+        "vault": {
+            "description": "A locked vault.",
+            "choices": [
+                {"text": "Walk away", "next_scene": "hall"},
+                {"text": "Unlock it", "next_scene": "treasure", "requires_item": "golden key"},
+                {"text": "Use the map", "next_scene": "treasure", "requires": {
+                    "all": [{"visited": "library"}, {"any": [{"item": "map"}, {"not": {"deaths": {"max": 1}}}]}]
+                }},
+                {"text": "Sneak in", "next_scene": "treasure", "requires": {
+                    "not": {"any": [{"item": "lantern"}, {"deaths": {"min": 1}}]}
+                }}
+            ]
+        }
+    }
+    conditions = CompiledConditions(scenes)
+    
+    def available(inventory, visited, deaths):
+        game_state = {"inventory": inventory, "visited_scenes": visited, "deaths": deaths}
+        mask = conditions.available_choices("vault", scenes["vault"], game_state)
+        return [i for i in range(4) if mask >> i & 1]
+    
+    assert available([], [], 0) == [0, 3], "only unconditioned choices should be available"
+    assert available(["golden key", "lantern"], [], 0) == [0, 1], "item conditions incorrect"
+    assert available(["map"], ["library"], 1) == [0, 2], "nested any/all incorrect"
+    assert available([], ["library"], 2) == [0, 2], "negated death range incorrect"
+    assert available([], ["library"], 1) == [0], "death condition incorrect"
+    
+    # A game's mask follows items and scenes as they are added and rewound
+    game_state = {"inventory": [], "visited_scenes": ["library"], "deaths": 0, "current_scene": "vault",
+                  "items_collected": 0, "choices_made": []}
+    history = StateHistory(game_state)
+    state_mask = StateMask(game_state)
+    history.record()
+    assert conditions.available_choices("vault", scenes["vault"], game_state, state_mask) == 0b1001
+    game_state["inventory"].append("map")
+    history.record()
+    assert conditions.available_choices("vault", scenes["vault"], game_state, state_mask) == 0b1101, "added item missed"
+    assert history.rewind(1)
+    state_mask.reset()
+    game_state["inventory"].append("golden key")
+    assert conditions.available_choices("vault", scenes["vault"], game_state, state_mask) == 0b1011, "rewound item kept"
+    assert state_mask.mask == conditions.state_mask(game_state), "incremental mask differs from a full scan"
+    
+    assert conditions.requirement("vault", 1) == "golden key", "requires_item description incorrect"
+    assert conditions.requirement("vault", 0) is None, "unconditioned choice has a requirement"
+    
+    for requires in ({"magic": 1}, {"deaths": 2}, {"deaths": {"min": "1"}}, {"all": {"item": "x"}},
+                     {"any": "x"}, {"item": ["x"]}, {"not": 3}):
+        with pytest.raises(ConditionError):
+            CompiledConditions({"s": {"choices": [{"text": "x", "next_scene": "y", "requires": requires}]}})
+    
+    # A story file with a broken condition is left out when it is loaded
+    with tempfile.TemporaryDirectory() as temp_dir:
+        story_dir = os.path.join(temp_dir, "tale")
+        os.makedirs(story_dir)
+        with open(os.path.join(story_dir, "story.json"), 'w') as f:
+            json.dump({"title": "Tale"}, f)
+        with open(os.path.join(story_dir, "tale_start.json"), 'w') as f:
+            json.dump({"description": "Go", "choices": [{"text": "x", "next_scene": "y", "requires": {"deaths": 2}}]}, f)
+        manager = StoryManager(temp_dir, "missing")
+        assert "tale_start" not in manager.get_story_scenes("tale"), "scene with a broken condition loaded"
+        manager.get_choice_conditions("tale")
+
+def test_undo_rewind():
+    """Test that rewinding restores earlier game states"""
+    game_state = {
+        "current_scene": "castle_start",
+        "inventory": [],
+        "visited_scenes": [],
+        "choices_made": [],
+        "deaths": 0,
+        "saves_used": 0,
+        "items_collected": 0
+    }
+    history = StateHistory(game_state)
+    assert not history.can_rewind(), "nothing should be undoable before any turn"
+    
+    # Play three turns: pick up an item, die, then move on
+    turns = [("castle_hall", "golden key", False), ("castle_poison", None, True), ("castle_library", None, False)]
+    for next_scene, item, death in turns:
+        history.record()
+        game_state["visited_scenes"].append(game_state["current_scene"])
+        game_state["choices_made"].append({"scene": game_state["current_scene"], "choice": next_scene})
+        if item:
+            game_state["inventory"].append(item)
+            game_state["items_collected"] += 1
+        if death:
+            game_state["deaths"] += 1
+        game_state["current_scene"] = next_scene
+    history.record()
+    game_state["saves_used"] = 1
+    
+    assert history.rewind(1), "rewind by one turn failed"
+    assert game_state["current_scene"] == "castle_poison", "current scene not restored"
+    assert game_state["deaths"] == 1, "deaths not restored"
+    
+    history.record()
+    assert history.rewind(2), "rewind by two turns failed"
+    assert game_state["current_scene"] == "castle_start", "rewind went to the wrong turn"
+    assert game_state["inventory"] == [] and game_state["items_collected"] == 0, "inventory not restored"
+    assert game_state["choices_made"] == [] and game_state["visited_scenes"] == [], "history lists not restored"
+    assert game_state["saves_used"] == 1, "saves_used should not be rewound"
+    
+    history.record()
+    assert not history.rewind(1), "rewind past the first turn should fail"
+
+def test_load_test_harness():
+    """Test that the load test runs workers and reports on every game"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        report = run_load_test(workers=2, games=3, players=2, workdir=temp_dir, write_behind=True)
+        
+        assert report["games"] == 6, "expected game count incorrect"
+        assert report["errors"] == 0, "workers reported errors"
+        assert report["lost_saves"] == 0, "save files missing"
+        assert report["lost_global_updates"] == 0, "global stats updates lost"
+        assert report["lost_player_updates"] == 0, "player stats updates lost"
+        assert report["save_latency_ms"]["p50"] <= report["save_latency_ms"]["max"], "latency percentiles out of order"
+
+def test_memory_profiler():
+    """Test that memory profiling reports growth per field and dumps reports"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        profiler = MemoryProfiler(every=5, dump_dir=temp_dir)
+        game_state = {"player_name": "Test/Player", "story_type": "castle", "start_time": "2024-01-01T00:00:00",
+                      "choices_made": [], "inventory": []}
+        
+        profiler.start(game_state)
+        for turn in range(12):
+            profiler.on_turn(game_state)
+            game_state["choices_made"].append({"scene": "castle_start", "choice": "x" * 100,
+                                               "timestamp": datetime.now().isoformat()})
+        reports = profiler.finish(game_state)
+        
+        assert [r["turn"] for r in reports] == [5, 10, 12], "reports not taken every N turns"
+        assert reports[0]["fields"]["choices_made"]["size_diff"] > 0, "choices_made growth not reported"
+        assert reports[0]["fields"]["inventory"]["size_diff"] == 0, "inventory should not grow"
+        assert all("site" in site for site in reports[0]["sites"]), "allocation sites missing"
+        
+        dumps = os.listdir(temp_dir)
+        assert dumps == ["Test_Player_2024-01-01T00-00-00.memory.json"], "report not dumped with a safe name"
+
+def test_frame_renderer():
+    """Test that frames are sent in one write with only the changed lines"""
+    output = io.StringIO()
+    renderer = FrameRenderer(output, width=40, height=40, color_system=None)
+    
+    renderer.present("Title\nFirst line\nSecond line\n")
+    first = output.getvalue()
+    assert first.startswith("\x1b[H\x1b[2J") and "Second line" in first, "first frame not fully drawn"
+    
+    renderer.present("Title\nFirst line\nChanged line\n")
+    second = output.getvalue()[len(first):]
+    assert "Changed line" in second and "Title" not in second and "First line" not in second, "unchanged lines resent"
+    assert renderer.stats()["writes_per_frame"] == 1, "frame not sent in a single write"
+    
+    renderer.invalidate()
+    renderer.present("Title\n")
+    assert output.getvalue().endswith("\x1b[2JTitle\x1b[2;1H\x1b[J"), "invalidated frame not fully redrawn"
+    
+    # A resized terminal moves the old frame, so the next one is drawn in full
+    sizes = [os.terminal_size((40, 40))]
+    original_size = shutil.get_terminal_size
+    shutil.get_terminal_size = lambda *args: sizes[-1]
+    try:
+        resized = FrameRenderer(io.StringIO(), color_system=None)
+        resized.present("Title\n")
+        resized.present("Title\n")
+        assert "\x1b[2J" not in resized.stream.stream.getvalue().split("Title", 1)[1], "unchanged frame redrawn"
+        sizes.append(os.terminal_size((60, 30)))
+        resized.present("Title\n")
+        assert resized.stream.stream.getvalue().count("\x1b[2J") == 2, "resized terminal not fully redrawn"
+        assert (resized.width, resized.height) == (60, 30), "new terminal size not picked up"
+    finally:
+        shutil.get_terminal_size = original_size
+    
+    results = measure_rendering(turns=20)
+    assert results["differential"]["bytes_per_frame"] < results["clear_and_reprint"]["bytes_per_frame"], "no bytes saved"
+    assert results["differential"]["writes_per_frame"] == 1, "differential renderer used several writes"
+
+def test_ui_backends():
+    """Test that plain and JSON-lines backends play a scene without importing rich"""
+    story_manager = StoryManager()
+    scene = story_manager.get_story_scenes("castle")["castle_start"]
+    game_state = {"current_scene": "castle_start", "inventory": [], "deaths": 0}
+    
+    output = io.StringIO()
+    plain = create_ui_manager("plain", output=output, input_stream=io.StringIO("x\n2\n\n"))
+    plain.show_scene(scene, game_state, {1: "key"})
+    assert scene["choices"][0]["text"] in output.getvalue(), "plain backend did not show choices"
+    assert "(requires key)" in output.getvalue(), "plain backend did not show locked choices"
+    assert plain.ask("Your choice", choices=["1", "2"]) == "2", "plain backend accepted an invalid choice"
+    assert plain.ask("Name", default="Anon") == "Anon", "plain backend ignored the default"
+    
+    output = io.StringIO()
+    jsonl = create_ui_manager("jsonl", output=output, input_stream=io.StringIO("1\n"))
+    jsonl.show_scene(scene, game_state, {1: "key"})
+    assert jsonl.ask("Your choice") == "1"
+    events = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [e["event"] for e in events] == ["scene", "prompt"], "unexpected JSON events"
+    assert events[0]["choices"][1]["requires"] == "key", "locked choice missing from scene event"
+    
+    with pytest.raises(ValueError):
+        create_ui_manager("curses")
+    
+    ending = story_manager.get_story_scenes("castle")["castle_magic_end"]
+    jsonl.show_ending(ending, dict(game_state, player_name="Bob", visited_scenes=[], choices_made=[],
+                                   items_collected=0, saves_used=0, start_time=datetime.now().isoformat()))
+    assert json.loads(output.getvalue().splitlines()[-1])["description"] == ending["description"]
+    
+    # Choosing a backend only imports that backend, whatever else the game imports
+    code = ("import sys; import Code.main; from Code.ui_backends import create_ui_manager; create_ui_manager('plain'); "
+            "print(any(m == 'rich' or m.startswith('rich.') or m == 'Code.ui_manager' for m in sys.modules))")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=root)
+    assert result.stdout.strip() == "False", "plain backend imported rich"
+
+def test_session_record_and_playback():
+    """Test that a recorded session, including save and load, plays back at full speed"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        original_cwd = os.getcwd()
+        os.chdir(temp_dir)
+        try:
+            answers = "1\nBob\n1\n1\nS\nmysave\n\nQ\ny\n2\n1\nQ\ny\n4\n"
+            ui_manager = create_ui_manager("plain", output=io.StringIO(), input_stream=io.StringIO(answers))
+            game_main.main(["--ui", "plain", "--record", "session.jsonl"], ui_manager=ui_manager)
+            
+            header, inputs = load_recording("session.jsonl")
+            assert header["ui"] == "plain" and len(inputs) == 14, "inputs not recorded"
+            assert inputs[5] == {**inputs[5], "method": "ask", "prompt": "Enter save name", "answer": "mysave"}
+            assert all(record["think"] >= 0 for record in inputs), "think time missing"
+            
+            os.remove("saves/mysave.json")
+            report = play_recording("session.jsonl")
+            assert report["inputs"] == report["recorded_inputs"] == 14, "playback stopped early"
+            assert report["prompt_mismatches"] == 0, "playback diverged from the recording"
+            assert os.path.exists("saves/mysave.json"), "save flow not played back"
+            assert report["by_prompt"]["Choose save to load"]["count"] == 1, "load flow not timed"
+            assert report["latency_ms"]["max"] >= report["latency_ms"]["p50"] > 0
+        finally:
+            os.chdir(original_cwd)
+
+def test_time_series_stats():
+    """Test that minute, hour and day buckets roll over and persist"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "timeseries.bin")
+        series = TimeSeriesStats(path)
+        now = 1_700_000_000
+        game = {"games": 1, "play_time_seconds": 600, "deaths": 2, "items_collected": 1}
+        
+        series.record(game, now - 2 * 3600)
+        series.record(game, now - 30)
+        series.record(game, now)
+        
+        # A fresh instance reads the same buckets back from disk
+        reloaded = TimeSeriesStats(path)
+        summary = reloaded.summary(now)
+        assert summary["last_hour"]["games"] == 2, "minute buckets wrong"
+        assert summary["last_day"]["games"] == 3, "hour buckets wrong"
+        assert summary["last_hour"]["average_game_time_seconds"] == 600
+        assert summary["games_per_hour"][-1] == 2 and summary["games_per_hour"][-3] == 1
+        assert os.path.getsize(path) < 8 * 1024, "time series not stored compactly"
+        
+        # Buckets older than the ring are reused, not kept
+        reloaded.record(game, now + 3600 * 48)
+        hours = reloaded.trend("hour", now=now + 3600 * 48)
+        assert len(hours) == 48 and sum(h["games"] for h in hours) == 1, "expired hour buckets kept"
+        # A late write for a period its bucket has moved past is dropped
+        reloaded.record(game, now)
+        assert sum(h["games"] for h in reloaded.trend("hour", now=now + 3600 * 48)) == 1, "newer bucket overwritten"
+        
+        stats_manager = StatsManager(temp_dir)
+        game_state = {"story_type": "castle", "deaths": 1, "items_collected": 0, "player_name": "A",
+                      "choices_made": [], "visited_scenes": []}
+        stats_manager.save_final_stats(game_state, timedelta(minutes=5))
+        export_file = os.path.join(temp_dir, "export.json")
+        assert stats_manager.export_stats(export_file)
+        with open(export_file, 'r') as f:
+            exported = json.load(f)
+        assert exported["trends"]["minute"][-1]["games"] == 1, "trends missing from export"
+
+def test_streaming_stats_export():
+    """Test that players and games stream into matching CSV and columnar files"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        stats_manager = StatsManager(temp_dir)
+        for i in range(25):
+            game_state = {"player_name": f"player,{i % 10}", "story_type": "castle", "current_scene": "castle_start",
+                          "deaths": i % 3, "items_collected": 1, "visited_scenes": ["castle_start"],
+                          "choices_made": [], "start_time": datetime.now().isoformat()}
+            stats_manager.save_final_stats(game_state, timedelta(minutes=i))
+            stats_manager.save_player_stats(game_state, timedelta(minutes=i))
+            stats_manager.record_history(game_state, completed=i % 2 == 0)
+        
+        output_dir = os.path.join(temp_dir, "export")
+        counts = stats_manager.export_bulk(output_dir)
+        assert counts == {"global": 1, "players": 10, "games": 25}, "wrong row counts"
+        
+        with open(os.path.join(output_dir, "players.csv"), newline='') as f:
+            csv_rows = list(csv.DictReader(f))
+        columnar_rows = list(read_columnar(os.path.join(output_dir, "players.scol")))
+        assert [r["player_name"] for r in csv_rows] == [r["player_name"] for r in columnar_rows]
+        assert sum(r["games_played"] for r in columnar_rows) == 25
+        
+        games = list(read_columnar(os.path.join(output_dir, "games.scol"), ["completed", "deaths"]))
+        assert set(games[0]) == {"completed", "deaths"}, "unwanted columns read"
+        assert sum(g["completed"] for g in games) == 13 and sum(g["deaths"] for g in games) == 24
+        
+        # Small row groups give the same rows back
+        rows = ({"player_name": f"p{i}", "games_played": i} for i in range(10))
+        export_table(rows, PLAYER_COLUMNS, os.path.join(temp_dir, "small"), ["columnar"], group_size=3)
+        assert [r["games_played"] for r in read_columnar(os.path.join(temp_dir, "small.scol"))] == list(range(10))
+
+def test_chunked_saves_share_history():
+    """Test that saves share history chunks and deleting saves frees them"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        original_cwd = os.getcwd()
+        os.chdir(temp_dir)
+        try:
+            save_manager = SaveManager()
+            history = [{"scene": f"castle_{i}", "choice": f"choice {i}", "timestamp": f"2024-01-01T00:00:{i % 60:02d}"}
+                       for i in range(100)]
+            base = {"player_name": "Alice", "story_type": "castle", "current_scene": "castle_start",
+                    "inventory": [], "deaths": 0, "saves_used": 0, "items_collected": 0,
+                    "start_time": "2024-01-01T00:00:00"}
+            
+            short = {**base, "visited_scenes": [h["scene"] for h in history[:80]], "choices_made": history[:80]}
+            long = {**base, "player_name": "Bob", "visited_scenes": [h["scene"] for h in history],
+                    "choices_made": [dict(h, timestamp="2025") for h in history]}
+            save_manager.write_save(short, "short")
+            chunks_after_one = save_manager.chunks.usage()["chunks"]
+            save_manager.write_save(long, "long")
+            
+            # The first 64 entries of both lists are shared; only the tails are new
+            assert save_manager.chunks.usage()["chunks"] == chunks_after_one + 4, "shared prefixes stored twice"
+            
+            loaded = save_manager.read_save("long.json")
+            assert loaded["choices_made"] == long["choices_made"], "choices not restored"
+            assert loaded["visited_scenes"] == long["visited_scenes"], "visited scenes not restored"
+            assert save_manager.index.query()[0][0][1]["scenes_visited"] == 100
+            
+            # Chunks only the deleted save used are collected, shared ones stay
+            assert save_manager.delete_save("long.json")
+            removed, _ = save_manager.collect_garbage(grace_seconds=0)
+            assert removed == 4, "unreferenced chunks not collected"
+            assert save_manager.read_save("short.json")["choices_made"] == short["choices_made"]
+            
+            # Saves written before the chunk store still load and can be converted
+            with open("saves/legacy.json", 'w') as f:
+                json.dump(short, f)
+            assert save_manager.read_save("legacy.json")["visited_scenes"] == short["visited_scenes"]
+            assert save_manager.migrate_saves() == 1
+            assert save_manager.chunks.usage()["chunks"] == chunks_after_one, "migrated save not deduplicated"
+        finally:
+            os.chdir(original_cwd)
+
+def test_garbage_collection_sees_rewritten_saves():
+    """Test that chunks of a save compacted by another writer survive collection"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        original_cwd = os.getcwd()
+        os.chdir(temp_dir)
+        try:
+            save_manager = SaveManager()
+            base = {"player_name": "Alice", "story_type": "castle", "current_scene": "castle_start",
+                    "inventory": [], "deaths": 0, "saves_used": 0, "items_collected": 0,
+                    "start_time": "2024-01-01T00:00:00"}
+            save_manager.write_save(dict(base, visited_scenes=["castle_start"], choices_made=[]), "other")
+            history = [f"castle_scene_{i}" for i in range(50)]
+            with open("saves/old.json", 'w') as f:
+                json.dump(dict(base, visited_scenes=history, choices_made=[]), f)
+            save_manager.index.load()
+            assert not save_manager.index.entries["old.json"]["chunked"]
+
+            # Another writer moves the old save into the chunk store
+            assert RetentionPass("saves", RetentionPolicy(), grace_seconds=0).run()["compacted"] == 1
+            for _, path, _, _ in save_manager.chunks.iter_chunks():
+                os.utime(path, (0, 0))
+
+            assert save_manager.delete_save("other.json")
+            assert save_manager.index.entries["old.json"]["chunked"], "index did not follow the other writer"
+            assert save_manager.read_save("old.json")["visited_scenes"] == history, "live chunks collected"
+        finally:
+            os.chdir(original_cwd)
+
+def test_story_packs():
+    """Test that packs are listed from manifests and scenes are read on demand"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        packs_dir = os.path.join(temp_dir, "packs")
+        builtin = StoryManager(os.path.join(temp_dir, "stories"), packs_dir)
+        scenes = dict(builtin.get_story_scenes("castle"))
+        scenes = {scene_id.replace("castle", "ruins"): json.loads(json.dumps(scene).replace("castle_", "ruins_"))
+                  for scene_id, scene in scenes.items()}
+        scenes["ruins_hall"]["choices"][0]["requires_item"] = "lantern"
+        info = {"title": "The Ruins", "description": "A packed story", "difficulty": "Hard"}
+        build_pack(os.path.join(packs_dir, "ruins.storypack"), "ruins", info, scenes)
+        
+        story_manager = StoryManager(os.path.join(temp_dir, "stories"), packs_dir)
+        assert story_manager.get_available_stories()["ruins"]["title"] == "The Ruins", "pack not listed"
+        assert os.path.exists(os.path.join(packs_dir, ".manifests")), "manifests not cached"
+        
+        pack_scenes = story_manager.get_story_scenes("ruins")
+        assert isinstance(pack_scenes, PackScenes) and pack_scenes.loaded() == 0, "scenes read before play"
+        assert "ruins_start" in pack_scenes and pack_scenes.loaded() == 0, "membership read a scene"
+        assert pack_scenes["ruins_hall"] == scenes["ruins_hall"], "scene read at wrong offset"
+        assert pack_scenes.loaded() == 1, "more than one scene read"
+        
+        # Conditions of a packed story compile scene by scene
+        conditions = story_manager.get_choice_conditions("ruins")
+        game_state = {"inventory": [], "visited_scenes": [], "deaths": 0}
+        assert not conditions.available_choices("ruins_hall", pack_scenes["ruins_hall"], game_state) & 1, \
+            "pack condition not applied"
+        assert conditions.requirement("ruins_hall", 0) == "lantern"
+        assert story_manager.get_story_scenes("ruins") is pack_scenes, "pack scenes not shared"
+
+def test_parallel_save_migration():
+    """Test that saves follow scene renames across story versions"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        original_cwd = os.getcwd()
+        os.chdir(temp_dir)
+        try:
+            builtin = StoryManager("missing", "missing")
+            scenes = dict(builtin.get_story_scenes("castle"))
+            # Version 2 renamed castle_hall; version 3 removed castle_garden
+            scenes["castle_great_hall"] = scenes.pop("castle_hall")
+            del scenes["castle_garden"]
+            info = dict(builtin.get_available_stories()["castle"], version=3,
+                        migrations={"2": {"castle_hall": "castle_great_hall"}, "3": {"castle_garden": None}})
+            builtin.loader.stories_dir = "stories"
+            builtin.loader.export_story("castle", info, scenes)
+            
+            save_manager = SaveManager()
+            base = {"player_name": "Alice", "story_type": "castle", "inventory": [], "deaths": 0,
+                    "saves_used": 0, "items_collected": 0, "start_time": "2024-01-01T00:00:00"}
+            for i in range(20):
+                save_manager.write_save(dict(base, current_scene="castle_hall" if i % 2 else "castle_garden",
+                                             visited_scenes=["castle_start", "castle_garden", "castle_hall"],
+                                             choices_made=[{"scene": "castle_hall", "choice": "Go up"}]), f"old_{i}")
+            save_manager.write_save(dict(base, current_scene="castle_start", story_version=3,
+                                         visited_scenes=["castle_start"], choices_made=[]), "current")
+            lost = dict(base, story_type="lost", current_scene="lost_cave", visited_scenes=["lost_cave"], choices_made=[])
+            save_manager.write_save(lost, "lost")
+            
+            # Saves of a story that isn't installed are left as they are and reported
+            game_state = dict(lost)
+            assert migrate_state(game_state, story_plan(StoryManager(), "lost")) == "unknown_story"
+            assert game_state == lost, "save of an unknown story changed"
+            
+            report = migrate_saves("saves", StoryManager(), workers=2, batch_size=4)
+            assert report["counts"] == {"migrated": 10, "reset": 10, "unchanged": 1, "unknown_story": 1}, \
+                "wrong migration results"
+            assert not report["errors"] and report["unknown_story"] == ["lost.json"]
+            assert save_manager.read_save("lost.json")["current_scene"] == "lost_cave", "unknown story save reset"
+            
+            migrated = save_manager.read_save("old_1.json")
+            assert migrated["current_scene"] == "castle_great_hall" and migrated["story_version"] == 3
+            assert migrated["visited_scenes"] == ["castle_start", "castle_great_hall"], "history not remapped"
+            assert migrated["choices_made"][0]["scene"] == "castle_great_hall"
+            assert save_manager.read_save("old_0.json")["current_scene"] == "castle_start", "removed scene not reset"
+            assert not [f for f in os.listdir("saves") if f.endswith(".tmp")], "temp files left behind"
+            
+            reindexed = SaveIndex("saves")
+            reindexed.load()
+            assert reindexed.entries["old_1.json"]["scenes_visited"] == 2, "index not updated after migration"
+            assert migrate_saves("saves", StoryManager(), workers=2)["counts"] == {"unchanged": 21, "unknown_story": 1}
+            
+            # A save written again during its migration is not overwritten
+            save_manager.write_save(dict(base, current_scene="castle_hall", visited_scenes=[], choices_made=[]), "busy")
+            file_signature = save_migration.file_signature
+            def save_meanwhile(path):
+                with open(path, 'w') as f:
+                    json.dump(dict(base, current_scene="castle_start", story_version=3,
+                                   visited_scenes=["castle_start", "castle_tower"], choices_made=[]), f)
+                return file_signature(path)
+            save_migration.file_signature = save_meanwhile
+            try:
+                results = migrate_files("saves", ["busy.json"], story_plans(StoryManager()))
+            finally:
+                save_migration.file_signature = file_signature
+            assert results[0]["status"] == "skipped", "concurrent save not detected"
+            assert save_manager.read_save("busy.json")["visited_scenes"] == ["castle_start", "castle_tower"], \
+                "concurrent save overwritten"
+            assert not [f for f in os.listdir("saves") if f.endswith(".tmp")], "temp file left behind"
+        finally:
+            os.chdir(original_cwd)
+
+def test_session_manager_hibernation():
+    """Test that idle and over-budget sessions hibernate and resume where they were"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        now = [0.0]
+        manager = SessionManager(10 ** 9, os.path.join(temp_dir, "sessions"), idle_seconds=60,
+                                 story_manager=StoryManager("missing", "missing"), clock=lambda: now[0])
+        first = manager.start("a", "Alice", "castle")
+        assert first["scene"] == "castle_start" and first["choices"]
+        moved = manager.handle("a", "1")
+        assert moved["scene"] != "castle_start"
+        
+        # Idle sessions are hibernated when another session is used
+        now[0] = 120
+        manager.start("b", "Bob", "castle")
+        assert "a" not in manager.sessions and manager.stats()["hibernated"] == 1
+        
+        resumed = manager.handle("a", "I")
+        assert resumed["scene"] == moved["scene"], "session not resumed where it was"
+        assert os.path.exists(manager._path("a")), "hibernation file deleted before the session was saved again"
+        assert manager.stats()["hibernated"] == 0, "resident session counted as hibernated"
+        undone = manager.handle("a", "U")
+        assert undone["scene"] == "castle_start", "undo history lost in hibernation"
+        assert manager.sessions["a"].game_state["visited_scenes"] == ["castle_start"]
+        
+        # Over budget, the least recently used sessions go to disk
+        manager.memory_budget = 1
+        manager.start("c", "Carol", "castle")
+        assert list(manager.sessions) == ["c"]
+        stats = manager.stats()
+        assert stats["hibernated"] == 2 and stats["resumes"] == 1
+        assert stats["resident_bytes"] == manager.sessions["c"].size
+        
+        manager.handle("b", "Q")
+        assert "b" not in manager.sessions and manager.stats()["hibernated"] == 1, "quit session not removed"
+        
+        # Chunks of earlier hibernations are collected, those still referred to are kept
+        assert manager.collect_garbage(grace_seconds=0)[0] == 2, "stale session chunks not collected"
+        assert manager.handle("a", "I")["scene"] == "castle_start", "live session chunks collected"
+        manager.end("a")
+        manager.end("c")
+        assert manager.collect_garbage(grace_seconds=0)[0] > 0 and manager.chunks.usage()["chunks"] == 0
+        
+        # Between full measurements a session's size grows by what its lists gained
+        manager = SessionManager(10 ** 9, os.path.join(temp_dir, "sized"), story_manager=StoryManager("missing", "missing"))
+        view = manager.start("d", "Dan", "castle")
+        session = manager.sessions["d"]
+        for _ in range(10):
+            if view["status"] != "playing" or not view["choices"]:
+                break
+            view = manager.handle("d", "1")
+        full = deep_size(session.game_state) + deep_size(session.history.snapshots)
+        assert session.inputs_since_measure > 0 and abs(session.size - full) < full * 0.2, "size estimate drifted"
+
+def test_think_time_histograms():
+    """Test that think-time histograms bucket, merge and answer percentiles"""
+    for value in (0, 7, 31, 32, 1000, 123456, MAX_MILLISECONDS):
+        low, high = bucket_range(bucket_index(value))
+        assert low <= value <= high and high - low <= value * 0.07, f"bad bucket for {value}"
+    assert bucket_index(10 ** 9) == BUCKET_COUNT - 1
+    
+    first, second = ThinkTimes(), ThinkTimes()
+    for i in range(1, 101):
+        first.record("castle", "castle_start", "Enter", i / 100)
+    second.record("castle", "castle_start", "Leave", 30.0)
+    second.record("castle", "castle_hall", "Go up", 0.5)
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        stats_manager = StatsManager(temp_dir)
+        stats_manager.record_think_times(first)
+        stats_manager.record_think_times(second)
+        rows = {row["scene"]: row for row in stats_manager.think_time_report("castle")}
+        start = rows["castle_start"]
+        assert start["count"] == 101 and start["max_ms"] == 30000
+        assert 480 <= start["p50_ms"] <= 530 and 900 <= start["p90_ms"] <= 960
+        assert list(rows) == ["castle_start", "castle_hall"], "slowest scenes not first"
+        choices = stats_manager.think_time_report("castle", by_choice=True)
+        assert {row["choice"] for row in choices} == {"Enter", "Leave", "Go up"}
+        
+        # Session think times survive hibernation and reach the global histograms
+        now = [0.0]
+        manager = SessionManager(10 ** 9, os.path.join(temp_dir, "sessions"), story_manager=StoryManager("missing", "missing"),
+                                 stats_manager=stats_manager, clock=lambda: now[0])
+        manager.start("a", "Alice", "castle")
+        now[0] = 2.5
+        manager.hibernate("a")
+        manager.handle("a", "1")
+        manager.handle("a", "Q")
+        rows = {row["scene"]: row for row in stats_manager.think_time_report("castle")}
+        assert rows["castle_start"]["count"] == 102 and rows["castle_start"]["max_ms"] == 30000
+        entered = [row for row in stats_manager.think_time_report("castle", by_choice=True)
+                   if row["choice"] == "Enter through the main doors"]
+        assert 2400 <= entered[0]["max_ms"] <= 2700, "think time across hibernation wrong"
+
+        # Write-behind batches think times with the other stats
+        batched = StatsManager(os.path.join(temp_dir, "batched"), write_behind=True, flush_interval=None)
+        batched.record_think_times(second)
+        assert not os.path.exists(batched.think_times_file), "think times written per game"
+        assert len(batched.think_time_report("castle")) == 2, "pending think times not reported"
+        batched.aggregator.close()
+        assert len(load_think_times(batched.think_times_file).scenes) == 2, "think times not flushed"
+
+def test_save_retention_pass():
+    """Test that retention prunes saves per player and by age, then compacts the rest"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        original_cwd = os.getcwd()
+        os.chdir(temp_dir)
+        try:
+            save_manager = SaveManager()
+            base = {"story_type": "castle", "current_scene": "castle_start", "inventory": [], "deaths": 0,
+                    "saves_used": 0, "items_collected": 0, "start_time": "2024-01-01T00:00:00"}
+            for i in range(6):
+                history = [f"castle_scene_{i}_{j}" for j in range(40)]
+                save_manager.write_save(dict(base, player_name="Alice", visited_scenes=history, choices_made=[]), f"alice_{i}")
+            # Saves in the inline format from before the chunk store
+            old = dict(base, visited_scenes=["castle_start"], choices_made=[], save_timestamp="2000-01-01T00:00:00")
+            for name, player in (("bob_old", "Bob"), ("carol_old", "Carol")):
+                with open(f"saves/{name}.json", 'w') as f:
+                    json.dump(dict(old, player_name=player), f)
+            save_manager.write_save(dict(base, player_name="Carol", visited_scenes=[], choices_made=[]), "carol_new")
+            with open("saves/alice_0.json.123.tmp", 'w') as f:
+                f.write("{")
+            os.utime("saves/alice_0.json.123.tmp", (0, 0))
+            
+            policy = RetentionPolicy(keep_last=3, max_age_days=90)
+            assert RetentionPass("saves", policy, dry_run=True).run()["deleted"] == ["alice_0.json", "alice_1.json", "alice_2.json", "carol_old.json"]
+            assert len([f for f in os.listdir("saves") if f.endswith(".json")]) == 9, "dry run deleted saves"
+            
+            sweep = RetentionPass("saves", policy, batch_size=2, grace_seconds=0)
+            steps = 1
+            while sweep.step():
+                steps += 1
+            assert steps > 2, "pass not incremental"
+            report = sweep.report
+            assert report["compacted"] == 1 and report["temp_files_removed"] == 1 and not report["errors"]
+            assert report["chunks_removed"] > 0, "chunks of deleted saves not collected"
+            
+            remaining = sorted(f for f in os.listdir("saves") if f.endswith(".json"))
+            assert remaining == ["alice_3.json", "alice_4.json", "alice_5.json", "bob_old.json", "carol_new.json"]
+            with open("saves/bob_old.json", 'r') as f:
+                assert "history" in json.load(f), "old save not compacted"
+            assert save_manager.read_save("alice_3.json")["visited_scenes"][-1] == "castle_scene_3_39"
+            index = SaveIndex("saves")
+            index.load()
+            assert sorted(index.entries) == remaining and all(s["chunked"] for s in index.entries.values())
+            assert RetentionPass("saves", policy).run()["deleted"] == [], "second sweep not idempotent"
+
+            # Only one sweep at a time, and a save written again during it is kept
+            sweep = RetentionPass("saves", RetentionPolicy(keep_last=1))
+            sweep.start()
+            assert RetentionPass("saves", policy).run()["busy"], "overlapping sweeps"
+            save_manager.write_save(dict(base, player_name="Alice", visited_scenes=[], choices_made=[]), "alice_3")
+            sweep.run()
+            assert sweep.report["skipped"] == ["alice_3.json"] and sweep.report["deleted"] == ["alice_4.json"]
+            assert os.path.exists("saves/alice_3.json"), "overwritten save deleted"
+
+            with open("saves/.retention", 'w') as f:
+                f.write("[")
+            with pytest.raises(ValueError):
+                load_policy("saves")
+        finally:
+            os.chdir(original_cwd)
+
+def test_scene_templates():
+    """Test that scene text placeholders are compiled once and filled in per player"""
+    static = "A plain sentence."
+    assert compile_template(static) is static, "static text should not be wrapped"
+    template = compile_template("{player_name} holds {inventory} ({inventory_count}) {{not a field}}")
+    assert compile_template("{player_name} holds {inventory} ({inventory_count}) {{not a field}}") is template
+    game_state = {"player_name": "Alice", "inventory": ["golden key", "magic flower"], "deaths": 0, "items_collected": 2}
+    assert template.render(game_state) == "Alice holds golden key, magic flower (2) {not a field}"
+    assert template.render(dict(game_state, inventory=[])) == "Alice holds nothing (0) {not a field}"
+    with pytest.raises(TemplateError):
+        compile_template("Hello {player}")
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        builtin = StoryManager("missing", "missing")
+        scenes = dict(builtin.get_story_scenes("castle"))
+        scenes["castle_start"] = dict(scenes["castle_start"], description="Welcome, {player_name}.")
+        scenes["castle_start"]["choices"] = [dict(scenes["castle_start"]["choices"][0], text="Enter carrying {inventory}")]
+        builtin.loader.stories_dir = os.path.join(temp_dir, "stories")
+        builtin.loader.export_story("castle", builtin.get_available_stories()["castle"], scenes)
+        
+        story_manager = StoryManager(os.path.join(temp_dir, "stories"), "missing")
+        templates = story_manager.get_scene_templates("castle")
+        assert story_manager.get_scene_templates("castle") is templates, "templates not cached"
+        assert templates.compiled["castle_hall"] is None, "static scene should render as is"
+        hall = story_manager.get_story_scenes("castle")["castle_hall"]
+        assert templates.render("castle_hall", hall, game_state) is hall
+        
+        manager = SessionManager(10 ** 9, os.path.join(temp_dir, "sessions"), story_manager=story_manager)
+        view = manager.start("a", "Alice", "castle")
+        assert view["description"] == "Welcome, Alice." and view["choices"][0]["text"] == "Enter carrying nothing"
+        manager.handle("a", "1")
+        assert manager.sessions["a"].game_state["choices_made"][0]["choice"] == "Enter carrying {inventory}"
+
+        # Filled-in values are escaped for rich, so a player's name is never read as markup
+        shown = templates.render("castle_start", story_manager.get_story_scenes("castle")["castle_start"],
+                                 dict(game_state, player_name="[/]"), UIManager.escape_markup)
+        UIManager(Console(file=io.StringIO())).show_scene(shown, dict(game_state, player_name="[/]"))
+        assert shown["description"] == "Welcome, \\[/]."
+        
+        # Literal braces in story text never stop a game; an edit adding them keeps the last
+        # good scene and a new scene with them is left out until it is fixed
+        hall_file = os.path.join(temp_dir, "stories", "castle", "castle_hall.json")
+        with open(hall_file, 'w') as f:
+            json.dump(dict(hall, description="use {braces} here"), f)
+        with open(os.path.join(temp_dir, "stories", "castle", "castle_note.json"), 'w') as f:
+            json.dump({"title": "A {note}", "description": "Hi {player_name}", "ending": True, "ending_title": "END"}, f)
+        story_manager.reload_stories()
+        scenes = story_manager.get_story_scenes("castle")
+        assert scenes["castle_hall"] == hall, "bad edit replaced the last good scene"
+        assert "castle_note" not in scenes, "new scene with a bad template loaded"
+
+def test_quantile_sketches():
+    """Test that t-digests track tail percentiles, merge, and reach the global stats display"""
+    rng = random.Random(7)
+    values = [rng.expovariate(1 / 300) for _ in range(20000)]
+    parts = [TDigest() for _ in range(4)]
+    for i, value in enumerate(values):
+        parts[i % 4].add(value)
+    digest = TDigest()
+    for part in parts:
+        digest.merge(part)
+    ordered = sorted(values)
+    for q in (0.5, 0.95, 0.99):
+        exact = ordered[int(q * len(ordered))]
+        assert abs(digest.quantile(q) - exact) < exact * 0.03, f"p{q * 100:g} too far off"
+    stored = digest.to_dict()
+    assert stored["n"] == 20000 and len(stored["c"]) <= 2 * 100, "sketch not compact"
+    assert TDigest.from_dict(stored).quantile(0.5) == pytest.approx(digest.quantile(0.5), rel=1e-3)
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        stats_manager = StatsManager(temp_dir)
+        for i in range(50):
+            game_state = {"player_name": f"player{i % 5}", "story_type": ["castle", "forest", "all"][i % 3],
+                          "deaths": i % 3, "items_collected": 0, "choices_made": [{}] * (i + 1)}
+            stats_manager.save_final_stats(game_state, timedelta(seconds=60 * (i + 1)))
+            stats_manager.save_player_stats(game_state, timedelta(seconds=60 * (i + 1)))
+        stats = stats_manager.load_global_stats()
+        assert stats["quantiles"]["all"]["turns"]["n"] == 50
+        assert stats["quantiles"]["stories"]["castle"]["play_time_seconds"]["n"] == 17
+        assert stats["quantiles"]["stories"]["all"]["turns"]["n"] == 16, "story named all mixed with the totals"
+        
+        rebuilt = stats_manager.rollup_global_stats(workers=1)
+        assert rebuilt["quantiles"]["all"]["play_time_seconds"]["n"] == 50, "player sketches not rolled up"
+        assert percentiles(rebuilt["quantiles"]["all"]["turns"])[0] == pytest.approx(25, abs=2)
+        
+        rows = quantile_rows(stats)
+        assert [row[0] for row in rows] == ["Game Time", "Turns", "Deaths", "All Game Time", "Castle Game Time",
+                                            "Forest Game Time"]
+        
+        # Stats in the old layout, stories next to the totals, move into the stories map
+        old = {"all": stats["quantiles"]["all"], "castle": stats["quantiles"]["stories"]["castle"]}
+        merged = merge_quantiles(old, game_quantiles({"story_type": "castle"}, timedelta(seconds=60)))
+        assert sorted(merged) == ["all", "stories"] and merged["stories"]["castle"]["turns"]["n"] == 18
+        assert merged["all"]["turns"]["n"] == 51
+        output = io.StringIO()
+        create_ui_manager("plain", output=output).show_global_stats_display(stats)
+        assert "Distributions" in output.getvalue() and "p99" in output.getvalue()
+
+def test_story_image():
+    """Test that a compiled story image serves the same stories from a memory map"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        builtin = StoryManager("missing", "missing")
+        scenes = dict(builtin.get_story_scenes("castle"))
+        hall = dict(scenes["castle_hall"], notes={"author": "Ann"}, description="Hello {player_name}")
+        hall["choices"] = [dict(hall["choices"][0], requires={"any": [{"item": "golden key"}, {"deaths": {"min": 1}}]}),
+                           *hall["choices"][1:]]
+        scenes["castle_hall"] = hall
+        scenes["castle_empty"] = {"title": "Empty", "description": "Nothing here.", "choices": []}
+        info = dict(builtin.get_available_stories()["castle"], version=2, migrations={"2": {"castle_old": "castle_hall"}})
+        builtin.loader.stories_dir = os.path.join(temp_dir, "stories")
+        builtin.loader.export_story("castle", info, scenes)
+        source = StoryManager(os.path.join(temp_dir, "stories"), "missing")
+        
+        path = os.path.join(temp_dir, "stories.img")
+        counts = build_from_manager(source, path)
+        assert counts["stories"] == 3 and counts["scenes"] == len(scenes) + 14
+        
+        mapped = StoryManager("missing", "missing", image_path=path)
+        for story, story_info in source.get_available_stories().items():
+            assert mapped.get_available_stories()[story] == {key: story_info[key] for key in ("title", "description", "difficulty")}
+        for story in source.get_available_stories():
+            original, imaged = source.get_story_scenes(story), mapped.get_story_scenes(story)
+            assert sorted(imaged) == sorted(original)
+            for scene_id in original:
+                assert imaged[scene_id] == original[scene_id], f"{story}/{scene_id} differs in the image"
+        imaged = mapped.get_story_scenes("castle")
+        assert "castle_missing" not in imaged and imaged.get("castle_missing") is None
+        assert mapped.get_story_version("castle") == 2 and mapped.get_scene_migrations("castle") == {2: {"castle_old": "castle_hall"}}
+        
+        conditions = mapped.get_choice_conditions("castle")
+        game_state = {"inventory": [], "visited_scenes": [], "deaths": 1}
+        assert conditions.available_choices("castle_hall", imaged["castle_hall"], game_state) == 0b111
+        assert mapped.get_scene_templates("castle").render("castle_hall", imaged["castle_hall"],
+                                                           {"player_name": "Ann"})["description"] == "Hello Ann"
+        
+        # A session decodes its current scene once, not on every lookup
+        session = GameSession("s", {"story_type": "castle", "current_scene": "castle_hall"}, mapped)
+        assert session.scene() is session.scene() and session.scene() == imaged["castle_hall"]
+        
+        # A rebuilt image is mapped again on reload, and the old one is
+        # unmapped once the last scenes object from it is dropped
+        assert mapped.reload_stories() == {}
+        build_image(path, {"castle": (info, {"castle_start": scenes["castle_start"]})})
+        os.utime(path, ns=(0, 0))
+        old_image = mapped.image
+        assert "castle" in mapped.reload_stories()
+        assert list(mapped.get_story_scenes("castle")) == ["castle_start"]
+        assert not old_image.data.closed, "image unmapped while its scenes are in use"
+        del imaged
+        session.scene()
+        assert old_image.data.closed, "replaced image left mapped"
+
 if __name__ == "__main__":
     pytest.main([__file__])
@@ -0,0 +1,201 @@
+"""
+Think Time Module - Per-scene histograms of how long players take to choose
+
+Think times are counted in fixed log-linear buckets, as HDR histograms do:
+values below 2 * SUB_BUCKETS milliseconds get a bucket each, and every
+doubling above that is split into SUB_BUCKETS buckets, so each bucket is
+within about 6% of the values it holds. Recording is a shift and a dict
+increment, and histograms merge by adding their bucket counts.
+"""
+
+import argparse
+import json
+import math
+import os
+
+from Code.file_lock import FileLock
+
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+# Longer think times (an idle player) are counted in the last bucket
+MAX_MILLISECONDS = 3600 * 1000
+PERCENTILES = (0.5, 0.9, 0.99)
+
+
+def bucket_index(milliseconds):
+    """Return the bucket of a value in milliseconds"""
+    value = min(max(int(milliseconds), 0), MAX_MILLISECONDS)
+    shift = max(value.bit_length() - SUB_BUCKET_BITS - 1, 0)
+    return (shift << SUB_BUCKET_BITS) + (value >> shift)
+
+
+def bucket_range(index):
+    """Return the lowest and highest millisecond values of a bucket"""
+    shift = max((index >> SUB_BUCKET_BITS) - 1, 0)
+    sub_bucket = index - (shift << SUB_BUCKET_BITS)
+    return sub_bucket << shift, ((sub_bucket + 1) << shift) - 1
+
+
+BUCKET_COUNT = bucket_index(MAX_MILLISECONDS) + 1
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "max")
+
+    def __init__(self, counts=None, total=0, maximum=0):
+        # Only buckets that were used are kept
+        self.counts = counts if counts is not None else {}
+        self.total = total
+        self.max = maximum
+
+    def record(self, milliseconds):
+        """Count one value, in O(1)"""
+        index = bucket_index(milliseconds)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.total += 1
+        if milliseconds > self.max:
+            self.max = min(int(milliseconds), MAX_MILLISECONDS)
+
+    def merge(self, other):
+        """Add the counts of another histogram to this one"""
+        counts = self.counts
+        for index, count in other.counts.items():
+            counts[index] = counts.get(index, 0) + count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, fraction):
+        """Return the value below which that fraction of the values fall, in milliseconds"""
+        if not self.total:
+            return 0
+        rank = max(math.ceil(fraction * self.total), 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(bucket_range(index)[1], self.max)
+        return self.max
+
+    def to_dict(self):
+        return {"total": self.total, "max": self.max, "buckets": self.counts}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls({int(index): count for index, count in data["buckets"].items()}, data["total"], data["max"])
+
+
+class ThinkTimes:
+    """Think-time histograms of every scene, and of every choice within it"""
+
+    def __init__(self):
+        self.scenes = {}
+        self.choices = {}
+
+    def record(self, story_type, scene_id, choice, seconds):
+        """Count the time a player took to pick a choice of a scene"""
+        milliseconds = seconds * 1000
+        key = (story_type, scene_id)
+        histogram = self.scenes.get(key)
+        if histogram is None:
+            histogram = self.scenes[key] = Histogram()
+        histogram.record(milliseconds)
+
+        key = (story_type, scene_id, choice)
+        histogram = self.choices.get(key)
+        if histogram is None:
+            histogram = self.choices[key] = Histogram()
+        histogram.record(milliseconds)
+
+    def merge(self, other):
+        """Add the histograms of another ThinkTimes, e.g. one game session's"""
+        for mine, theirs in ((self.scenes, other.scenes), (self.choices, other.choices)):
+            for key, histogram in theirs.items():
+                if key in mine:
+                    mine[key].merge(histogram)
+                else:
+                    mine[key] = Histogram(dict(histogram.counts), histogram.total, histogram.max)
+
+    def __bool__(self):
+        return bool(self.scenes)
+
+    def to_dict(self):
+        return {
+            "unit": "ms",
+            "scenes": [[*key, histogram.to_dict()] for key, histogram in self.scenes.items()],
+            "choices": [[*key, histogram.to_dict()] for key, histogram in self.choices.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        think_times = cls()
+        for *key, histogram in data.get("scenes", []):
+            think_times.scenes[tuple(key)] = Histogram.from_dict(histogram)
+        for *key, histogram in data.get("choices", []):
+            think_times.choices[tuple(key)] = Histogram.from_dict(histogram)
+        return think_times
+
+    def report(self, story_type=None, fractions=PERCENTILES, by_choice=False):
+        """Return percentile rows per scene (or choice), slowest first"""
+        histograms = self.choices if by_choice else self.scenes
+        rows = []
+        for key, histogram in histograms.items():
+            if story_type and key[0] != story_type:
+                continue
+            row = {"story_type": key[0], "scene": key[1], "count": histogram.total, "max_ms": histogram.max}
+            if by_choice:
+                row["choice"] = key[2]
+            for fraction in fractions:
+                row[f"p{fraction * 100:g}_ms"] = histogram.percentile(fraction)
+            rows.append(row)
+        rows.sort(key=lambda row: row[f"p{fractions[-1] * 100:g}_ms"], reverse=True)
+        return rows
+
+
+def load_think_times(path):
+    """Read a think times file, or return empty histograms if there is none"""
+    try:
+        with open(path, 'r') as f:
+            return ThinkTimes.from_dict(json.load(f))
+    except FileNotFoundError:
+        return ThinkTimes()
+
+
+def save_think_times(path, think_times):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_file = f"{path}.{os.getpid()}.tmp"
+    with open(temp_file, 'w') as f:
+        json.dump(think_times.to_dict(), f, separators=(",", ":"))
+    os.replace(temp_file, path)
+
+
+def merge_think_times(path, think_times):
+    """Merge histograms into a think times file, locked against other processes doing the same"""
+    with FileLock(f"{path}.lock"):
+        merged = load_think_times(path)
+        merged.merge(think_times)
+        save_think_times(path, merged)
+
+
+def main():
+    """Command line entry point listing the scenes players think longest in"""
+    parser = argparse.ArgumentParser(description="Show which scenes players take longest to decide in")
+    parser.add_argument("--stats-dir", default="stats")
+    parser.add_argument("--story", help="only this story")
+    parser.add_argument("--choices", action="store_true", help="one row per choice instead of per scene")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    rows = load_think_times(os.path.join(args.stats_dir, "think_times.json")).report(args.story, by_choice=args.choices)
+    if not rows:
+        print("No think times recorded yet")
+        return
+    for row in rows[:args.top]:
+        name = f"{row['story_type']}/{row['scene']}" + (f" -> {row['choice']}" if args.choices else "")
+        print(f"{name}: {row['count']} choices, p50 {row['p50_ms'] / 1000:.1f}s, "
+              f"p90 {row['p90_ms'] / 1000:.1f}s, p99 {row['p99_ms'] / 1000:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Time Series Module - Rolling minute, hour and day buckets of game statistics
+"""
+
+import os
+import struct
+import time
+from array import array
+
+from Code.file_lock import FileLock
+
+# Bucket width in seconds and number of buckets kept for each resolution
+RESOLUTIONS = {
+    "minute": (60, 60),
+    "hour": (3600, 48),
+    "day": (86400, 30),
+}
+METRICS = ("games", "play_time_seconds", "deaths", "items_collected")
+
+MAGIC = b"TSS1"
+# Each bucket is its period number followed by one value per metric
+SLOT_SIZE = 1 + len(METRICS)
+
+
+class RingSeries:
+    """Fixed number of time buckets reused in a circle"""
+
+    def __init__(self, width, size, values=None):
+        self.width = width
+        self.size = size
+        # Period -1 marks a bucket that was never used
+        self.values = values if values is not None else array("d", [-1.0] + [0.0] * len(METRICS)) * size
+
+    def add(self, when, delta):
+        """Add metric increments to the bucket holding `when`, in O(1)"""
+        period = int(when // self.width)
+        offset = (period % self.size) * SLOT_SIZE
+        values = self.values
+        if values[offset] > period:
+            # Too old: the bucket already holds a later period
+            return
+        if values[offset] != period:
+            # The bucket still holds an expired period, start it over
+            values[offset] = period
+            for i in range(1, SLOT_SIZE):
+                values[offset + i] = 0.0
+        for i, metric in enumerate(METRICS, 1):
+            values[offset + i] += delta.get(metric, 0)
+
+    def buckets(self, now, count=None):
+        """Return (start time, metrics) for the last `count` buckets, oldest first"""
+        count = min(count or self.size, self.size)
+        current = int(now // self.width)
+        result = []
+        for period in range(current - count + 1, current + 1):
+            offset = (period % self.size) * SLOT_SIZE
+            if self.values[offset] == period:
+                metrics = dict(zip(METRICS, self.values[offset + 1:offset + SLOT_SIZE]))
+            else:
+                metrics = dict.fromkeys(METRICS, 0.0)
+            result.append((period * self.width, metrics))
+        return result
+
+    def total(self, now, count=None):
+        """Return the metrics summed over the last `count` buckets"""
+        totals = dict.fromkeys(METRICS, 0.0)
+        for _, metrics in self.buckets(now, count):
+            for metric, value in metrics.items():
+                totals[metric] += value
+        return totals
+
+
+class TimeSeriesStats:
+    def __init__(self, path):
+        self.path = path
+        self.series = {name: RingSeries(width, size) for name, (width, size) in RESOLUTIONS.items()}
+        self._mtime = None
+
+    def _file_mtime(self):
+        try:
+            stat = os.stat(self.path)
+            return (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            return None
+
+    def load(self):
+        """Read the buckets from disk if the file changed since the last read"""
+        mtime = self._file_mtime()
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+        self.series = {name: RingSeries(width, size) for name, (width, size) in RESOLUTIONS.items()}
+        if mtime is None:
+            return
+
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        if data[:4] != MAGIC:
+            return
+        position = 4
+        (count,) = struct.unpack_from("<I", data, position)
+        position += 4
+        for _ in range(count):
+            name_length, width, size = struct.unpack_from("<BII", data, position)
+            position += 9
+            name = data[position:position + name_length].decode("utf-8")
+            position += name_length
+            values = array("d")
+            values.frombytes(data[position:position + size * SLOT_SIZE * 8])
+            position += size * SLOT_SIZE * 8
+            # Buckets of a resolution whose layout changed are dropped
+            if RESOLUTIONS.get(name) == (width, size):
+                self.series[name] = RingSeries(width, size, values)
+
+    def save(self):
+        """Write every ring to one small binary file"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        parts = [MAGIC, struct.pack("<I", len(self.series))]
+        for name, series in self.series.items():
+            encoded = name.encode("utf-8")
+            parts.append(struct.pack("<BII", len(encoded), series.width, series.size))
+            parts.append(encoded)
+            parts.append(series.values.tobytes())
+
+        temp_file = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_file, 'wb') as f:
+            f.write(b"".join(parts))
+        os.replace(temp_file, self.path)
+        self._mtime = self._file_mtime()
+
+    def record(self, delta, when=None):
+        """Add one game's increments to every resolution and save"""
+        self.record_many([(time.time() if when is None else when, delta)])
+
+    def record_many(self, entries):
+        """Add (time, increments) pairs in one read and write of the file
+
+        Other processes record into the same file, so the read, merge and
+        write happen under a lock.
+        """
+        with FileLock(f"{self.path}.lock"):
+            self.load()
+            for when, delta in entries:
+                for series in self.series.values():
+                    series.add(when, delta)
+            self.save()
+
+    def trend(self, resolution, count=None, now=None):
+        """Return the buckets of one resolution, with the average game time of each"""
+        self.load()
+        now = time.time() if now is None else now
+        trend = []
+        for start, metrics in self.series[resolution].buckets(now, count):
+            games = metrics["games"]
+            trend.append({
+                "start": start,
+                **metrics,
+                "average_game_time_seconds": metrics["play_time_seconds"] / games if games else 0.0
+            })
+        return trend
+
+    def summary(self, now=None):
+        """Return totals for the last hour, day and month and games per hour today"""
+        self.load()
+        now = time.time() if now is None else now
+        windows = {
+            "last_hour": self.series["minute"].total(now),
+            "last_day": self.series["hour"].total(now, 24),
+            "last_30_days": self.series["day"].total(now),
+        }
+        for totals in windows.values():
+            games = totals["games"]
+            totals["average_game_time_seconds"] = totals["play_time_seconds"] / games if games else 0.0
+        windows["games_per_hour"] = [int(metrics["games"]) for _, metrics in self.series["hour"].buckets(now, 24)]
+        return windows
+
+    def export(self, now=None):
+        """Return every resolution's buckets for a JSON export"""
+        now = time.time() if now is None else now
+        return {resolution: self.trend(resolution, now=now) for resolution in RESOLUTIONS}
@@ -0,0 +1,149 @@
+"""
+UI Backends Module - Picks the user interface backend at startup
+
+Every backend offers the same methods as UIManager: clear, message, ask,
+ask_int, confirm, pause, show_title, show_menu, show_story_list and the
+show_* displays for scenes, endings, stats and saves. Message styles are
+"error", "success", "warning", "info" or None.
+
+Backends are imported only when they are created, so choosing the plain or
+JSON-lines backend never imports the rich one.
+"""
+
+import importlib
+from datetime import datetime, timedelta
+
+from Code.quantile_sketch import ALL_STORIES, percentiles, story_quantiles
+
+BACKENDS = {
+    "rich": ("Code.ui_manager", "UIManager"),
+    "plain": ("Code.ui_plain", "PlainUIManager"),
+    "jsonl": ("Code.ui_jsonl", "JsonLinesUIManager"),
+}
+
+COMMANDS_HELP = "Commands: I (inventory), S (save), T (stats), U (undo), Q (quit)"
+SAVE_MENU_HELP = "Commands: N (next page), P (previous page), O (sort), F (filter), B (back)"
+
+
+def create_ui_manager(name="rich", **kwargs):
+    """Import and create the named UI backend"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown UI backend: {name!r} (choose from {', '.join(BACKENDS)})")
+    module_name, class_name = BACKENDS[name]
+    return getattr(importlib.import_module(module_name), class_name)(**kwargs)
+
+
+def format_duration(seconds):
+    """Format seconds as H:MM:SS"""
+    return str(timedelta(seconds=int(seconds)))
+
+
+def play_time_of(game_state):
+    """Return how long the game has been played so far"""
+    return datetime.now() - datetime.fromisoformat(game_state["start_time"])
+
+
+def game_stats_rows(game_state, current=False):
+    """Return (metric, value) rows describing a game in progress or finished"""
+    rows = []
+    if current:
+        rows.append(("Player", game_state["player_name"]))
+        rows.append(("Story", game_state["story_type"].title()))
+    rows.append(("Current Play Time" if current else "Play Time", str(play_time_of(game_state)).split('.')[0]))
+    rows.append(("Scenes Visited", str(len(game_state["visited_scenes"]))))
+    rows.append(("Choices Made", str(len(game_state["choices_made"]))))
+    rows.append(("Items Collected", str(game_state["items_collected"])))
+    rows.append(("Deaths", str(game_state["deaths"])))
+    rows.append(("Saves Used", str(game_state["saves_used"])))
+    return rows
+
+
+def global_stats_rows(stats):
+    """Return (metric, value) rows of the global statistics"""
+    return [
+        ("Total Games Played", str(stats.get("total_games", 0))),
+        ("Total Play Time", str(timedelta(seconds=stats.get("total_play_time_seconds", 0)))),
+        ("Average Game Time", str(timedelta(seconds=stats.get("average_game_time_seconds", 0)))),
+        ("Total Deaths", str(stats.get("total_deaths", 0))),
+        ("Total Items Collected", str(stats.get("total_items_collected", 0))),
+    ]
+
+
+QUANTILE_METRICS = (("play_time_seconds", "Game Time", format_duration),
+                    ("turns", "Turns", lambda value: str(round(value))),
+                    ("deaths", "Deaths", lambda value: f"{value:.1f}"))
+
+
+def quantile_rows(stats):
+    """Return (metric, p50, p95, p99) rows for all games, then game time per story"""
+    quantiles = stats.get("quantiles", {})
+    rows = []
+    for metric, label, fmt in QUANTILE_METRICS:
+        sketch = quantiles.get(ALL_STORIES, {}).get(metric)
+        if sketch and sketch["n"]:
+            rows.append((label, *(fmt(value) for value in percentiles(sketch))))
+    for story, sketches in sorted(story_quantiles(quantiles).items()):
+        sketch = sketches.get("play_time_seconds")
+        if sketch and sketch["n"]:
+            rows.append((f"{story.title()} Game Time", *(format_duration(value) for value in percentiles(sketch))))
+    return rows
+
+
+TREND_WINDOWS = (("last_hour", "Last Hour"), ("last_day", "Last 24 Hours"), ("last_30_days", "Last 30 Days"))
+SPARK_LEVELS = " ▁▂▃▄▅▆▇█"
+
+
+def trend_rows(trends):
+    """Return (window, games, average game time, deaths, items) rows of recent trends"""
+    rows = []
+    for key, label in TREND_WINDOWS:
+        window = trends.get(key, {})
+        rows.append((
+            label,
+            str(int(window.get("games", 0))),
+            format_duration(window.get("average_game_time_seconds", 0)),
+            str(int(window.get("deaths", 0))),
+            str(int(window.get("items_collected", 0)))
+        ))
+    return rows
+
+
+def sparkline(values):
+    """Draw a list of counts as one line of block characters"""
+    peak = max(values, default=0)
+    if not peak:
+        return SPARK_LEVELS[0] * len(values)
+    return "".join(SPARK_LEVELS[round(value / peak * (len(SPARK_LEVELS) - 1))] for value in values)
+
+
+def leaderboard_rows(leaderboards, stories):
+    """Return (story title, fastest, fewest turns) rows for stories with entries"""
+    rows = []
+    for story_id, story_info in stories.items():
+        fastest = leaderboards.get_best("story", story_id, "play_time_seconds")
+        fewest = leaderboards.get_best("story", story_id, "turns")
+        if not fastest and not fewest:
+            continue
+        rows.append((
+            story_info["title"],
+            f"{format_duration(fastest['value'])} ({fastest['player_name']})" if fastest else "-",
+            f"{fewest['value']} ({fewest['player_name']})" if fewest else "-"
+        ))
+    return rows
+
+
+def save_summary(save_data):
+    """Return the player, story, save time and progress shown for a save"""
+    save_time = datetime.fromisoformat(save_data.get("save_timestamp") or save_data.get("start_time") or datetime.now().isoformat())
+    return {
+        "player_name": save_data.get("player_name", "Unknown"),
+        "story": save_data.get("story_type", "Unknown").title(),
+        "saved": save_time.strftime('%Y-%m-%d %H:%M'),
+        "scenes_visited": save_data.get("scenes_visited", len(save_data.get("visited_scenes", [])))
+    }
+
+
+def save_menu_status(page, total_pages, sort, player=None, story=None):
+    """Return the status line of the load menu"""
+    filters = ", ".join(f for f in [player and f"player={player}", story and f"story={story}"] if f)
+    return f"Page {page}/{total_pages} - sorted by {sort}{' - ' + filters if filters else ''}"
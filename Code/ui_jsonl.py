@@ -0,0 +1,129 @@
+"""
+JSON Lines UI Module - Machine-readable user interface
+
+Every display is written to stdout as one JSON object per line with an
+"event" key. Prompts are "prompt" events; the answer is the next line read
+from stdin (an empty line takes the default).
+"""
+
+import json
+import sys
+
+from Code.ui_backends import game_stats_rows, global_stats_rows, leaderboard_rows, quantile_rows, save_summary
+
+
+class JsonLinesUIManager:
+    # Text is written as is, so filled-in values need no escaping
+    escape_markup = None
+
+    def __init__(self, output=None, input_stream=None):
+        self.output = output or sys.stdout
+        self.input = input_stream or sys.stdin
+
+    def emit(self, event, **fields):
+        """Write one event as a JSON line"""
+        self.output.write(json.dumps({"event": event, **fields}) + "\n")
+        self.output.flush()
+
+    def _read(self):
+        line = self.input.readline()
+        if not line:
+            raise EOFError
+        return line.strip()
+
+    def clear(self):
+        """Tell the reader a new screen starts"""
+        self.emit("clear")
+
+    def message(self, text, style=None):
+        """Emit a line of text"""
+        self.emit("message", text=text, style=style)
+
+    def ask(self, prompt, choices=None, default=None):
+        """Emit a prompt and read the answer, repeating until it is one of choices"""
+        while True:
+            self.emit("prompt", prompt=prompt, kind="text", choices=choices, default=default)
+            answer = self._read()
+            if not answer and default is not None:
+                return default
+            if not choices or answer in choices:
+                return answer
+            self.emit("invalid", prompt=prompt, answer=answer)
+
+    def ask_int(self, prompt, default=None):
+        """Emit a prompt for a whole number and read it"""
+        while True:
+            self.emit("prompt", prompt=prompt, kind="int", default=default)
+            answer = self._read()
+            if not answer and default is not None:
+                return default
+            try:
+                return int(answer)
+            except ValueError:
+                self.emit("invalid", prompt=prompt, answer=answer)
+
+    def confirm(self, prompt):
+        """Emit a yes/no prompt and read the answer"""
+        self.emit("prompt", prompt=prompt, kind="confirm", choices=["y", "n"])
+        return self._read().lower() in ("y", "yes")
+
+    def pause(self, text="Press Enter to continue..."):
+        """Emit a pause and wait for any line"""
+        self.emit("pause", text=text)
+        self._read()
+
+    def show_title(self):
+        self.emit("title", title="Interactive Story Generator", subtitle="CS50P Final Project")
+
+    def show_menu(self, title, options):
+        self.emit("menu", title=title, options=[{"key": key, "label": label} for key, label in options])
+
+    def show_story_list(self, stories):
+        self.emit("stories", stories=[
+            {"key": str(i), "id": story_id, "title": info["title"],
+             "description": info["description"], "difficulty": info["difficulty"]}
+            for i, (story_id, info) in enumerate(stories.items(), 1)
+        ], back=str(len(stories) + 1))
+
+    def show_scene(self, scene, game_state, locked=None):
+        locked = locked or {}
+        self.emit("scene", scene=game_state.get("current_scene"), title=scene.get("title"),
+                  description=scene["description"], ending=bool(scene.get("ending")),
+                  choices=[
+                      {"key": str(i), "text": choice["text"], "requires": locked.get(i - 1)}
+                      for i, choice in enumerate(scene.get("choices", []), 1)
+                  ])
+
+    def show_ending(self, scene, game_state):
+        self.emit("ending", title=scene.get("ending_title", "THE END"), description=scene.get("description"),
+                  stats=dict(game_stats_rows(game_state)))
+
+    def show_inventory(self, game_state):
+        self.emit("inventory", items=list(game_state["inventory"]))
+
+    def show_current_stats(self, game_state):
+        self.emit("stats", scope="game", stats=dict(game_stats_rows(game_state, current=True)))
+
+    def show_global_stats_display(self, stats, trends=None):
+        self.emit("stats", scope="global", stats=dict(global_stats_rows(stats)),
+                  stories_completed=stats.get("stories_completed", {}), trends=trends,
+                  distributions=[{"metric": metric, "p50": p50, "p95": p95, "p99": p99}
+                                 for metric, p50, p95, p99 in quantile_rows(stats)])
+
+    def show_leaderboards(self, leaderboards, stories):
+        rows = leaderboard_rows(leaderboards, stories)
+        if rows:
+            self.emit("leaderboards", rows=[
+                {"story": title, "fastest": fastest, "fewest_turns": fewest}
+                for title, fastest, fewest in rows
+            ])
+
+    def show_save_list(self, valid_saves):
+        self.emit("saves", saves=[
+            {"key": str(i), "name": filename[:-5], **save_summary(save_data)}
+            for i, filename, save_data in valid_saves
+        ])
+
+    def show_save_menu_options(self, page, total_pages, sort, player=None, story=None):
+        self.emit("save_menu", page=page, total_pages=total_pages, sort=sort, player=player, story=story,
+                  commands=["N", "P", "O", "F", "B"])
@@ -2,121 +2,178 @@
 UI Manager Module - Handles all user interface display
 """
 
-from datetime import datetime, timedelta
 from rich.console import Console
+from rich.markup import escape
 from rich.panel import Panel
+from rich.prompt import Prompt, Confirm, IntPrompt
 from rich.table import Table
+from rich.text import Text
+
+from Code.ui_backends import (
+    COMMANDS_HELP, SAVE_MENU_HELP, game_stats_rows, global_stats_rows,
+    leaderboard_rows, quantile_rows, save_summary, save_menu_status, sparkline, trend_rows
+)
 
 console = Console()
 
+STYLES = {"error": "red", "success": "green", "warning": "yellow", "info": "cyan"}
+
 class UIManager:
-    def show_scene(self, scene, game_state):
+    # Applied to player values filled into scene text, which must not be read as markup
+    escape_markup = staticmethod(escape)
+
+    def __init__(self, output_console=None):
+        # Frames drawn by the frame renderer pass their own buffered console
+        self.console = output_console or console
+
+    def with_console(self, output_console):
+        """Return a UI manager drawing into another console, such as a frame"""
+        return type(self)(output_console)
+
+    def clear(self):
+        """Clear the screen"""
+        self.console.clear()
+
+    def message(self, text, style=None):
+        """Display a line of text"""
+        self.console.print(text, style=STYLES.get(style), markup=False)
+
+    def ask(self, prompt, choices=None, default=None):
+        """Ask for a line of input, optionally restricted to choices"""
+        if default is None:
+            return Prompt.ask(prompt, choices=choices, console=self.console)
+        return Prompt.ask(prompt, choices=choices, default=default, console=self.console)
+
+    def ask_int(self, prompt, default=None):
+        """Ask for a whole number"""
+        return IntPrompt.ask(prompt, default=default, console=self.console)
+
+    def confirm(self, prompt):
+        """Ask a yes/no question"""
+        return Confirm.ask(prompt, console=self.console)
+
+    def pause(self, text="Press Enter to continue..."):
+        """Wait until the player presses Enter"""
+        self.console.print(text)
+        input()
+
+    def show_title(self):
+        """Display the game title"""
+        title = Text("Interactive Story Generator", style="bold cyan")
+        subtitle = Text("CS50P Final Project", style="italic")
+        
+        title_panel = Panel.fit(f"{title}\n{subtitle}", border_style="cyan")
+        self.console.print(title_panel)
+        self.console.print()
+
+    def show_menu(self, title, options):
+        """Display a menu of (key, label) options"""
+        self.console.print()
+        self.console.print(f"[bold cyan]{title}[/bold cyan]")
+        self.console.print()
+        for key, label in options:
+            self.console.print(f"\\[{key}] {label}")
+        self.console.print()
+
+    def show_story_list(self, stories):
+        """Display the stories a player can choose from"""
+        self.console.print("[bold cyan]Choose Your Adventure:[/bold cyan]")
+        self.console.print()
+        
+        for i, (story_id, story_info) in enumerate(stories.items(), 1):
+            self.console.print(f"[{i}] {story_info['title']}")
+            self.console.print(f"    {story_info['description']}")
+            self.console.print(f"    Difficulty: {story_info['difficulty']}")
+            self.console.print()
+        
+        self.console.print(f"[{len(stories) + 1}] Back to Main Menu")
+        self.console.print()
+
+    def show_scene(self, scene, game_state, locked=None):
         """Display a story scene"""
+        locked = locked or {}
         # Scene title
         if "title" in scene:
             title_panel = Panel.fit(scene["title"], border_style="cyan")
-            console.print(title_panel)
-            console.print()
+            self.console.print(title_panel)
+            self.console.print()
         
         # Scene description
-        console.print(scene["description"])
-        console.print()
+        self.console.print(scene["description"])
+        self.console.print()
         
         # Show choices
         if "choices" in scene:
-            console.print("[bold]What do you want to do?[/bold]")
+            self.console.print("[bold]What do you want to do?[/bold]")
             for i, choice in enumerate(scene["choices"], 1):
-                # Check if choice requires an item
-                if "requires_item" in choice:
-                    if choice["requires_item"] not in game_state["inventory"]:
-                        console.print(f"[dim]{i}. {choice['text']} (requires {choice['requires_item']})[/dim]")
-                        continue
+                # Choices whose requirements aren't met are shown dimmed
+                if i - 1 in locked:
+                    self.console.print(f"[dim]{i}. {choice['text']} (requires {locked[i - 1]})[/dim]")
+                    continue
                 
-                console.print(f"{i}. {choice['text']}")
+                self.console.print(f"{i}. {choice['text']}")
             
-            console.print()
-            console.print("[dim]Commands: I (inventory), S (save), T (stats), Q (quit)[/dim]")
+            self.console.print()
+            self.console.print(f"[dim]{COMMANDS_HELP}[/dim]")
 
     def show_ending(self, scene, game_state):
         """Display ending scene with final statistics"""
-        console.print(f"[bold green]{scene.get('ending_title', 'THE END')}[/bold green]")
-        console.print()
+        self.console.print(f"[bold green]{scene.get('ending_title', 'THE END')}[/bold green]")
+        self.console.print()
         
         # Show ending description if available
         if "description" in scene:
-            console.print(scene["description"])
-            console.print()
-        
-        # Calculate final stats
-        end_time = datetime.now()
-        start_time = datetime.fromisoformat(game_state["start_time"])
-        play_time = end_time - start_time
+            self.console.print(scene["description"])
+            self.console.print()
         
         # Show final statistics
         stats_table = Table(title="Final Statistics")
         stats_table.add_column("Metric", style="cyan")
         stats_table.add_column("Value", style="green")
         
-        stats_table.add_row("Play Time", str(play_time).split('.')[0])
-        stats_table.add_row("Scenes Visited", str(len(game_state["visited_scenes"])))
-        stats_table.add_row("Choices Made", str(len(game_state["choices_made"])))
-        stats_table.add_row("Items Collected", str(game_state["items_collected"]))
-        stats_table.add_row("Deaths", str(game_state["deaths"]))
-        stats_table.add_row("Saves Used", str(game_state["saves_used"]))
+        for metric, value in game_stats_rows(game_state):
+            stats_table.add_row(metric, escape(value))
         
-        console.print(stats_table)
-        console.print()
+        self.console.print(stats_table)
+        self.console.print()
 
     def show_inventory(self, game_state):
         """Display player inventory"""
-        console.print("[bold cyan]Inventory:[/bold cyan]")
+        self.console.print("[bold cyan]Inventory:[/bold cyan]")
         if game_state["inventory"]:
             for item in game_state["inventory"]:
-                console.print(f"- {item}")
+                self.console.print(f"- {item}")
         else:
-            console.print("Empty")
-        console.print()
+            self.console.print("Empty")
+        self.console.print()
 
     def show_current_stats(self, game_state):
         """Display current game statistics"""
-        current_time = datetime.now()
-        start_time = datetime.fromisoformat(game_state["start_time"])
-        play_time = current_time - start_time
-        
         stats_table = Table(title="Current Game Statistics")
         stats_table.add_column("Metric", style="cyan")
         stats_table.add_column("Value", style="green")
         
-        stats_table.add_row("Player", game_state["player_name"])
-        stats_table.add_row("Story", game_state["story_type"].title())
-        stats_table.add_row("Current Play Time", str(play_time).split('.')[0])
-        stats_table.add_row("Scenes Visited", str(len(game_state["visited_scenes"])))
-        stats_table.add_row("Choices Made", str(len(game_state["choices_made"])))
-        stats_table.add_row("Items Collected", str(game_state["items_collected"]))
-        stats_table.add_row("Deaths", str(game_state["deaths"]))
-        stats_table.add_row("Saves Used", str(game_state["saves_used"]))
+        for metric, value in game_stats_rows(game_state, current=True):
+            stats_table.add_row(metric, escape(value))
         
-        console.print(stats_table)
-        console.print()
+        self.console.print(stats_table)
+        self.console.print()
 
-    def show_global_stats_display(self, stats):
-        """Display global statistics"""
-        console.print("[bold cyan]Global Statistics[/bold cyan]")
-        console.print()
+    def show_global_stats_display(self, stats, trends=None):
+        """Display global statistics and, if given, recent trends"""
+        self.console.print("[bold cyan]Global Statistics[/bold cyan]")
+        self.console.print()
         
         # General stats
         general_table = Table(title="General Statistics")
         general_table.add_column("Metric", style="cyan")
         general_table.add_column("Value", style="green")
         
-        general_table.add_row("Total Games Played", str(stats.get("total_games", 0)))
-        general_table.add_row("Total Play Time", str(timedelta(seconds=stats.get("total_play_time_seconds", 0))))
-        general_table.add_row("Average Game Time", str(timedelta(seconds=stats.get("average_game_time_seconds", 0))))
-        general_table.add_row("Total Deaths", str(stats.get("total_deaths", 0)))
-        general_table.add_row("Total Items Collected", str(stats.get("total_items_collected", 0)))
+        for metric, value in global_stats_rows(stats):
+            general_table.add_row(metric, value)
         
-        console.print(general_table)
-        console.print()
+        self.console.print(general_table)
+        self.console.print()
         
         # Stories completed
         if "stories_completed" in stats:
@@ -127,20 +184,69 @@ class UIManager:
             for story, count in stats["stories_completed"].items():
                 stories_table.add_row(story.title(), str(count))
             
-            console.print(stories_table)
-            console.print()
+            self.console.print(stories_table)
+            self.console.print()
+        
+        # Distributions, which averages hide
+        rows = quantile_rows(stats)
+        if rows:
+            quantiles_table = Table(title="Distributions")
+            quantiles_table.add_column("Metric", style="cyan")
+            for column in ("Median", "p95", "p99"):
+                quantiles_table.add_column(column, style="green")
+            
+            for row in rows:
+                quantiles_table.add_row(*row)
+            
+            self.console.print(quantiles_table)
+            self.console.print()
+        
+        # Recent trends
+        if trends:
+            trends_table = Table(title="Recent Trends")
+            trends_table.add_column("Period", style="cyan")
+            for column in ("Games", "Average Game Time", "Deaths", "Items"):
+                trends_table.add_column(column, style="green")
+            
+            for row in trend_rows(trends):
+                trends_table.add_row(*row)
+            
+            self.console.print(trends_table)
+            self.console.print(f"Games per hour (last 24h): [green]{sparkline(trends['games_per_hour'])}[/green]")
+            self.console.print()
+
+    def show_leaderboards(self, leaderboards, stories):
+        """Display the fastest completion and fewest turns for each story"""
+        board_table = Table(title="Leaderboards")
+        board_table.add_column("Story", style="cyan")
+        board_table.add_column("Fastest", style="green")
+        board_table.add_column("Fewest Turns", style="green")
+
+        rows = leaderboard_rows(leaderboards, stories)
+        for row in rows:
+            board_table.add_row(*(escape(cell) for cell in row))
+
+        if rows:
+            self.console.print(board_table)
+            self.console.print()
 
     def show_save_list(self, valid_saves):
         """Display list of available saves"""
-        console.print("[bold cyan]Available Saves:[/bold cyan]")
-        console.print()
+        self.console.print("[bold cyan]Available Saves:[/bold cyan]")
+        self.console.print()
         
         for i, filename, save_data in valid_saves:
             # Display save info
-            save_time = datetime.fromisoformat(save_data.get("save_timestamp", save_data.get("start_time", datetime.now().isoformat())))
-            console.print(f"[{i}] {filename[:-5]}")
-            console.print(f"    Player: {save_data.get('player_name', 'Unknown')}")
-            console.print(f"    Story: {save_data.get('story_type', 'Unknown').title()}")
-            console.print(f"    Saved: {save_time.strftime('%Y-%m-%d %H:%M')}")
-            console.print(f"    Progress: {len(save_data.get('visited_scenes', []))} scenes visited")
-            console.print()
\ No newline at end of file
+            summary = save_summary(save_data)
+            self.console.print(f"[{i}] {escape(filename[:-5])}")
+            self.console.print(f"    Player: {escape(summary['player_name'])}")
+            self.console.print(f"    Story: {summary['story']}")
+            self.console.print(f"    Saved: {summary['saved']}")
+            self.console.print(f"    Progress: {summary['scenes_visited']} scenes visited")
+            self.console.print()
+
+    def show_save_menu_options(self, page, total_pages, sort, player=None, story=None):
+        """Display paging, sorting and filtering options of the load menu"""
+        self.console.print(f"[dim]{escape(save_menu_status(page, total_pages, sort, player, story))}[/dim]")
+        self.console.print(f"[dim]{SAVE_MENU_HELP}[/dim]")
+        self.console.print()
\ No newline at end of file
@@ -0,0 +1,191 @@
+"""
+Plain UI Module - Text-only user interface without rich
+"""
+
+import sys
+
+from Code.ui_backends import (
+    COMMANDS_HELP, SAVE_MENU_HELP, game_stats_rows, global_stats_rows,
+    leaderboard_rows, quantile_rows, save_summary, save_menu_status, sparkline, trend_rows
+)
+
+PREFIXES = {"error": "! ", "warning": "! "}
+
+
+class PlainUIManager:
+    # Text is written as is, so filled-in values need no escaping
+    escape_markup = None
+
+    def __init__(self, output=None, input_stream=None):
+        self.output = output or sys.stdout
+        self.input = input_stream or sys.stdin
+
+    def _print(self, text=""):
+        self.output.write(f"{text}\n")
+
+    def _read(self, prompt):
+        """Write a prompt and read one line, raising EOFError at end of input"""
+        self.output.write(prompt)
+        self.output.flush()
+        line = self.input.readline()
+        if not line:
+            raise EOFError
+        return line.rstrip("\r\n")
+
+    def _rows(self, title, rows):
+        """Print (metric, value) rows as aligned columns"""
+        self._print(title)
+        width = max((len(metric) for metric, _ in rows), default=0)
+        for metric, value in rows:
+            self._print(f"  {metric.ljust(width)}  {value}")
+        self._print()
+
+    def clear(self):
+        """Plain output is a stream, so the screen is never cleared"""
+        self._print()
+
+    def message(self, text, style=None):
+        """Display a line of text"""
+        self._print(f"{PREFIXES.get(style, '')}{text}")
+
+    def ask(self, prompt, choices=None, default=None):
+        """Ask for a line of input, repeating until it is one of choices"""
+        hint = f" [{'/'.join(choices)}]" if choices else ""
+        hint += f" ({default})" if default is not None else ""
+        while True:
+            answer = self._read(f"{prompt}{hint}: ").strip()
+            if not answer and default is not None:
+                return default
+            if not choices or answer in choices:
+                return answer
+            self._print("Please select one of the available options")
+
+    def ask_int(self, prompt, default=None):
+        """Ask for a whole number"""
+        while True:
+            answer = self.ask(prompt, default=None if default is None else str(default))
+            try:
+                return int(answer)
+            except ValueError:
+                self._print("Please enter a valid integer number")
+
+    def confirm(self, prompt):
+        """Ask a yes/no question"""
+        return self.ask(prompt, choices=["y", "n"]) == "y"
+
+    def pause(self, text="Press Enter to continue..."):
+        """Wait until the player presses Enter"""
+        self._read(f"{text}\n")
+
+    def show_title(self):
+        """Display the game title"""
+        self._print("Interactive Story Generator")
+        self._print("CS50P Final Project")
+        self._print()
+
+    def show_menu(self, title, options):
+        """Display a menu of (key, label) options"""
+        self._print()
+        self._print(title)
+        for key, label in options:
+            self._print(f"[{key}] {label}")
+        self._print()
+
+    def show_story_list(self, stories):
+        """Display the stories a player can choose from"""
+        self._print("Choose Your Adventure:")
+        self._print()
+        for i, (story_id, story_info) in enumerate(stories.items(), 1):
+            self._print(f"[{i}] {story_info['title']}")
+            self._print(f"    {story_info['description']}")
+            self._print(f"    Difficulty: {story_info['difficulty']}")
+            self._print()
+        self._print(f"[{len(stories) + 1}] Back to Main Menu")
+        self._print()
+
+    def show_scene(self, scene, game_state, locked=None):
+        """Display a story scene"""
+        locked = locked or {}
+        if "title" in scene:
+            self._print(f"== {scene['title']} ==")
+            self._print()
+
+        self._print(scene["description"])
+        self._print()
+
+        if "choices" in scene:
+            self._print("What do you want to do?")
+            for i, choice in enumerate(scene["choices"], 1):
+                if i - 1 in locked:
+                    self._print(f"{i}. {choice['text']} (requires {locked[i - 1]})")
+                else:
+                    self._print(f"{i}. {choice['text']}")
+            self._print()
+            self._print(COMMANDS_HELP)
+
+    def show_ending(self, scene, game_state):
+        """Display ending scene with final statistics"""
+        self._print(scene.get("ending_title", "THE END"))
+        self._print()
+        if "description" in scene:
+            self._print(scene["description"])
+            self._print()
+        self._rows("Final Statistics", game_stats_rows(game_state))
+
+    def show_inventory(self, game_state):
+        """Display player inventory"""
+        self._print("Inventory:")
+        if game_state["inventory"]:
+            for item in game_state["inventory"]:
+                self._print(f"- {item}")
+        else:
+            self._print("Empty")
+        self._print()
+
+    def show_current_stats(self, game_state):
+        """Display current game statistics"""
+        self._rows("Current Game Statistics", game_stats_rows(game_state, current=True))
+
+    def show_global_stats_display(self, stats, trends=None):
+        """Display global statistics and, if given, recent trends"""
+        self._print("Global Statistics")
+        self._print()
+        self._rows("General Statistics", global_stats_rows(stats))
+        if "stories_completed" in stats:
+            self._rows("Stories Completed", [(story.title(), str(count))
+                                             for story, count in stats["stories_completed"].items()])
+        rows = quantile_rows(stats)
+        if rows:
+            self._rows("Distributions", [(metric, f"median {p50}, p95 {p95}, p99 {p99}")
+                                         for metric, p50, p95, p99 in rows])
+        if trends:
+            self._rows("Recent Trends", [(period, f"{games} games, average {average}, {deaths} deaths, {items} items")
+                                         for period, games, average, deaths, items in trend_rows(trends)])
+            self._print(f"Games per hour (last 24h): {sparkline(trends['games_per_hour'])}")
+            self._print()
+
+    def show_leaderboards(self, leaderboards, stories):
+        """Display the fastest completion and fewest turns for each story"""
+        rows = leaderboard_rows(leaderboards, stories)
+        if rows:
+            self._rows("Leaderboards", [(title, f"fastest {fastest}, fewest turns {fewest}")
+                                        for title, fastest, fewest in rows])
+
+    def show_save_list(self, valid_saves):
+        """Display list of available saves"""
+        self._print("Available Saves:")
+        self._print()
+        for i, filename, save_data in valid_saves:
+            summary = save_summary(save_data)
+            self._print(f"[{i}] {filename[:-5]}")
+            self._print(f"    Player: {summary['player_name']}")
+            self._print(f"    Story: {summary['story']}")
+            self._print(f"    Saved: {summary['saved']}")
+            self._print(f"    Progress: {summary['scenes_visited']} scenes visited")
+            self._print()
+
+    def show_save_menu_options(self, page, total_pages, sort, player=None, story=None):
+        """Display paging, sorting and filtering options of the load menu"""
+        self._print(save_menu_status(page, total_pages, sort, player, story))
+        self._print(SAVE_MENU_HELP)
+        self._print()